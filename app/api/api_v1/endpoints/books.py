@@ -1,32 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.core.config import settings
+from app.core.http_cache import cache_control, etag_matches, make_etag, not_modified
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, decode_cursor, encode_cursor
 from app.db.session import get_db
-from app.schemas.book import Book, BookCreate, BookUpdate
+from app.schemas.book import Book, BookCreate, BookImportResult, BookPage, BookUpdate
+from app.services.book_import_service import CSV_FORMAT, NDJSON_FORMAT, BookImportService, detect_format
 from app.services.book_service import BookService
+from app.services.catalog_cache import catalog_cache
 
 router = APIRouter()
 
 @router.post("/", response_model=Book)
-async def create_book(book: BookCreate, db: Session = Depends(get_db)):
+async def create_book(book: BookCreate, db: AsyncSession = Depends(get_db)):
     book_service = BookService(db)
     return await book_service.create_book(book)
 
-@router.get("/", response_model=List[Book])
-async def get_books(db: Session = Depends(get_db)):
+@router.post("/bulk", response_model=BookImportResult)
+async def import_books(
+    request: Request,
+    format: Optional[str] = Query(None, pattern=f"^({CSV_FORMAT}|{NDJSON_FORMAT})$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Importa libros en bloque desde el cuerpo de la petición (CSV con cabecera o NDJSON),
+    leído en streaming. Los ISBN existentes se actualizan.
+    """
+    data_format = format or detect_format(request.headers.get("content-type"))
+    import_service = BookImportService(db)
+    return await import_service.import_stream(request.stream(), data_format)
+
+@router.get("/", response_model=BookPage)
+async def get_books(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        after_id = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     book_service = BookService(db)
-    return await book_service.get_all_books()
+    count, last_modified = await book_service.get_catalog_version()
+    etag = make_etag("books", count, last_modified, limit, after_id)
+    cache_control_value = cache_control(settings.HTTP_CACHE_MAX_AGE_SECONDS)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, cache_control_value)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control_value
+
+    books, last_id = await book_service.get_books_page_snapshot(limit, after_id)
+    return {
+        "items": books,
+        "next_cursor": encode_cursor(last_id) if last_id is not None else None
+    }
+
+@router.get("/cache/stats")
+async def get_catalog_cache_stats():
+    return catalog_cache.stats()
 
 @router.get("/{book_id}", response_model=Book)
-async def get_book(book_id: int, db: Session = Depends(get_db)):
+async def get_book(
+    book_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
     book_service = BookService(db)
-    book = await book_service.get_book(book_id)
+    book = await book_service.get_book_snapshot(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Libro no encontrado")
+
+    etag = make_etag("book", book.id, book.updated_at)
+    cache_control_value = cache_control(settings.HTTP_CACHE_MAX_AGE_SECONDS)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, cache_control_value)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control_value
     return book
 
 @router.put("/{book_id}", response_model=Book)
-async def update_book(book_id: int, book: BookUpdate, db: Session = Depends(get_db)):
+async def update_book(book_id: int, book: BookUpdate, db: AsyncSession = Depends(get_db)):
     book_service = BookService(db)
     updated_book = await book_service.update_book(book_id, book)
     if not updated_book:
@@ -34,7 +92,7 @@ async def update_book(book_id: int, book: BookUpdate, db: Session = Depends(get_
     return updated_book
 
 @router.delete("/{book_id}")
-async def delete_book(book_id: int, db: Session = Depends(get_db)):
+async def delete_book(book_id: int, db: AsyncSession = Depends(get_db)):
     book_service = BookService(db)
     success = await book_service.delete_book(book_id)
     if not success:
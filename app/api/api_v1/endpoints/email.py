@@ -1,57 +1,109 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from openai import AsyncOpenAI
+from app.api.deps import get_graph_api, get_openai_client
 from app.db.session import get_db
-from app.services.email_processor import EmailProcessor
+from app.services.email_processor import EmailProcessor, llm_breaker
+from app.services.email_queue_service import EmailQueueService
+from app.core.config import settings
 from app.services.graph_api import GraphAPIService
+from app.services.intent_cache import intent_cache
+from app.services.intent_classifier import local_classifier
+from app.core.scheduler import JobAlreadyRunning, JobNotRegistered, scheduler
+from app.services.leader_election import leader_elector
+from app.tasks.email_checker import MAILBOX_POLL_JOB
+from app.tasks.reservation_sweeper import RESERVATION_SWEEP_JOB
+from app.tasks.graph_notifications import extract_message_ids, process_notified_emails, webhook_client_state
+from app.core.metrics import GRAPH_NOTIFICATIONS
 from app.schemas.email import EmailProcessRequest, EmailResponse
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-graph_api = GraphAPIService()
 
 @router.post("/process", response_model=EmailResponse)
 async def process_email(
     request: EmailProcessRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    graph_api: GraphAPIService = Depends(get_graph_api),
+    openai_client: AsyncOpenAI = Depends(get_openai_client)
 ) -> Dict[str, Any]:
-    processor = EmailProcessor(db)
+    processor = EmailProcessor(db, graph_api=graph_api, openai_client=openai_client)
     result = await processor.process_email(request.email_content, request.user_email)
     return result
 
+async def trigger_background_job(name: str, running_detail: str) -> Any:
+    """
+    Lanza a mano un trabajo del planificador. Solo el líder ejecuta los trabajos de
+    fondo, así que en los demás procesos se responde 503 para que el cliente reintente
+    contra otra réplica en lugar de solaparse con el líder.
+    """
+    if not leader_elector.is_leader:
+        raise HTTPException(status_code=503, detail="Este proceso no es el líder de las tareas de fondo")
+    try:
+        return await scheduler.trigger(name)
+    except JobAlreadyRunning:
+        raise HTTPException(status_code=409, detail=running_detail)
+    except JobNotRegistered:
+        raise HTTPException(status_code=503, detail=f"El trabajo {name} no está registrado")
+
 @router.post("/check", response_model=EmailResponse)
-async def check_new_emails(
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
-    processor = EmailProcessor(db)
-    result = await processor.process_unread_emails()
+async def check_new_emails() -> Dict[str, Any]:
+    # Misma ejecución que el sondeo programado: nunca se solapa con él
+    result = await trigger_background_job(MAILBOX_POLL_JOB, "La verificación del buzón ya está en curso")
+    if settings.EMAIL_QUEUE_ENABLED:
+        return {
+            "message": f"Encolados {result.get('enqueued_count', 0)} correos",
+            "result": result
+        }
     return {
-        "message": f"Procesados {result['processed_count']} correos",
+        "message": f"Procesados {result.get('processed_count', 0)} correos",
         "result": result
     }
 
+@router.post("/notifications")
+async def receive_graph_notifications(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    validation_token: Optional[str] = Query(None, alias="validationToken"),
+    graph_api: GraphAPIService = Depends(get_graph_api),
+    openai_client: AsyncOpenAI = Depends(get_openai_client)
+):
+    """
+    Webhook de notificaciones de cambios de Graph. Al crear la suscripción Graph envía
+    validationToken y espera recibirlo de vuelta en texto plano; después envía las
+    notificaciones, que deben confirmarse con 202 en menos de 3 segundos, por lo que
+    los mensajes se procesan en segundo plano.
+    """
+    if validation_token is not None:
+        return PlainTextResponse(validation_token)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cuerpo de notificación inválido")
+
+    message_ids, rejected = extract_message_ids(payload if isinstance(payload, dict) else {}, webhook_client_state())
+    GRAPH_NOTIFICATIONS.inc(len(message_ids), result="accepted")
+    if rejected:
+        GRAPH_NOTIFICATIONS.inc(rejected, result="rejected")
+        logger.warning(f"Rechazadas {rejected} notificaciones de Graph con clientState inválido")
+    if message_ids:
+        background_tasks.add_task(process_notified_emails, message_ids, graph_api, openai_client)
+    return Response(status_code=202)
+
 @router.post("/check-expired")
-async def check_expired_reservations(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    from app.services.reservation_service import ReservationService
-    
-    reservation_service = ReservationService(db)
-    expired_reservations = await reservation_service.check_expired_reservations()
-    
-    graph_api = GraphAPIService()
-    for reservation in expired_reservations:
-        background_tasks.add_task(
-            graph_api.send_email,
-            to=reservation.user_email,
-            subject="Tu reserva ha expirado",
-            body=f"Tu reserva del libro '{reservation.book.title}' ha expirado. Por favor, devuelve el libro lo antes posible."
-        )
-    
-    return {"message": f"Verificadas {len(expired_reservations)} reservas expiradas"}
+async def check_expired_reservations():
+    result = await trigger_background_job(RESERVATION_SWEEP_JOB, "El barrido de reservas expiradas ya está en curso")
+    return {"message": f"Verificadas {result['expired_count']} reservas expiradas", **result}
 
 @router.get("/test-connection")
-async def test_email_connection():
+async def test_email_connection(graph_api: GraphAPIService = Depends(get_graph_api)):
     try:
-        graph_api = GraphAPIService()
         emails = await graph_api.get_unread_emails()
         return {
             "status": "success",
@@ -63,4 +115,26 @@ async def test_email_connection():
         return {
             "status": "error",
             "message": f"Error al conectar con Microsoft Graph API: {str(e)}"
-        } 
\ No newline at end of file
+        }
+
+@router.get("/intent-cache/stats")
+async def get_intent_cache_stats() -> Dict[str, Any]:
+    return intent_cache.stats()
+
+@router.get("/classifier/stats")
+async def get_classifier_stats() -> Dict[str, Any]:
+    return local_classifier.stats()
+
+@router.get("/llm/stats")
+async def get_llm_stats() -> Dict[str, Any]:
+    return llm_breaker.stats()
+
+@router.get("/queue/stats")
+async def get_email_queue_stats(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return {"enabled": settings.EMAIL_QUEUE_ENABLED, **await EmailQueueService(db).stats()}
+
+@router.post("/queue/jobs/{job_id}/retry")
+async def retry_dead_email_job(job_id: int, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    if not await EmailQueueService(db).requeue_dead(job_id):
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado en la cola de fallidos")
+    return {"message": f"Trabajo {job_id} devuelto a la cola"}
@@ -1,29 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from datetime import datetime, timedelta
+from app.core.config import settings
+from app.core.http_cache import cache_control, etag_matches, make_etag, not_modified
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, decode_cursor, encode_cursor
 from app.db.session import get_db
-from app.schemas.reservation import Reservation, ReservationCreate, ReservationUpdate
+from app.schemas.reservation import Reservation, ReservationCreate, ReservationPage, ReservationUpdate
 from app.services.reservation_service import ReservationService
 
 router = APIRouter()
 
 @router.post("/", response_model=Reservation)
-async def create_reservation(reservation: ReservationCreate, db: Session = Depends(get_db)):
+async def create_reservation(reservation: ReservationCreate, db: AsyncSession = Depends(get_db)):
     reservation_service = ReservationService(db)
-    return await reservation_service.create_reservation(
+    db_reservation = await reservation_service.create_reservation(
         book_id=reservation.book_id,
         user_email=reservation.user_email,
         end_date=reservation.end_date
     )
+    if not db_reservation:
+        raise HTTPException(status_code=409, detail="El libro no existe o no está disponible")
+    return db_reservation
+
+@router.get("/user/{user_email}", response_model=ReservationPage)
+async def get_user_reservations(
+    user_email: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        after_id = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/user/{user_email}", response_model=List[Reservation])
-async def get_user_reservations(user_email: str, db: Session = Depends(get_db)):
     reservation_service = ReservationService(db)
-    return await reservation_service.get_user_reservations(user_email)
+    count, last_modified = await reservation_service.get_user_reservations_version(user_email)
+    etag = make_etag("reservations", user_email, count, last_modified, limit, after_id)
+    cache_control_value = cache_control(settings.HTTP_CACHE_MAX_AGE_SECONDS, private=True)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, cache_control_value)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control_value
+
+    reservations, last_id = await reservation_service.get_user_reservations_page(user_email, limit, after_id)
+    return {
+        "items": reservations,
+        "next_cursor": encode_cursor(last_id) if last_id is not None else None
+    }
 
 @router.get("/{reservation_id}", response_model=Reservation)
-async def get_reservation(reservation_id: int, db: Session = Depends(get_db)):
+async def get_reservation(reservation_id: int, db: AsyncSession = Depends(get_db)):
     reservation_service = ReservationService(db)
     reservation = await reservation_service.get_reservation(reservation_id)
     if not reservation:
@@ -31,7 +61,7 @@ async def get_reservation(reservation_id: int, db: Session = Depends(get_db)):
     return reservation
 
 @router.put("/{reservation_id}/renew", response_model=Reservation)
-async def renew_reservation(reservation_id: int, db: Session = Depends(get_db)):
+async def renew_reservation(reservation_id: int, db: AsyncSession = Depends(get_db)):
     reservation_service = ReservationService(db)
     new_end_date = datetime.utcnow() + timedelta(days=14)
     updated_reservation = await reservation_service.renew_reservation(reservation_id, new_end_date)
@@ -40,7 +70,7 @@ async def renew_reservation(reservation_id: int, db: Session = Depends(get_db)):
     return updated_reservation
 
 @router.delete("/{reservation_id}")
-async def delete_reservation(reservation_id: int, db: Session = Depends(get_db)):
+async def delete_reservation(reservation_id: int, db: AsyncSession = Depends(get_db)):
 
     reservation_service = ReservationService(db)
     reservation = await reservation_service.get_reservation(reservation_id)
@@ -0,0 +1,9 @@
+from fastapi import Request
+from openai import AsyncOpenAI
+from app.services.graph_api import GraphAPIService
+
+def get_graph_api(request: Request) -> GraphAPIService:
+    return request.app.state.graph_api
+
+def get_openai_client(request: Request) -> AsyncOpenAI:
+    return request.app.state.openai_client
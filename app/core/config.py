@@ -21,7 +21,98 @@ class Settings(BaseSettings):
     EMAIL_ADDRESS: str
     
     OPENAI_API_KEY: str
+    OPENAI_MODEL: str = "gpt-4.1-mini"
+    OPENAI_TIMEOUT_SECONDS: float = 15.0
+    OPENAI_DEADLINE_SECONDS: float = 40.0
+    OPENAI_MAX_ATTEMPTS: int = 3
+    OPENAI_BREAKER_FAILURE_THRESHOLD: int = 5
+    OPENAI_BREAKER_RESET_SECONDS: float = 60.0
+
+    EMAIL_PROCESSING_CONCURRENCY: int = 4
+    # Correos por petición al LLM cuando hay acumulación
+    LLM_BATCH_SIZE: int = 8
+    # Respuestas acumuladas antes de enviarlas en un $batch (envío y marcado: 2 sub-peticiones cada una)
+    EMAIL_REPLY_BATCH_SIZE: int = 10
+    # Respuestas cuya entrega falló: se reintenta solo el envío o el marcado como leído,
+    # con espera exponencial desde EMAIL_REPLY_RETRY_BASE_SECONDS
+    EMAIL_REPLY_MAX_ATTEMPTS: int = 8
+    EMAIL_REPLY_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_REPLY_RETRY_INTERVAL_SECONDS: float = 60.0
+    # "delta": sincronización incremental con messages/delta; "window": ventana de 24 horas
+    EMAIL_SYNC_MODE: str = "delta"
+    # Intervalo inicial del sondeo del buzón; se acorta con volumen y se alarga en los
+    # ciclos vacíos entre EMAIL_POLL_MIN_INTERVAL_SECONDS y EMAIL_POLL_MAX_INTERVAL_SECONDS
+    EMAIL_POLL_INTERVAL_SECONDS: float = 30.0
+    EMAIL_POLL_MIN_INTERVAL_SECONDS: float = 10.0
+    EMAIL_POLL_MAX_INTERVAL_SECONDS: float = 120.0
+    # URL pública de /api/v1/email/notifications. Si se define, Graph notifica los correos
+    # nuevos y el sondeo queda como red de seguridad cada EMAIL_SAFETY_POLL_INTERVAL_SECONDS
+    GRAPH_WEBHOOK_URL: Optional[str] = None
+    # Secreto compartido con Graph en cada notificación; por defecto se deriva de SECRET_KEY
+    GRAPH_WEBHOOK_CLIENT_STATE: Optional[str] = None
+    # Los mensajes de Outlook admiten suscripciones de hasta 4230 minutos
+    GRAPH_SUBSCRIPTION_MINUTES: int = 4200
+    GRAPH_SUBSCRIPTION_RENEW_MARGIN_MINUTES: int = 120
+    GRAPH_SUBSCRIPTION_CHECK_SECONDS: float = 1800.0
+    EMAIL_SAFETY_POLL_INTERVAL_SECONDS: float = 600.0
+    # Caracteres de texto que se extraen como máximo de cada cuerpo de correo
+    EMAIL_TEXT_MAX_CHARS: int = 20000
+    # Los cuerpos HTML más largos que esto se analizan en un hilo aparte
+    EMAIL_HTML_OFFLOAD_CHARS: int = 65536
+    # Quita historial citado, firmas y avisos legales antes del análisis
+    EMAIL_CONDENSE_ENABLED: bool = True
+    # Tokens máximos del texto de un correo enviado al LLM
+    EMAIL_PROMPT_MAX_TOKENS: int = 1000
+
+    INTENT_CACHE_MAX_ENTRIES: int = 1000
+    INTENT_CACHE_TTL_SECONDS: int = 60 * 60 * 24
+    INTENT_CACHE_DB_ENABLED: bool = False
+
+    LOCAL_CLASSIFIER_ENABLED: bool = True
+    LOCAL_CLASSIFIER_THRESHOLD: float = 0.9
+
+    # Puntuación mínima (coeficiente de Dice sobre trigramas) para aceptar un título aproximado
+    TITLE_MATCH_MIN_SCORE: float = 0.6
+
+    # Cola de correos en la tabla email_jobs: el verificador solo encola y los workers procesan
+    EMAIL_QUEUE_ENABLED: bool = False
+    # Workers dentro del proceso de la API; con 0 se procesan solo con python -m app.tasks.email_worker
+    EMAIL_QUEUE_WORKERS: int = 2
+    EMAIL_QUEUE_CLAIM_BATCH: int = 8
+    # Tiempo que un trabajo reclamado queda oculto; si el worker muere, vuelve a la cola al vencer
+    EMAIL_QUEUE_VISIBILITY_SECONDS: float = 300.0
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = 5
+    EMAIL_QUEUE_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_QUEUE_IDLE_SECONDS: float = 2.0
+
+    # Un solo proceso sondea el buzón y ejecuta los barridos. "auto": bloqueo consultivo
+    # de Postgres si la base de datos es Postgres; "local" para que todo proceso sea líder
+    LEADER_ELECTION: str = "auto"
+    LEADER_LOCK_KEY: int = 4242001
+    LEADER_HEARTBEAT_SECONDS: float = 10.0
+    LEADER_RETRY_SECONDS: float = 15.0
+
+    RESERVATION_SWEEP_BATCH_SIZE: int = 1000
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 300.0
+    # Variación aleatoria (fracción del intervalo) de los trabajos periódicos
+    SCHEDULER_JITTER: float = 0.1
+
+    # max-age de Cache-Control en los GET con ETag; pasado ese tiempo el cliente revalida con If-None-Match
+    HTTP_CACHE_MAX_AGE_SECONDS: int = 5
+
+    BOOK_IMPORT_BATCH_SIZE: int = 1000
+    BOOK_IMPORT_MAX_ERRORS: int = 1000
+
+    CATALOG_CACHE_MAX_ENTRIES: int = 1024
+    CATALOG_CACHE_TTL_SECONDS: float = 60.0
+    # "auto": LISTEN/NOTIFY si la base de datos es Postgres; "local" o "postgres" para forzarlo
+    CATALOG_CACHE_BUS: str = "auto"
     
+    LOG_LEVEL: str = "INFO"
+    # Longitud máxima de los payloads (correos, prompts, respuestas) en los logs
+    LOG_PAYLOAD_MAX_CHARS: int = 500
+    LOG_REDACT_PII: bool = True
+
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
     
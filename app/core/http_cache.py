@@ -0,0 +1,21 @@
+import hashlib
+from typing import Any, Optional
+from fastapi import Response
+
+def make_etag(*parts: Any) -> str:
+    """ETag fuerte a partir de la versión de los datos y los parámetros de la consulta."""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate == "*" or candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def cache_control(max_age: int, private: bool = False) -> str:
+    return f"{'private' if private else 'public'}, max-age={max_age}, must-revalidate"
+
+def not_modified(etag: str, cache_control_value: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control_value})
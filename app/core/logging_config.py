@@ -0,0 +1,91 @@
+"""
+Configuración central del logging. Los registros se encolan desde el bucle de eventos
+y un hilo (QueueListener) los formatea y escribe, de modo que la E/S de los handlers
+nunca bloquea las peticiones ni el procesamiento de correos.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+from app.core.config import settings
+import atexit
+import copy
+import logging
+import queue
+import re
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Librerías que registran cada petición HTTP o consulta por debajo de WARNING
+NOISY_LOGGERS = ("azure", "httpx", "msal", "urllib3", "aiosqlite")
+
+EMAIL_PATTERN = re.compile(r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+
+_listener: Optional[QueueListener] = None
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea el mensaje al encolarlo: la cola es en proceso, así
+    que el registro se pasa tal cual y el formateo (incluidos los payloads) ocurre
+    en el hilo del listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+def mask_email(address: Optional[str]) -> str:
+    """u***@example.com: conserva el dominio para diagnosticar sin exponer la dirección."""
+    if not address:
+        return ""
+    return EMAIL_PATTERN.sub(r"\1***@\2", address)
+
+def redact(text: str) -> str:
+    return EMAIL_PATTERN.sub(r"\1***@\2", text) if settings.LOG_REDACT_PII else text
+
+class Payload:
+    """
+    Contenido potencialmente grande o con datos personales (cuerpos de correo,
+    prompts, respuestas del LLM o de Graph). Solo se convierte a texto, se redacta y
+    se recorta si el registro llega a emitirse.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: Optional[int] = None):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        text = redact(self.value if isinstance(self.value, str) else repr(self.value))
+        limit = self.max_chars or settings.LOG_PAYLOAD_MAX_CHARS
+        if len(text) > limit:
+            return f"{text[:limit]}… (+{len(text) - limit} caracteres)"
+        return text
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """Instala el QueueHandler en el logger raíz; es idempotente."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel((level or settings.LOG_LEVEL).upper())
+
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """Vacía la cola y detiene el hilo del listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
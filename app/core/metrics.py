@@ -0,0 +1,273 @@
+"""
+Registro de métricas en memoria con exposición en formato de texto de Prometheus.
+Las operaciones de registro son actualizaciones de diccionarios sin bloqueos: todas
+se hacen desde el bucle de eventos.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import math
+import time
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+def _collect(values: Dict[LabelValues, float], function) -> Dict[LabelValues, float]:
+    if function is None:
+        return values
+    values = dict(values)
+    try:
+        values.update(function())
+    except Exception:
+        pass
+    return values
+
+class Counter(Metric):
+    """
+    Contador. Con function, los valores se leen al exponer de un contador que ya
+    lleva otro componente (p. ej. los aciertos de una caché), sin coste en el camino caliente.
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        function: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.function = function
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(_collect(self._values, self.function).items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Gauge(Counter):
+    """Gauge con valores fijados o calculados al exponer mediante function."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiqueta: [conteos por cubeta (no acumulados) + desbordamiento, suma, total]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"'), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), function=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+EMAIL_STAGE_SECONDS = registry.histogram(
+    "email_pipeline_stage_seconds",
+    "Duración de cada etapa del procesamiento de correos",
+    ("stage",)
+)
+EMAILS_PROCESSED = registry.counter(
+    "emails_processed_total",
+    "Correos procesados por acción y resultado",
+    ("action", "status")
+)
+LLM_REQUESTS = registry.counter(
+    "llm_requests_total",
+    "Peticiones a OpenAI por resultado",
+    ("outcome",)
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total",
+    "Tokens consumidos en OpenAI",
+    ("kind",)
+)
+GRAPH_RESPONSES = registry.counter(
+    "graph_responses_total",
+    "Respuestas de Microsoft Graph por operación y código de estado",
+    ("operation", "status")
+)
+EMAIL_TOKENS_SAVED = registry.histogram(
+    "email_condensed_tokens_saved",
+    "Tokens eliminados de cada correo al quitar citas, firmas y avisos legales",
+    buckets=(0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+)
+EMAIL_JOBS = registry.counter(
+    "email_jobs_total",
+    "Transiciones de los trabajos de la cola de correos",
+    ("event",)
+)
+EMAIL_REPLIES = registry.counter(
+    "email_replies_total",
+    "Transiciones de las respuestas pendientes de entrega (email_replies)",
+    ("event",)
+)
+GRAPH_NOTIFICATIONS = registry.counter(
+    "graph_notifications_total",
+    "Notificaciones de cambios recibidas de Graph por resultado de la verificación de clientState",
+    ("result",)
+)
+SCHEDULER_JOB_SECONDS = registry.histogram(
+    "scheduler_job_duration_seconds",
+    "Duración de cada ejecución de los trabajos periódicos por resultado",
+    ("job", "outcome")
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Duración de las peticiones HTTP por ruta",
+    ("method", "route", "status")
+)
+DB_POOL_CHECKOUTS = registry.counter(
+    "db_pool_checkouts_total",
+    "Conexiones obtenidas del pool de la base de datos"
+)
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide cada petición HTTP. Usa la plantilla de la ruta
+    (p. ej. /api/v1/books/{book_id}) para no multiplicar las series por id.
+    """
+
+    def __init__(self, app, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"])
+            )
@@ -0,0 +1,215 @@
+"""
+Planificador de tareas de fondo en proceso. Cada trabajo corre en su propia tarea
+con un intervalo fijo o calculado en cada ciclo, desfasado con jitter para que las
+réplicas no coincidan. Un trabajo nunca se solapa consigo mismo, aunque se lance
+también a mano con trigger.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from app.core.metrics import SCHEDULER_JOB_SECONDS, registry
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+Interval = Union[float, Callable[[], float]]
+
+class JobAlreadyRunning(Exception):
+    """La ejecución anterior del trabajo sigue en curso."""
+    pass
+
+class JobNotRegistered(Exception):
+    """No hay ningún trabajo registrado con ese nombre en este proceso."""
+    pass
+
+class AdaptiveInterval:
+    """
+    Intervalo que se ajusta al volumen observado: se reduce por factor cuando el
+    trabajo encuentra elementos y crece por factor en los ciclos vacíos, dentro de
+    [minimum, maximum]. Con un lote grande (burst_size) pasa directamente al mínimo.
+    """
+
+    def __init__(self, minimum: float, maximum: float, initial: Optional[float] = None, factor: float = 1.5, burst_size: int = 10):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.burst_size = burst_size
+        self.current = min(maximum, max(minimum, initial if initial is not None else minimum))
+
+    def observe(self, count: Optional[int]) -> None:
+        if count is None:
+            return
+        if count >= self.burst_size:
+            self.current = self.minimum
+        elif count > 0:
+            self.current = max(self.minimum, self.current / self.factor)
+        else:
+            self.current = min(self.maximum, self.current * self.factor)
+
+    def __call__(self) -> float:
+        return self.current
+
+class ScheduledJob:
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        interval: Interval,
+        jitter: float = 0.1,
+        run_at_start: bool = True,
+        on_result: Optional[Callable[[Any], None]] = None
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.run_at_start = run_at_start
+        self.on_result = on_result
+        self.lock = asyncio.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.next_run_at: Optional[float] = None
+
+    def next_delay(self) -> float:
+        interval = self.interval() if callable(self.interval) else self.interval
+        return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def status(self) -> Dict[str, Any]:
+        interval = self.interval() if callable(self.interval) else self.interval
+        return {
+            "name": self.name,
+            "running": self.lock.locked(),
+            "interval_seconds": round(interval, 3),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overlaps": self.skipped,
+            "last_started_at": self.last_started_at,
+            "last_duration_seconds": round(self.last_duration, 4) if self.last_duration is not None else None,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at
+        }
+
+class Scheduler:
+
+    def __init__(self):
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._tasks: List["asyncio.Task"] = []
+
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        interval: Interval,
+        jitter: float = 0.1,
+        run_at_start: bool = True,
+        on_result: Optional[Callable[[Any], None]] = None
+    ) -> ScheduledJob:
+        """Registra o sustituye un trabajo; on_result recibe lo que devuelve cada ejecución."""
+        job = ScheduledJob(name, func, interval, jitter, run_at_start, on_result)
+        self.jobs[name] = job
+        return job
+
+    def clear(self) -> None:
+        self.jobs.clear()
+
+    async def run_job(self, name: str) -> bool:
+        """Ejecuta el trabajo ya; devuelve False si seguía en marcha la ejecución anterior."""
+        try:
+            await self.trigger(name)
+        except JobAlreadyRunning:
+            return False
+        except Exception:
+            # Ya contabilizado y registrado en trigger
+            pass
+        return True
+
+    async def trigger(self, name: str) -> Any:
+        """
+        Ejecuta el trabajo ya y devuelve su resultado, con el mismo control de solapamiento
+        que las ejecuciones programadas. Lanza JobAlreadyRunning si la anterior sigue en curso
+        y JobNotRegistered si el trabajo no existe.
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            raise JobNotRegistered(name)
+        if job.lock.locked():
+            job.skipped += 1
+            logger.warning(f"Trabajo {name} omitido: la ejecución anterior sigue en curso")
+            raise JobAlreadyRunning(name)
+
+        async with job.lock:
+            job.last_started_at = time.time()
+            started = time.perf_counter()
+            # Una ejecución cancelada (pérdida del liderazgo, apagado) no cuenta
+            try:
+                result = await job.func()
+            except Exception as e:
+                job.failures += 1
+                job.last_error = str(e)
+                logger.error(f"Error en el trabajo {name}: {str(e)}")
+                self._record(job, started, "error")
+                raise
+            job.last_error = None
+            self._record(job, started, "success")
+            if job.on_result is not None:
+                job.on_result(result)
+        return result
+
+    def _record(self, job: ScheduledJob, started: float, outcome: str) -> None:
+        job.runs += 1
+        job.last_duration = time.perf_counter() - started
+        SCHEDULER_JOB_SECONDS.observe(job.last_duration, job=job.name, outcome=outcome)
+
+    async def _run_forever(self, job: ScheduledJob) -> None:
+        if not job.run_at_start:
+            await self._sleep(job)
+        while True:
+            await self.run_job(job.name)
+            await self._sleep(job)
+
+    async def _sleep(self, job: ScheduledJob) -> None:
+        delay = job.next_delay()
+        job.next_run_at = time.time() + delay
+        await asyncio.sleep(delay)
+
+    def start(self) -> List["asyncio.Task"]:
+        self._tasks = [asyncio.create_task(self._run_forever(job)) for job in self.jobs.values()]
+        logger.info(f"Planificador iniciado con los trabajos: {', '.join(self.jobs)}")
+        return self._tasks
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for job in self.jobs.values():
+            job.next_run_at = None
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def status(self) -> Dict[str, Any]:
+        return {"running": self.running, "jobs": [job.status() for job in self.jobs.values()]}
+
+scheduler = Scheduler()
+
+registry.gauge(
+    "scheduler_job_interval_seconds",
+    "Intervalo actual de cada trabajo del planificador",
+    ("job",),
+    function=lambda: {
+        (job.name,): job.interval() if callable(job.interval) else job.interval
+        for job in scheduler.jobs.values()
+    }
+)
@@ -3,12 +3,25 @@ from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 from app.models.book import Base as BookBase
 from app.models.reservation import Base as ReservationBase
+from app.models.mail_sync_state import Base as MailSyncStateBase
+from app.models.intent_cache_entry import Base as IntentCacheBase
+from app.models.email_job import Base as EmailJobBase
+from app.models.email_reply import Base as EmailReplyBase
 
 def init_db():
     engine = create_engine(settings.DATABASE_URL)
     
     BookBase.metadata.create_all(bind=engine)
     ReservationBase.metadata.create_all(bind=engine)
+    MailSyncStateBase.metadata.create_all(bind=engine)
+    IntentCacheBase.metadata.create_all(bind=engine)
+    EmailJobBase.metadata.create_all(bind=engine)
+    EmailReplyBase.metadata.create_all(bind=engine)
+
+    # create_all no agrega índices nuevos a tablas existentes
+    for table in BookBase.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     
     print("Base de datos inicializada correctamente!")
 
@@ -1,18 +1,62 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from app.core.config import get_settings
+from app.core.metrics import DB_POOL_CHECKOUTS, registry
 
 settings = get_settings()
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(database_url: str) -> str:
+    """Traduce la URL síncrona de la base de datos a su driver asíncrono equivalente."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+# Motor síncrono: usado por scripts como app/db/init_db.py
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor asíncrono: usado por la API y el verificador de correos
+async_engine = create_async_engine(get_async_database_url(settings.DATABASE_URL), pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _count_pool_checkout(*args):
+    DB_POOL_CHECKOUTS.inc()
+
+def _pool_status():
+    pool = async_engine.sync_engine.pool
+    status = {}
+    for state, method in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            status[(state,)] = getattr(pool, method)()
+    return status
+
+registry.gauge("db_pool_connections", "Estado del pool de conexiones asíncrono", ("state",), function=_pool_status)
+
 Base = declarative_base()
 
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
@@ -1,25 +1,130 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
+from sqlalchemy import text
 from app.core.config import settings
+from app.core.logging_config import setup_logging
 from app.api.api_v1.api import api_router
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.core.scheduler import AdaptiveInterval, scheduler
+from app.db.session import AsyncSessionLocal
+from app.services.graph_api import GraphAPIService
+from app.services.email_processor import create_openai_client, llm_breaker
+from app.services.email_condenser import email_condenser
+from app.services.intent_cache import intent_cache
+from app.services.catalog_cache import catalog_cache
+from app.services.title_index import title_index
+from app.services.leader_election import leader_elector
 import asyncio
 import logging
-from app.tasks.email_checker import check_emails
+from app.tasks.email_checker import MAILBOX_POLL_JOB, check_emails
+from app.tasks.reservation_sweeper import RESERVATION_SWEEP_JOB, sweep_expired_reservations
+from app.tasks.reply_retrier import REPLY_RETRY_JOB, retry_pending_replies
+from app.tasks.email_worker import start_email_workers
+from app.tasks.graph_notifications import SUBSCRIPTION_JOB, ensure_subscription, subscription_active, webhooks_enabled
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-azure_logger = logging.getLogger('azure')
-azure_logger.setLevel(logging.WARNING)
+mailbox_interval = AdaptiveInterval(
+    settings.EMAIL_POLL_MIN_INTERVAL_SECONDS,
+    settings.EMAIL_POLL_MAX_INTERVAL_SECONDS,
+    initial=settings.EMAIL_POLL_INTERVAL_SECONDS
+)
+
+def mailbox_poll_interval() -> float:
+    # Con la suscripción de Graph vigente el sondeo es solo una red de seguridad
+    if subscription_active():
+        return settings.EMAIL_SAFETY_POLL_INTERVAL_SECONDS
+    return mailbox_interval()
+
+def observe_mailbox_volume(result: dict) -> None:
+    # Sin respuesta del buzón el intervalo no cambia
+    mailbox_interval.observe(result.get("fetched_count") if result.get("status") == "success" else None)
+
+def register_background_jobs(graph_api: GraphAPIService, openai_client: AsyncOpenAI):
+    jitter = settings.SCHEDULER_JITTER
+    scheduler.clear()
+    scheduler.add_job(
+        MAILBOX_POLL_JOB,
+        lambda: check_emails(graph_api, openai_client),
+        mailbox_poll_interval,
+        jitter=jitter,
+        on_result=observe_mailbox_volume
+    )
+    scheduler.add_job(
+        RESERVATION_SWEEP_JOB,
+        lambda: sweep_expired_reservations(graph_api),
+        settings.RESERVATION_SWEEP_INTERVAL_SECONDS,
+        jitter=jitter
+    )
+    scheduler.add_job(
+        REPLY_RETRY_JOB,
+        lambda: retry_pending_replies(graph_api, openai_client),
+        settings.EMAIL_REPLY_RETRY_INTERVAL_SECONDS,
+        jitter=jitter,
+        run_at_start=False
+    )
+    if webhooks_enabled():
+        scheduler.add_job(
+            SUBSCRIPTION_JOB,
+            lambda: ensure_subscription(graph_api),
+            settings.GRAPH_SUBSCRIPTION_CHECK_SECONDS,
+            jitter=jitter
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Invalidaciones del catálogo entre workers; si otro proceso cambió títulos,
+    # el índice de títulos local se reconstruye en la siguiente búsqueda.
+    catalog_cache.add_invalidation_handler(
+        lambda message: title_index.reset()
+        if message.get("titles_changed") and message.get("origin") != catalog_cache.instance_id
+        else None
+    )
+    await catalog_cache.start()
 
-httpx_logger = logging.getLogger('httpx')
-httpx_logger.setLevel(logging.WARNING)
+    # Clientes de larga duración compartidos por el verificador y los endpoints
+    app.state.graph_api = GraphAPIService()
+    app.state.openai_client = create_openai_client()
+
+    # tiktoken puede descargar el vocabulario: se carga en un hilo sin retrasar el arranque
+    # y, mientras tanto, los tokens de los correos se estiman por longitud
+    tokenizer_task = asyncio.create_task(asyncio.to_thread(email_condenser.load_tokenizer))
+
+    # Solo el líder ejecuta el planificador (sondeo del buzón, barrido de reservas,
+    # reintento de respuestas, renovación de la suscripción); el resto de procesos atiende HTTP (y, con la
+    # cola activa, procesa trabajos de email_jobs)
+    register_background_jobs(app.state.graph_api, app.state.openai_client)
+    leader_task = asyncio.create_task(leader_elector.run(scheduler.start))
+    email_worker_tasks = []
+    if settings.EMAIL_QUEUE_ENABLED and settings.EMAIL_QUEUE_WORKERS > 0:
+        logger.info(f"Iniciando {settings.EMAIL_QUEUE_WORKERS} workers de la cola de correos...")
+        email_worker_tasks = start_email_workers(
+            settings.EMAIL_QUEUE_WORKERS, app.state.graph_api, app.state.openai_client
+        )
+    try:
+        yield
+    finally:
+        logger.info("Deteniendo tareas de fondo...")
+        tokenizer_task.cancel()
+        for task in (leader_task, *email_worker_tasks):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await app.state.openai_client.close()
+        await catalog_cache.stop()
 
 app = FastAPI(
     title="Biblioteca API",
     description="API para gestión de biblioteca mediante correo electrónico",
     version="1.0.0",
-    openapi_url="/api/v1/openapi.json"
+    openapi_url="/api/v1/openapi.json",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -30,8 +135,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
+def _cache_values(key: str):
+    stats = {"intent": intent_cache.stats(), "catalog": catalog_cache.stats()}
+    return {(name,): values[key] for name, values in stats.items()}
+
+# Métricas calculadas al exponer a partir de los contadores que ya llevan los servicios
+registry.gauge("cache_entries", "Entradas en las cachés en memoria", ("cache",), function=lambda: {
+    **_cache_values("size"), ("title_index",): len(title_index)
+})
+registry.counter("cache_hits_total", "Aciertos de las cachés en memoria", ("cache",), function=lambda: _cache_values("hits"))
+registry.counter("cache_misses_total", "Fallos de las cachés en memoria", ("cache",), function=lambda: _cache_values("misses"))
+registry.gauge("llm_circuit_open", "1 si el circuito de OpenAI está abierto o semiabierto", function=lambda: {
+    (): 0 if llm_breaker.state == llm_breaker.CLOSED else 1
+})
+
+registry.gauge("background_leader", "1 si este proceso ejecuta las tareas de fondo", function=lambda: {
+    (): 1 if leader_elector.is_leader else 0
+})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=registry.expose(), media_type=CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {
@@ -44,30 +173,41 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
-email_checker_task = None
-
-async def run_email_checker():
-    while True:
-        try:
-            await check_emails()
-            await asyncio.sleep(30)
-        except Exception as e:
-            logger.error(f"Error en el verificador de correos: {str(e)}")
-            await asyncio.sleep(60)
-
-@app.on_event("startup")
-async def startup_event():
-    global email_checker_task
-    logger.info("Iniciando verificador de correos...")
-    email_checker_task = asyncio.create_task(run_email_checker())
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    global email_checker_task
-    if email_checker_task:
-        logger.info("Deteniendo verificador de correos...")
-        email_checker_task.cancel()
-        try:
-            await email_checker_task
-        except asyncio.CancelledError:
-            pass 
\ No newline at end of file
+@app.get("/api/v1/leader")
+async def leader_status():
+    return leader_elector.stats()
+
+@app.get("/api/v1/scheduler")
+async def scheduler_status():
+    return {"is_leader": leader_elector.is_leader, **scheduler.status()}
+
+@app.get("/api/v1/ready")
+async def readiness_check(request: Request):
+    """Verifica la conectividad con la base de datos, Microsoft Graph y OpenAI."""
+    checks = {}
+
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"error: {str(e)}"
+
+    try:
+        await request.app.state.graph_api._get_valid_token()
+        checks["graph"] = "ok"
+    except Exception as e:
+        checks["graph"] = f"error: {str(e)}"
+
+    try:
+        # Consultar el modelo no genera consumo facturable, a diferencia de una completion
+        await request.app.state.openai_client.models.retrieve(settings.OPENAI_MODEL)
+        checks["openai"] = "ok"
+    except Exception as e:
+        checks["openai"] = f"error: {str(e)}"
+
+    ready = all(status == "ok" for status in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
@@ -13,5 +13,5 @@ class Book(Base):
     publication_year = Column(Integer)
     available = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     reservations = relationship("Reservation", back_populates="book") 
\ No newline at end of file
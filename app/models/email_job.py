@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from app.db.base_class import Base
+from datetime import datetime
+
+JOB_PENDING = "pending"
+JOB_PROCESSING = "processing"
+JOB_DONE = "done"
+JOB_DEAD = "dead"
+
+class EmailJob(Base):
+    __tablename__ = "email_jobs"
+    __table_args__ = (
+        # Reclamación de trabajos: pendientes o con la visibilidad vencida, por antigüedad
+        Index("ix_email_jobs_status_visible_at", "status", "visible_at"),
+        # Orden de llegada por remitente
+        Index("ix_email_jobs_sender_received_at", "sender", "received_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(String, unique=True, nullable=False)
+    sender = Column(String, nullable=False)
+    received_at = Column(DateTime)
+    # Mensaje de Graph completo en JSON, tal como lo entregó la sincronización
+    payload = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default=JOB_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    visible_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
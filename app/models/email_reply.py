@@ -0,0 +1,35 @@
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, Index
+from app.db.base_class import Base
+from datetime import datetime
+
+REPLY_PENDING = "pending"
+REPLY_SENDING = "sending"
+REPLY_DELIVERED = "delivered"
+REPLY_FAILED = "failed"
+
+class EmailReply(Base):
+    """
+    Respuesta ya construida cuyo envío o marcado como leído falló. La acción del
+    correo ya se aplicó, así que los reintentos solo repiten la entrega.
+    """
+    __tablename__ = "email_replies"
+    __table_args__ = (
+        Index("ix_email_replies_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(String, unique=True, nullable=False)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    # Resultado de la acción: "success" o "error" y el mensaje devuelto
+    action_status = Column(String(16), nullable=False)
+    action_message = Column(Text)
+    sent = Column(Boolean, nullable=False, default=False)
+    marked_read = Column(Boolean, nullable=False, default=False)
+    status = Column(String(16), nullable=False, default=REPLY_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, Text, DateTime
+from app.db.base_class import Base
+from datetime import datetime
+
+class IntentCacheEntry(Base):
+    __tablename__ = "intent_cache"
+
+    key = Column(String(64), primary_key=True)
+    action = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
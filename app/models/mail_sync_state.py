@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, Text, DateTime
+from app.db.base_class import Base
+from datetime import datetime
+
+class MailSyncState(Base):
+    __tablename__ = "mail_sync_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 from datetime import datetime
 
 class Reservation(Base):
     __tablename__ = "reservations"
+    __table_args__ = (
+        Index("ix_reservations_user_email_id", "user_email", "id"),
+        # Índice parcial para el barrido de reservas expiradas: solo las activas
+        Index(
+            "ix_reservations_active_end_date",
+            "end_date",
+            postgresql_where=text("is_active"),
+            sqlite_where=text("is_active = 1")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"))
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class BookBase(BaseModel):
     title: str
@@ -27,4 +27,20 @@ class BookInDBBase(BookBase):
     model_config = ConfigDict(from_attributes=True)
 
 class Book(BookInDBBase):
-    pass
\ No newline at end of file
+    pass
+
+class BookPage(BaseModel):
+    items: List[Book]
+    next_cursor: Optional[str] = None
+
+class BookImportError(BaseModel):
+    row: int
+    isbn: Optional[str] = None
+    errors: List[str]
+
+class BookImportResult(BaseModel):
+    imported_count: int
+    failed_count: int
+    batches: int
+    errors: List[BookImportError]
+    errors_truncated: bool = False
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class ReservationBase(BaseModel):
     book_id: int
@@ -24,4 +24,8 @@ class ReservationInDBBase(ReservationBase):
     model_config = ConfigDict(from_attributes=True)
 
 class Reservation(ReservationInDBBase):
-    pass
\ No newline at end of file
+    pass
+
+class ReservationPage(BaseModel):
+    items: List[Reservation]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,182 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from app.models.book import Book
+from app.schemas.book import BookCreate
+from app.services.catalog_cache import CatalogCache, catalog_cache
+from app.services.title_index import TitleIndex, title_index
+from app.core.config import settings
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime
+import codecs
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSV_FORMAT = "csv"
+NDJSON_FORMAT = "ndjson"
+
+# Columnas que se actualizan si el ISBN ya existe. available no se toca: lo gobiernan
+# las reservas y reimportar un libro reservado no debe liberarlo
+UPSERT_COLUMNS = ("title", "author", "publication_year")
+
+def detect_format(content_type: Optional[str]) -> str:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json"):
+        return NDJSON_FORMAT
+    return CSV_FORMAT
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decodifica el cuerpo por trozos y devuelve líneas completas sin cargarlo entero."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Devuelve (número de fila, dict) por registro CSV. Un registro con un campo
+    entrecomillado que contiene saltos de línea se acumula hasta cerrar las comillas.
+    """
+    header: Optional[List[str]] = None
+    record = ""
+    row_number = 0
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        text, record = record.rstrip("\r"), ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            row_number += 1
+            yield row_number, e
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, ValueError(f"Se esperaban {len(header)} columnas y hay {len(values)}")
+            continue
+        # Las celdas vacías toman el valor por defecto del esquema
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield row_number + 1, ValueError("Comillas sin cerrar al final del fichero")
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+class BookImportService:
+    """
+    Importación masiva de libros desde un flujo CSV o NDJSON. Valida cada fila con
+    BookCreate y hace upsert por ISBN en lotes de batch_size, con un commit por lote,
+    de modo que la memoria no depende del tamaño del fichero.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        batch_size: int = settings.BOOK_IMPORT_BATCH_SIZE,
+        max_errors: int = settings.BOOK_IMPORT_MAX_ERRORS,
+        index: Optional[TitleIndex] = None,
+        cache: Optional[CatalogCache] = None
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.title_index = index or title_index
+        self.catalog_cache = cache or catalog_cache
+
+    async def import_stream(self, chunks: AsyncIterator[bytes], data_format: str = CSV_FORMAT) -> Dict[str, Any]:
+        parser = iter_ndjson_rows if data_format == NDJSON_FORMAT else iter_csv_rows
+        report = {"imported_count": 0, "failed_count": 0, "batches": 0, "errors": [], "errors_truncated": False}
+
+        # Filas del lote indexadas por ISBN: si un ISBN se repite en el lote gana la última
+        batch: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        async for row_number, row in parser(iter_lines(chunks)):
+            if isinstance(row, Exception):
+                self._add_error(report, row_number, None, [str(row)])
+                continue
+            try:
+                book = BookCreate.model_validate(row)
+            except ValidationError as e:
+                isbn = row.get("isbn") if isinstance(row, dict) else None
+                messages = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+                self._add_error(report, row_number, isbn, messages)
+                continue
+
+            batch.pop(book.isbn, None)
+            batch[book.isbn] = (row_number, book.model_dump())
+            if len(batch) >= self.batch_size:
+                await self._flush(batch, report)
+                batch = {}
+
+        if batch:
+            await self._flush(batch, report)
+
+        if report["imported_count"]:
+            # Los ids y títulos cambiaron en bloque: el índice se reconstruye en la siguiente búsqueda
+            self.title_index.reset()
+            await self.catalog_cache.invalidate(titles_changed=True)
+
+        logger.info(
+            f"Importación de libros: {report['imported_count']} filas importadas, "
+            f"{report['failed_count']} con errores en {report['batches']} lotes"
+        )
+        return report
+
+    async def _flush(self, batch: Dict[str, Tuple[int, Dict[str, Any]]], report: Dict[str, Any]) -> None:
+        now = datetime.utcnow()
+        rows = [{**values, "created_at": now, "updated_at": now} for _, values in batch.values()]
+        try:
+            await self.db.execute(self._upsert_statement(), rows)
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Error al importar un lote de {len(rows)} libros: {str(e)}")
+            for row_number, values in batch.values():
+                self._add_error(report, row_number, values["isbn"], [f"Error de base de datos: {str(e)}"])
+            return
+        report["imported_count"] += len(rows)
+        report["batches"] += 1
+
+    def _upsert_statement(self):
+        # Sentencia fija ejecutada con executemany: se compila una vez y el driver
+        # la agrupa en INSERT de varias filas
+        dialect = self.db.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(Book)
+        return stmt.on_conflict_do_update(
+            index_elements=[Book.isbn],
+            set_={
+                **{column: getattr(stmt.excluded, column) for column in UPSERT_COLUMNS},
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+
+    def _add_error(self, report: Dict[str, Any], row_number: int, isbn: Optional[str], messages: List[str]) -> None:
+        report["failed_count"] += 1
+        if len(report["errors"]) < self.max_errors:
+            report["errors"].append({"row": row_number, "isbn": isbn, "errors": messages})
+        else:
+            report["errors_truncated"] = True
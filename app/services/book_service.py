@@ -1,29 +1,125 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.book import Book
-from app.schemas.book import BookCreate, BookUpdate
-from typing import List, Optional
+from app.schemas.book import Book as BookSchema, BookCreate, BookUpdate
+from app.services.catalog_cache import CatalogCache, catalog_cache
+from app.services.title_index import TitleIndex, title_index
+from app.core.config import settings
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 class BookService:
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, index: Optional[TitleIndex] = None, cache: Optional[CatalogCache] = None):
         self.db = db
+        self.title_index = index or title_index
+        self.catalog_cache = cache or catalog_cache
 
     async def create_book(self, book_data: BookCreate) -> Book:
         db_book = Book(**book_data.dict())
         self.db.add(db_book)
-        self.db.commit()
-        self.db.refresh(db_book)
+        await self.db.commit()
+        await self.db.refresh(db_book)
+        if self.title_index.loaded:
+            self.title_index.add(db_book.id, db_book.title)
+        await self.catalog_cache.invalidate(titles_changed=True)
         return db_book
 
     async def get_book(self, book_id: int) -> Optional[Book]:
-        return self.db.query(Book).filter(Book.id == book_id).first()
+        result = await self.db.execute(select(Book).filter(Book.id == book_id))
+        return result.scalars().first()
 
     async def get_book_by_title(self, title: str) -> Optional[Book]:
-        return self.db.query(Book).filter(Book.title == title).first()
+        result = await self.db.execute(select(Book).filter(Book.title == title))
+        return result.scalars().first()
+
+    async def resolve_book_by_title(self, title: str, min_score: Optional[float] = None) -> Optional[Book]:
+        """
+        Resuelve un título aproximado (mayúsculas, acentos, artículos, erratas)
+        con el índice de títulos en memoria y cae a la búsqueda exacta si no hay candidato.
+        """
+        if min_score is None:
+            min_score = settings.TITLE_MATCH_MIN_SCORE
+
+        await self.title_index.ensure_loaded(self.db)
+        for book_id, _, score in self.title_index.resolve(title, limit=3, min_score=min_score):
+            book = await self.get_book(book_id)
+            if book:
+                return book
+            # El libro se eliminó desde otro proceso
+            self.title_index.remove(book_id)
+
+        return await self.get_book_by_title(title)
+
+    async def find_books_by_exact_title(self, title: str, limit: int = 10) -> List[Book]:
+        """
+        Libros cuyo título normalizado coincide exactamente, sin aproximaciones. Varios
+        libros pueden compartir clave ("El Principito" y "Principito").
+        """
+        await self.title_index.ensure_loaded(self.db)
+        books = []
+        for book_id, _, _ in self.title_index.resolve(title, limit=limit, min_score=1.0):
+            book = await self.get_book(book_id)
+            if book:
+                books.append(book)
+            else:
+                self.title_index.remove(book_id)
+        if not books:
+            book = await self.get_book_by_title(title)
+            if book:
+                books.append(book)
+        return books
 
     async def get_all_books(self) -> List[Book]:
-        return self.db.query(Book).all()
+        result = await self.db.execute(select(Book))
+        return list(result.scalars().all())
+
+    async def get_book_snapshot(self, book_id: int) -> Optional[BookSchema]:
+        """Lectura a través de la caché del catálogo; devuelve el esquema, no la entidad ORM."""
+        async def load():
+            book = await self.get_book(book_id)
+            return BookSchema.model_validate(book) if book else None
+        return await self.catalog_cache.get_or_load(f"book:{book_id}", load)
+
+    async def get_books_page_snapshot(self, limit: int, after_id: Optional[int] = None) -> Tuple[List[BookSchema], Optional[int]]:
+        async def load():
+            books, last_id = await self.get_books_page(limit, after_id)
+            return [BookSchema.model_validate(book) for book in books], last_id
+        return await self.catalog_cache.get_or_load(f"books:{limit}:{after_id}", load)
+
+    async def get_catalog_version(self) -> Tuple[int, Optional[datetime]]:
+        """Número de libros y última modificación: una consulta mínima para calcular el ETag."""
+        async def load():
+            result = await self.db.execute(select(func.count(Book.id), func.max(Book.updated_at)))
+            return tuple(result.one())
+        return await self.catalog_cache.get_or_load("books:version", load)
+
+    async def get_catalog_digest(self) -> str:
+        """Listado del catálogo para la acción LISTAR, cacheado ya renderizado."""
+        async def load():
+            result = await self.db.execute(select(Book.title, Book.author, Book.available).order_by(Book.id))
+            rows = result.all()
+            if not rows:
+                return "No hay libros disponibles en la biblioteca."
+            lines = ["Libros disponibles:\n\n"]
+            for title, author, available in rows:
+                status = "Disponible" if available else "Reservado"
+                lines.append(f"- {title} ({author}) - {status}\n")
+            return "".join(lines)
+        return await self.catalog_cache.get_or_load("listar", load)
+
+    async def get_books_page(self, limit: int, after_id: Optional[int] = None) -> Tuple[List[Book], Optional[int]]:
+
+        query = select(Book).order_by(Book.id).limit(limit + 1)
+        if after_id is not None:
+            query = query.filter(Book.id > after_id)
+
+        result = await self.db.execute(query)
+        books = list(result.scalars().all())
+        if len(books) > limit:
+            books = books[:limit]
+            return books, books[-1].id
+        return books, None
 
     async def update_book(self, book_id: int, book_data: BookUpdate) -> Optional[Book]:
 
@@ -36,8 +132,11 @@ class BookService:
             setattr(db_book, field, value)
 
         db_book.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(db_book)
+        await self.db.commit()
+        await self.db.refresh(db_book)
+        if self.title_index.loaded:
+            self.title_index.add(db_book.id, db_book.title)
+        await self.catalog_cache.invalidate(titles_changed="title" in update_data)
         return db_book
 
     async def delete_book(self, book_id: int) -> bool:
@@ -46,8 +145,11 @@ class BookService:
         if not db_book:
             return False
 
-        self.db.delete(db_book)
-        self.db.commit()
+        book_id = db_book.id
+        await self.db.delete(db_book)
+        await self.db.commit()
+        self.title_index.remove(book_id)
+        await self.catalog_cache.invalidate(titles_changed=True)
         return True
 
     async def delete_book_by_title(self, title: str) -> bool:
@@ -56,6 +158,9 @@ class BookService:
         if not db_book:
             return False
 
-        self.db.delete(db_book)
-        self.db.commit()
-        return True 
\ No newline at end of file
+        book_id = db_book.id
+        await self.db.delete(db_book)
+        await self.db.commit()
+        self.title_index.remove(book_id)
+        await self.catalog_cache.invalidate(titles_changed=True)
+        return True
@@ -0,0 +1,259 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "catalog_invalidation"
+
+InvalidationHandler = Callable[[Dict[str, Any]], None]
+
+class LocalInvalidationBus:
+    """Sustituto en proceso de LISTEN/NOTIFY, para pruebas o despliegues de un solo proceso."""
+
+    def __init__(self):
+        self._handlers: List[InvalidationHandler] = []
+
+    async def start(self, handler: InvalidationHandler) -> None:
+        self._handlers.append(handler)
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        for handler in list(self._handlers):
+            handler(message)
+
+    async def stop(self) -> None:
+        self._handlers.clear()
+
+class PostgresInvalidationBus:
+    """
+    Propaga las invalidaciones entre workers con LISTEN/NOTIFY de Postgres. Si la
+    conexión de escucha se pierde, se reconecta con backoff exponencial y, como las
+    notificaciones de ese intervalo se han perdido, se invalida la caché completa.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        channel: str = INVALIDATION_CHANNEL,
+        health_seconds: float = 30.0,
+        reconnect_min_delay: float = 1.0,
+        reconnect_max_delay: float = 30.0,
+        timeout: float = 5.0
+    ):
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.health_seconds = health_seconds
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.timeout = timeout
+        self.reconnects = 0
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._handler: Optional[InvalidationHandler] = None
+        self._lost = asyncio.Event()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: InvalidationHandler) -> None:
+        self._handler = handler
+        await self._connect()
+        self._watch_task = asyncio.create_task(self._watch())
+        logger.info(f"Escuchando invalidaciones del catálogo en el canal {self.channel}")
+
+    async def _connect(self) -> None:
+        import asyncpg
+
+        conn = await asyncpg.connect(self.dsn, timeout=self.timeout)
+        await conn.add_listener(self.channel, self._on_notification)
+        conn.add_termination_listener(self._on_termination)
+        self._conn = conn
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            self._handler(json.loads(payload))
+        except Exception as e:
+            logger.error(f"Notificación de invalidación inválida: {str(e)}")
+
+    def _on_termination(self, connection) -> None:
+        if connection is self._conn:
+            self._lost.set()
+
+    async def _alive(self) -> bool:
+        if self._conn is None or self._conn.is_closed():
+            return False
+        try:
+            async with self._lock:
+                await self._conn.fetchval("SELECT 1", timeout=self.timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), self.health_seconds)
+            except asyncio.TimeoutError:
+                if await self._alive():
+                    continue
+            self._lost.clear()
+            await self._reconnect()
+
+    async def _reconnect(self) -> None:
+        logger.warning(f"Conexión de escucha del canal {self.channel} perdida, reconectando")
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.terminate()
+        delay = self.reconnect_min_delay
+        while True:
+            try:
+                await self._connect()
+                break
+            except Exception as e:
+                logger.error(f"Error al reconectar la escucha de invalidaciones: {str(e)}, reintentando en {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(self.reconnect_max_delay, delay * 2)
+        self.reconnects += 1
+        logger.info(f"Escucha del canal {self.channel} restablecida")
+        # Las invalidaciones publicadas mientras tanto no llegaron: se invalida todo
+        self._handler({"origin": "reconnect", "sent_at": time.time(), "titles_changed": True})
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        if self._conn is None:
+            return
+        async with self._lock:
+            await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, json.dumps(message))
+
+    async def stop(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+def create_invalidation_bus(database_url: str = settings.DATABASE_URL, backend: str = settings.CATALOG_CACHE_BUS):
+    if backend == "auto":
+        backend = "postgres" if make_url(database_url).get_backend_name() == "postgresql" else "local"
+    if backend == "postgres":
+        return PostgresInvalidationBus(database_url)
+    return LocalInvalidationBus()
+
+class CatalogCache:
+    """
+    Caché versionada de lecturas del catálogo. Cada escritura en libros o reservas
+    incrementa la versión local y la publica al resto de workers; las entradas de
+    una versión anterior se ignoran. El TTL acota la obsolescencia si se pierde
+    una notificación.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.CATALOG_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = settings.CATALOG_CACHE_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.instance_id = uuid.uuid4().hex
+        self.version = 0
+        self.bus = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._handlers: List[InvalidationHandler] = []
+        self.hits = 0
+        self.misses = 0
+        self.local_invalidations = 0
+        self.remote_invalidations = 0
+        self.last_propagation_lag: Optional[float] = None
+        self.max_propagation_lag = 0.0
+        self.last_invalidated_at: Optional[float] = None
+
+    async def start(self, bus=None) -> None:
+        self.bus = bus or create_invalidation_bus()
+        await self.bus.start(self._on_message)
+
+    async def stop(self) -> None:
+        if self.bus is not None:
+            await self.bus.stop()
+            self.bus = None
+
+    def add_invalidation_handler(self, handler: InvalidationHandler) -> None:
+        """Registra un callback adicional para las invalidaciones (locales y remotas)."""
+        self._handlers.append(handler)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            version, value, stored_at = entry
+            if version == self.version and time.monotonic() - stored_at < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        # Si una escritura invalida la caché mientras se carga, el resultado no se guarda
+        version = self.version
+        value = await loader()
+        if version == self.version:
+            self._entries[key] = (version, value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    async def invalidate(self, titles_changed: bool = False) -> None:
+        message = {"origin": self.instance_id, "sent_at": time.time(), "titles_changed": titles_changed}
+        self._apply(message)
+        self.local_invalidations += 1
+        if self.bus is not None:
+            try:
+                await self.bus.publish(message)
+            except Exception as e:
+                logger.error(f"Error al publicar la invalidación del catálogo: {str(e)}")
+
+    def _on_message(self, message: Dict[str, Any]) -> None:
+        if message.get("origin") == self.instance_id:
+            return
+        lag = max(0.0, time.time() - float(message.get("sent_at", time.time())))
+        self.last_propagation_lag = lag
+        self.max_propagation_lag = max(self.max_propagation_lag, lag)
+        self.remote_invalidations += 1
+        self._apply(message)
+
+    def _apply(self, message: Dict[str, Any]) -> None:
+        self.version += 1
+        self._entries.clear()
+        self.last_invalidated_at = time.time()
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Error en el manejador de invalidación: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "local_invalidations": self.local_invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "last_propagation_lag_seconds": self.last_propagation_lag,
+            "max_propagation_lag_seconds": self.max_propagation_lag,
+            "seconds_since_invalidation": time.time() - self.last_invalidated_at if self.last_invalidated_at else None,
+            "ttl_seconds": self.ttl_seconds,
+            "bus": type(self.bus).__name__ if self.bus is not None else None,
+            "bus_reconnects": getattr(self.bus, "reconnects", 0)
+        }
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,152 @@
+"""
+Condensado del texto de los correos antes del análisis: quita el historial citado de
+las respuestas, las firmas y los avisos legales, y recorta lo que queda a un
+presupuesto de tokens.
+"""
+from typing import Any, Dict, List
+from app.core.config import settings
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Inicio del historial citado: todo lo que sigue se descarta
+QUOTE_HEADER_PATTERNS = [
+    # "El lun, 3 mar 2025 a las 10:00, Biblioteca <...> escribió:" (puede partirse en dos líneas)
+    re.compile(r"^(?:el|on)\b[^\n]*(?:\n[^\n]*)?\b(?:escribió|escribio|wrote)\s*:\s*$", re.I | re.M),
+    re.compile(r"^-{2,}\s*(?:mensaje original|original message|mensaje reenviado|forwarded message)\s*-{2,}\s*$", re.I | re.M),
+    # Cabecera de Outlook: "De: ..." seguida de "Enviado:"/"Fecha:" en la misma línea o en la siguiente
+    re.compile(r"^(?:de|from)\s*:[^\n]*(?:\n)?[^\n]*\b(?:enviado|sent|fecha|date)\s*:", re.I | re.M),
+    re.compile(r"^_{20,}\s*$", re.M),
+]
+
+QUOTED_LINE_PATTERN = re.compile(r"^\s*>")
+
+# Líneas que abren una firma o un pie legal: se descarta desde ahí hasta el final
+FOOTER_PATTERNS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^(?:enviado desde mi|sent from my|obtener outlook para|get outlook for)\b", re.I),
+    re.compile(
+        r"^(?:aviso legal|aviso de confidencialidad|confidencial(?:idad)?\s*:|disclaimer|confidentiality notice|"
+        r"antes de imprimir|please consider the environment)",
+        re.I
+    ),
+]
+
+# "Este correo es..." también abre peticiones normales ("Este correo es para reservar..."):
+# solo cuenta como aviso legal si la línea habla de confidencialidad o destinatarios
+LEGAL_SENTENCE_PATTERN = re.compile(
+    r"^(?:este (?:mensaje|correo)(?: electrónico)?(?: y sus (?:anexos|adjuntos))? (?:es|son|puede|contiene|va dirigido|se dirige)|"
+    r"this (?:e-?mail|message)(?: and any attachments)? (?:is|may|contains))",
+    re.I
+)
+LEGAL_KEYWORDS_PATTERN = re.compile(
+    r"confidencial|privilegiad|destinatario|prohibid|protección de datos|"
+    r"confidential|privileged|intended recipient|addressee|prohibited",
+    re.I
+)
+
+def is_footer_line(line: str) -> bool:
+    if any(pattern.match(line) for pattern in FOOTER_PATTERNS):
+        return True
+    return bool(LEGAL_SENTENCE_PATTERN.match(line) and LEGAL_KEYWORDS_PATTERN.search(line))
+
+# Caracteres por token cuando no hay tokenizador: aproximación habitual para texto en español e inglés
+CHARS_PER_TOKEN = 4
+
+def compact_prompt(prompt: str) -> str:
+    """Quita la sangría de los prompts definidos en el código, que se enviaría en cada petición."""
+    return "\n".join(line.strip() for line in prompt.strip().split("\n"))
+
+class EmailCondenser:
+    """
+    Reduce el texto de un correo a lo que escribió el remitente. El tokenizador
+    (tiktoken) es opcional y se carga con load_tokenizer; sin él los tokens se estiman.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = settings.EMAIL_PROMPT_MAX_TOKENS,
+        enabled: bool = settings.EMAIL_CONDENSE_ENABLED,
+        model: str = settings.OPENAI_MODEL
+    ):
+        self.max_tokens = max_tokens
+        self.enabled = enabled
+        self.model = model
+        self._encoding = None
+        self.tokens_saved = 0
+
+    def load_tokenizer(self) -> bool:
+        """
+        Carga el tokenizador del modelo. tiktoken puede descargar el vocabulario la
+        primera vez, así que se llama al arrancar y fuera del bucle de eventos.
+        """
+        try:
+            import tiktoken
+        except ImportError:
+            return False
+        try:
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            for name in ("o200k_base", "cl100k_base"):
+                try:
+                    self._encoding = tiktoken.get_encoding(name)
+                    break
+                except Exception:
+                    continue
+        except Exception as e:
+            logger.warning(f"No se pudo cargar el tokenizador de {self.model}: {str(e)}")
+        if self._encoding is None:
+            logger.warning("Tokenizador no disponible: los tokens de los correos se estimarán por longitud")
+        return self._encoding is not None
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return self._encoding.decode(tokens[:max_tokens]) if len(tokens) > max_tokens else text
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+    def strip_quoted(self, text: str) -> str:
+        cut = len(text)
+        for pattern in QUOTE_HEADER_PATTERNS:
+            match = pattern.search(text, 0, cut)
+            if match and match.start() > 0:
+                cut = match.start()
+        lines: List[str] = []
+        for line in text[:cut].split("\n"):
+            if QUOTED_LINE_PATTERN.match(line):
+                continue
+            if lines and is_footer_line(line.strip()):
+                break
+            lines.append(line)
+        return "\n".join(lines).strip()
+
+    def condense(self, text: str) -> Dict[str, Any]:
+        """Devuelve el texto condensado con los tokens originales, los finales y los ahorrados."""
+        original_tokens = self.count_tokens(text)
+        condensed = self.strip_quoted(text) if self.enabled else text
+        if not condensed:
+            # Nada reconocible como texto propio: se conserva el original dentro del presupuesto
+            condensed = text
+        truncated = False
+        tokens = self.count_tokens(condensed)
+        if tokens > self.max_tokens:
+            condensed = self.truncate(condensed, self.max_tokens)
+            tokens = self.count_tokens(condensed)
+            truncated = True
+        saved = max(0, original_tokens - tokens)
+        self.tokens_saved += saved
+        return {
+            "text": condensed,
+            "original_tokens": original_tokens,
+            "tokens": tokens,
+            "tokens_saved": saved,
+            "truncated": truncated,
+        }
+
+email_condenser = EmailCondenser()
@@ -1,56 +1,33 @@
-from typing import Optional, Dict, Any
-from sqlalchemy.orm import Session
-from openai import OpenAI
+from typing import Optional, Dict, Any, List, Set, Tuple
+from collections import OrderedDict
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from app.services.graph_api import GraphAPIService
 from app.services.book_service import BookService
 from app.services.reservation_service import ReservationService
-from app.db.session import SessionLocal
+from app.services.sync_state_service import SyncStateService, DELTA_LINK_KEY
+from app.services.email_queue_service import EmailQueueService
+from app.services.email_reply_service import EmailReplyService
+from app.models.email_reply import REPLY_DELIVERED, REPLY_PENDING, REPLY_SENDING
+from app.services.intent_cache import IntentCache, intent_cache
+from app.services.intent_classifier import LocalIntentClassifier, local_classifier
+from app.services.resilience import CircuitBreaker, call_with_retries
+from app.services.html_text import extract_text_async
+from app.services.email_condenser import EmailCondenser, compact_prompt, email_condenser
+from app.db.session import AsyncSessionLocal
 from app.core.config import settings
+from app.core.logging_config import Payload, mask_email
+from app.core.metrics import EMAIL_STAGE_SECONDS, EMAIL_TOKENS_SAVED, EMAILS_PROCESSED, LLM_REQUESTS, LLM_TOKENS
 from app.schemas.book import BookCreate
 from datetime import datetime, timedelta
+import asyncio
 import json
 import logging
 import re
-from bs4 import BeautifulSoup
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class EmailProcessor:
-
-    def __init__(self, db: Optional[Session] = None):
-        self.db = db or SessionLocal()
-        self.book_service = BookService(self.db)
-        self.reservation_service = ReservationService(self.db)
-        self.graph_api = GraphAPIService()
-        
-        try:
-            self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            test_response = self.openai_client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{"role": "user", "content": "test"}],
-                max_tokens=5
-            )
-            logger.info("Conexión con OpenAI establecida correctamente")
-        except Exception as e:
-            logger.error(f"Error al conectar con OpenAI: {str(e)}")
-            raise
-
-    def _clean_html_content(self, html_content: str) -> str:
-
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            text = soup.get_text(separator=' ', strip=True)
-            text = re.sub(r'\s+', ' ', text)
-            return text.strip()
-        except Exception as e:
-            logger.error(f"Error al limpiar HTML: {str(e)}")
-            return html_content
-
-    async def _analyze_email_content(self, content: str) -> Dict[str, Any]:
-
-        try:
-            system_prompt = """Eres un asistente de biblioteca. Analiza el correo y responde SOLO con un objeto JSON.
+SYSTEM_PROMPT = compact_prompt("""Eres un asistente de biblioteca. Analiza el correo y responde SOLO con un objeto JSON.
             El JSON debe tener esta estructura exacta:
             {
                 "action": "RESERVAR|RENOVAR|ELIMINAR|LISTAR|CREAR|ELIMINAR_LIBRO",
@@ -71,17 +48,191 @@ class EmailProcessor:
             Si el correo menciona eliminar un libro de la biblioteca, usa la acción ELIMINAR_LIBRO.
             Si el correo menciona eliminar una reserva, usa la acción ELIMINAR.
             
-            No incluyas ningún texto adicional, solo el JSON."""
+            No incluyas ningún texto adicional, solo el JSON.""")
+
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + "\n\n" + compact_prompt("""
+            Recibirás varios correos, cada uno delimitado por <correo id="...">.
+            Responde SOLO con un arreglo JSON que tenga un objeto por correo, con la
+            estructura anterior más el campo "id" con el id del correo correspondiente.""")
+
+# Errores de OpenAI que justifican reintentar y, si persisten, aplazar el correo
+TRANSIENT_LLM_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+llm_breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=settings.OPENAI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.OPENAI_BREAKER_RESET_SECONDS
+)
+
+# Extracto de la respuesta del LLM que se registra cuando no se puede interpretar
+LLM_EXCERPT_CHARS = 200
+
+# Ids de los correos en proceso en este proceso
+IN_FLIGHT_EMAIL_IDS: Set[str] = set()
+
+class AnalysisDeferred(Exception):
+    """El LLM no está disponible; el correo se deja sin leer para un ciclo posterior."""
+    pass
+
+class ReplyBatch:
+    """
+    Respuestas pendientes de un ciclo. Se envían por $batch cada flush_size elementos,
+    no al final, para que un fallo a mitad de ciclo deje sin respuesta el menor número
+    posible de acciones ya aplicadas. Una respuesta suelta se envía sin $batch. Cada
+    resultado conserva la respuesta para poder guardarla si la entrega falla.
+    """
+
+    def __init__(self, graph_api: GraphAPIService, flush_size: int = settings.EMAIL_REPLY_BATCH_SIZE):
+        self.graph_api = graph_api
+        self.flush_size = max(1, flush_size)
+        self.items: List[Dict[str, Any]] = []
+        self.outcomes: Dict[str, Dict[str, Any]] = {}
+
+    async def add(self, item: Dict[str, Any]) -> None:
+        self.items.append(item)
+        if len(self.items) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        items, self.items = self.items, []
+        if not items:
+            return
+        try:
+            if len(items) == 1:
+                with EMAIL_STAGE_SECONDS.time(stage="reply"):
+                    batch_results = [await self._send_single(items[0])]
+            else:
+                with EMAIL_STAGE_SECONDS.time(stage="reply_batch"):
+                    batch_results = await self.graph_api.send_replies_and_mark_read(items)
+        except Exception as e:
+            logger.error(f"Error al enviar {len(items)} respuestas: {str(e)}")
+            batch_results = [{"email_id": item["email_id"], "sent": False, "marked_read": False} for item in items]
+        for item, batch_result in zip(items, batch_results):
+            self.outcomes[item["email_id"]] = {**batch_result, "reply": item}
+
+    async def _send_single(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        sent = await self.graph_api.send_email(to=item["to"], subject=item["subject"], body=item["body"])
+        # Sin respuesta enviada el correo se deja sin leer
+        marked_read = sent and await self.graph_api.mark_email_as_read(item["email_id"])
+        return {"email_id": item["email_id"], "sent": sent, "marked_read": marked_read}
+
+def create_openai_client() -> AsyncOpenAI:
+    # Los reintentos los gestiona call_with_retries para respetar el plazo total
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        timeout=settings.OPENAI_TIMEOUT_SECONDS,
+        max_retries=0
+    )
+
+class EmailProcessor:
+
+    def __init__(
+        self,
+        db: Optional[AsyncSession] = None,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        graph_api: Optional[GraphAPIService] = None,
+        openai_client: Optional[AsyncOpenAI] = None,
+        cache: Optional[IntentCache] = None,
+        classifier: Optional[LocalIntentClassifier] = None,
+        condenser: Optional[EmailCondenser] = None
+    ):
+        self._owns_db = db is None
+        self.session_factory = session_factory
+        self.db = db or session_factory()
+        self.book_service = BookService(self.db)
+        self.reservation_service = ReservationService(self.db)
+        # Los clientes de larga duración se crean en el lifespan de la aplicación;
+        # construirlos aquí queda solo como respaldo para scripts.
+        self.graph_api = graph_api or GraphAPIService()
+        self.openai_client = openai_client or create_openai_client()
+        self.llm_breaker = llm_breaker
+        self.intent_cache = cache or intent_cache
+        self.classifier = classifier or local_classifier
+        self.condenser = condenser or email_condenser
+
+    async def _clean_email_content(self, content: str, content_type: Optional[str] = "html") -> str:
+
+        try:
+            with EMAIL_STAGE_SECONDS.time(stage="clean_html"):
+                return await extract_text_async(content, content_type)
+        except Exception as e:
+            logger.error(f"Error al limpiar HTML: {str(e)}")
+            return content[:settings.EMAIL_TEXT_MAX_CHARS]
+
+    def _parse_llm_json(self, result: str) -> Any:
+
+        cleaned_result = result
+        cleaned_result = re.sub(r'```json\s*', '', cleaned_result)
+        cleaned_result = re.sub(r'```\s*', '', cleaned_result)
+        cleaned_result = re.sub(r'[\n\r\t]', '', cleaned_result)
+        cleaned_result = re.sub(r'\s+', ' ', cleaned_result)
+        cleaned_result = cleaned_result.strip()
+        
+        logger.debug("Respuesta limpia: %s", Payload(cleaned_result))
+
+        try:
+            parsed = json.loads(cleaned_result)
+            logger.debug("JSON parseado exitosamente: %s", Payload(parsed))
+            return parsed
+        except json.JSONDecodeError as e:
+            logger.error(f"Error al parsear JSON: {str(e)}")
+            logger.error("Contenido que causó el error: %s", Payload(cleaned_result, LLM_EXCERPT_CHARS))
+            raise ValueError("La respuesta no es un JSON válido")
+
+    def _correct_action(self, action_data: Dict[str, Any], content: str) -> Dict[str, Any]:
+
+        if action_data["action"] == "ELIMINAR" and "eliminar el libro" in content.lower():
+            action_data["action"] = "ELIMINAR_LIBRO"
+            logger.info(f"Acción corregida a ELIMINAR_LIBRO basado en el contenido del correo")
+        return action_data
+
+    async def _create_completion(self, **kwargs) -> Any:
+
+        if not self.llm_breaker.allow_request():
+            LLM_REQUESTS.inc(outcome="circuit_open")
+            raise AnalysisDeferred("El circuito de OpenAI está abierto")
+
+        try:
+            with EMAIL_STAGE_SECONDS.time(stage="llm"):
+                response = await call_with_retries(
+                    lambda: self.openai_client.chat.completions.create(**kwargs),
+                    attempts=settings.OPENAI_MAX_ATTEMPTS,
+                    attempt_timeout=settings.OPENAI_TIMEOUT_SECONDS,
+                    deadline=settings.OPENAI_DEADLINE_SECONDS,
+                    retry_on=TRANSIENT_LLM_ERRORS
+                )
+        except TRANSIENT_LLM_ERRORS as e:
+            LLM_REQUESTS.inc(outcome="unavailable")
+            self.llm_breaker.record_failure()
+            raise AnalysisDeferred(f"OpenAI no disponible: {type(e).__name__}: {str(e)}") from e
+        except Exception:
+            # El servicio respondió (p. ej. petición inválida): no cuenta como caída
+            LLM_REQUESTS.inc(outcome="error")
+            self.llm_breaker.record_success()
+            raise
+        finally:
+            # Si la prueba del circuito semiabierto se cancela no queda bloqueada
+            self.llm_breaker.release_probe()
+
+        LLM_REQUESTS.inc(outcome="success")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+        self.llm_breaker.record_success()
+        return response
+
+    async def _analyze_email_content(self, content: str) -> Dict[str, Any]:
+
+        try:
+            system_prompt = SYSTEM_PROMPT
 
             user_prompt = f"Analiza este correo y responde con el JSON: {content}"
 
-            logger.info("=== PROMPT ENVIADO A OPENAI ===")
-            logger.info(f"System: {system_prompt}")
-            logger.info(f"User: {user_prompt}")
-            logger.info("=============================")
+            logger.debug("Prompt enviado a OpenAI. System: %s User: %s", Payload(system_prompt), Payload(user_prompt))
 
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4.1-mini",
+            response = await self._create_completion(
+                model=settings.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
@@ -92,99 +243,260 @@ class EmailProcessor:
 
             result = response.choices[0].message.content.strip()
             
-            logger.info("=== RESPUESTA DE OPENAI ===")
-            logger.info(f"Respuesta cruda: {result}")
-            logger.info("=========================")
-
-            cleaned_result = result
-            cleaned_result = re.sub(r'```json\s*', '', cleaned_result)
-            cleaned_result = re.sub(r'```\s*', '', cleaned_result)
-            cleaned_result = re.sub(r'[\n\r\t]', '', cleaned_result)
-            cleaned_result = re.sub(r'\s+', ' ', cleaned_result)
-            cleaned_result = cleaned_result.strip()
-            
-            logger.info(f"Respuesta limpia: {cleaned_result}")
+            logger.debug("Respuesta cruda de OpenAI: %s", Payload(result))
 
-            try:
-                action_data = json.loads(cleaned_result)
-                logger.info(f"JSON parseado exitosamente: {action_data}")
-                
-                if action_data["action"] == "ELIMINAR" and "eliminar el libro" in content.lower():
-                    action_data["action"] = "ELIMINAR_LIBRO"
-                    logger.info(f"Acción corregida a ELIMINAR_LIBRO basado en el contenido del correo")
-                
-                return action_data
-            except json.JSONDecodeError as e:
-                logger.error(f"Error al parsear JSON: {str(e)}")
-                logger.error(f"Contenido que causó el error: {cleaned_result}")
-                raise ValueError(f"La respuesta no es un JSON válido: {cleaned_result}")
+            action_data = self._parse_llm_json(result)
+            if not isinstance(action_data, dict) or "action" not in action_data:
+                logger.error("Respuesta sin acción: %s", Payload(result, LLM_EXCERPT_CHARS))
+                raise ValueError("La respuesta no contiene una acción")
+            return self._correct_action(action_data, content)
 
         except Exception as e:
             logger.error(f"Error al analizar el correo: {str(e)}")
             logger.error(f"Tipo de error: {type(e)}")
             raise
 
-    async def process_email(self, email_content: str, user_email: str) -> Dict[str, Any]:
-
+    async def _analyze_email_batch(self, contents: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Analiza varios correos en una sola petición al LLM. Cada correo va etiquetado
+        con su id; solo se devuelven los elementos válidos de la respuesta, los
+        ausentes o inválidos quedan para el análisis individual.
+        """
+        results: Dict[str, Dict[str, Any]] = {}
         try:
-            logger.info(f"Procesando correo de {user_email}")
-            
-            clean_content = self._clean_html_content(email_content)
-            logger.info(f"Contenido limpio del correo: {clean_content}")
+            emails_block = "\n\n".join(
+                f"<correo id=\"{email_id}\">\n{content}\n</correo>"
+                for email_id, content in contents.items()
+            )
+            user_prompt = f"Analiza estos {len(contents)} correos y responde con el arreglo JSON:\n\n{emails_block}"
 
-            action_data = await self._analyze_email_content(clean_content)
-            
-            response = await self._execute_action(action_data, user_email)
-            logger.info(f"Respuesta de la acción: {response}")
-            
-            await self.graph_api.send_email(
-                to=user_email,
-                subject="Respuesta a tu solicitud de biblioteca",
-                body=response
+            logger.info(f"Análisis por lotes de {len(contents)} correos")
+            logger.debug("Prompt por lotes enviado a OpenAI: %s", Payload(user_prompt))
+
+            response = await self._create_completion(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0,
+                max_tokens=150 * len(contents)
             )
 
-            return {"status": "success", "message": response}
-                
+            result = response.choices[0].message.content.strip()
+            logger.debug("Respuesta cruda por lotes: %s", Payload(result))
+
+            parsed = self._parse_llm_json(result)
+            if not isinstance(parsed, list):
+                logger.error("Respuesta por lotes que no es un arreglo: %s", Payload(result, LLM_EXCERPT_CHARS))
+                raise ValueError("La respuesta por lotes no es un arreglo JSON")
+
+            for item in parsed:
+                if not isinstance(item, dict):
+                    continue
+                email_id = str(item.pop("id", ""))
+                if email_id in contents and isinstance(item.get("action"), str):
+                    results[email_id] = self._correct_action(item, contents[email_id])
+
+        except AnalysisDeferred:
+            raise
         except Exception as e:
-            error_message = f"Error al procesar el correo: {str(e)}"
-            logger.error(error_message)
-            await self.graph_api.send_email(
-                to=user_email,
-                subject="Error en tu solicitud de biblioteca",
-                body="Lo siento, no pude procesar tu solicitud correctamente. Por favor, intenta reformularla."
-            )
-            return {"status": "error", "message": error_message}
+            logger.error(f"Error en el análisis por lotes: {str(e)}")
+
+        return results
+
+    async def process_email(self, email_content: str, user_email: str) -> Dict[str, Any]:
+
+        logger.info(f"Procesando correo de {mask_email(user_email)}")
+        action_data, analysis_path = None, None
+        try:
+            action_data, analysis_path = await self._analyze_email(email_content)
+            reply = await self._build_reply(action_data, user_email, self.db)
+        except AnalysisDeferred as e:
+            logger.warning(f"Análisis aplazado para {mask_email(user_email)}: {str(e)}")
+            EMAILS_PROCESSED.inc(action="unknown", status="deferred")
+            return {"status": "deferred", "message": str(e), "analysis_path": None}
+        except Exception as e:
+            reply = self._build_error_reply(user_email, e)
+        EMAILS_PROCESSED.inc(action=(action_data or {}).get("action") or "unknown", status=reply["status"])
+
+        await self.graph_api.send_email(
+            to=reply["to"],
+            subject=reply["subject"],
+            body=reply["body"]
+        )
+        return {"status": reply["status"], "message": reply["message"], "analysis_path": analysis_path}
+
+    async def _analyze_email(self, email_content: str, content_type: Optional[str] = "html") -> Tuple[Dict[str, Any], str]:
+        """Devuelve la acción y la vía que la resolvió: "local", "cache" o "llm"."""
+
+        clean_content, resolved = await self._analyze_without_llm(email_content, content_type)
+        if resolved is not None:
+            return resolved
+
+        action_data = await self._analyze_email_content(clean_content)
+        await self.intent_cache.set(clean_content, action_data)
+        return action_data, "llm"
+
+    async def _analyze_without_llm(
+        self,
+        email_content: str,
+        content_type: Optional[str] = "html"
+    ) -> Tuple[str, Optional[Tuple[Dict[str, Any], str]]]:
+
+        clean_content = await self._clean_email_content(email_content, content_type)
+        # Sin el historial citado las reglas locales y la caché ven solo el mensaje nuevo
+        with EMAIL_STAGE_SECONDS.time(stage="condense"):
+            condensed = self.condenser.condense(clean_content)
+        clean_content = condensed["text"]
+        EMAIL_TOKENS_SAVED.observe(condensed["tokens_saved"])
+        logger.debug(
+            "Contenido condensado del correo (%s de %s tokens, %s ahorrados): %s",
+            condensed["tokens"], condensed["original_tokens"], condensed["tokens_saved"], Payload(clean_content)
+        )
+
+        with EMAIL_STAGE_SECONDS.time(stage="local_analysis"):
+            local_result = await self.classifier.classify(clean_content, self._resolve_catalog_title)
+            cached = None if local_result is not None else await self.intent_cache.get(clean_content)
+        if local_result is not None:
+            return clean_content, (local_result["action_data"], "local")
+
+        if cached is not None:
+            logger.info("Intención obtenida de la caché: %s", Payload(cached))
+            return clean_content, (cached, "cache")
+
+        return clean_content, None
+
+    async def _resolve_catalog_title(self, title: str) -> Optional[str]:
+
+        async with self.session_factory() as db:
+            book = await BookService(db).resolve_book_by_title(title)
+            return book.title if book else None
+
+    async def _build_reply(self, action_data: Dict[str, Any], user_email: str, db: AsyncSession) -> Dict[str, Any]:
+
+        try:
+            with EMAIL_STAGE_SECONDS.time(stage="action"):
+                response = await self._execute_action(action_data, user_email, db)
+            logger.debug("Respuesta de la acción: %s", Payload(response))
+        except Exception:
+            await db.rollback()
+            raise
+
+        return {
+            "status": "success",
+            "message": response,
+            "to": user_email,
+            "subject": "Respuesta a tu solicitud de biblioteca",
+            "body": response
+        }
+
+    def _build_error_reply(self, user_email: str, error: Exception) -> Dict[str, Any]:
+
+        error_message = f"Error al procesar el correo: {str(error)}"
+        logger.error(error_message)
+        return {
+            "status": "error",
+            "message": error_message,
+            "to": user_email,
+            "subject": "Error en tu solicitud de biblioteca",
+            "body": "Lo siento, no pude procesar tu solicitud correctamente. Por favor, intenta reformularla."
+        }
 
-    async def process_unread_emails(self) -> Dict[str, Any]:
+    async def process_unread_emails(self, concurrency: Optional[int] = None) -> Dict[str, Any]:
 
         try:
             logger.info("Buscando correos no leídos...")
-            unread_emails = await self.graph_api.get_unread_emails()
+            with EMAIL_STAGE_SECONDS.time(stage="fetch"):
+                unread_emails, delta_link = await self._fetch_unread_emails()
             logger.info(f"Encontrados {len(unread_emails)} correos no leídos")
-            
-            processed_count = 0
-            errors = []
+        except Exception as e:
+            error_msg = f"Error al procesar correos: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "status": "error",
+                "message": error_msg
+            }
 
-            for email in unread_emails:
-                try:
-                    email_content = email["body"]["content"]
-                    user_email = email["from"]["emailAddress"]["address"]
-                    logger.info(f"Procesando correo de {user_email}")
+        result = await self.process_emails(unread_emails, concurrency)
+        # El deltaLink solo avanza si todos los correos se procesaron; si no,
+        # la siguiente sincronización vuelve a entregar los pendientes. Una respuesta
+        # no entregada no lo impide: queda guardada y se reintenta solo su entrega.
+        if delta_link and result["status"] == "success" and not result["errors"] and not result["deferred_count"]:
+            await self._save_delta_link(delta_link)
+        return result
+
+    async def enqueue_unread_emails(self) -> Dict[str, Any]:
+        """
+        Lleva los correos nuevos a la cola email_jobs sin procesarlos. El encolado es
+        idempotente por id de mensaje, así que el deltaLink avanza en cuanto se encolan.
+        """
+        try:
+            with EMAIL_STAGE_SECONDS.time(stage="fetch"):
+                unread_emails, delta_link = await self._fetch_unread_emails()
+            async with self.session_factory() as db:
+                enqueued_count = await EmailQueueService(db).enqueue(unread_emails)
+            if delta_link:
+                await self._save_delta_link(delta_link)
+            logger.info(f"Encolados {enqueued_count} de {len(unread_emails)} correos no leídos")
+            return {"status": "success", "fetched_count": len(unread_emails), "enqueued_count": enqueued_count}
+        except Exception as e:
+            error_msg = f"Error al encolar correos: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
 
-                    await self.process_email(email_content, user_email)
+    async def process_emails(self, emails: List[dict], concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Procesa una lista de mensajes de Graph: los de la sincronización o los reclamados de la cola."""
 
-                    await self.graph_api.mark_email_as_read(email["id"])
-                    processed_count += 1
-                    logger.info(f"Correo procesado exitosamente")
-                except Exception as e:
-                    error_msg = f"Error procesando correo {email['id']}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
+        # Un mismo correo puede llegar a la vez por una notificación y por el sondeo
+        unread_emails = [email for email in emails if email["id"] not in IN_FLIGHT_EMAIL_IDS]
+        if len(unread_emails) < len(emails):
+            logger.info(f"Omitidos {len(emails) - len(unread_emails)} correos que ya se están procesando")
+        IN_FLIGHT_EMAIL_IDS.update(email["id"] for email in unread_emails)
+        try:
+            semaphore = asyncio.Semaphore(concurrency or settings.EMAIL_PROCESSING_CONCURRENCY)
+
+            # Correos cuya acción ya se aplicó en otro ciclo: solo se reintenta la entrega
+            async with self.session_factory() as db:
+                saved_replies = await EmailReplyService(db).get_by_message_ids([email["id"] for email in unread_emails])
+            results = await self._redeliver_saved_replies(saved_replies, semaphore)
+            new_emails = [email for email in unread_emails if email["id"] not in saved_replies]
+
+            # Las respuestas y el marcado como leído se agrupan en peticiones
+            # $batch de EMAIL_REPLY_BATCH_SIZE.
+            pending_replies = ReplyBatch(self.graph_api)
+
+            # El análisis de todos los correos arranca de inmediato; las acciones
+            # de un mismo remitente se aplican después en orden de llegada.
+            loop = asyncio.get_running_loop()
+            analyses = {email["id"]: loop.create_future() for email in new_emails}
+            analysis_task = asyncio.create_task(self._run_analyses(new_emails, analyses, semaphore))
+            try:
+                sender_results = await asyncio.gather(*(
+                    self._process_sender_emails(emails, analyses, semaphore, pending_replies)
+                    for emails in self._group_by_sender(new_emails)
+                ))
+            finally:
+                # Las acciones ya aplicadas reciben su respuesta aunque el ciclo falle
+                await pending_replies.flush()
+            results.extend(result for group in sender_results for result in group)
+            await analysis_task
+
+            undelivered = self._record_reply_outcomes(pending_replies.outcomes, results)
+            await self._save_undelivered_replies(undelivered, results)
+
+            processed_count = sum(1 for result in results if result["processed"])
+            deferred_count = sum(1 for result in results if result["status"] == "deferred")
+            reply_pending_count = sum(1 for result in results if result.get("reply_pending"))
+            errors = [result["error"] for result in results if result.get("error")]
 
             return {
                 "status": "success",
                 "processed_count": processed_count,
-                "errors": errors
+                "deferred_count": deferred_count,
+                "reply_pending_count": reply_pending_count,
+                "errors": errors,
+                "results": results
             }
         except Exception as e:
             error_msg = f"Error al procesar correos: {str(e)}"
@@ -193,33 +505,334 @@ class EmailProcessor:
                 "status": "error",
                 "message": error_msg
             }
+        finally:
+            IN_FLIGHT_EMAIL_IDS.difference_update(email["id"] for email in unread_emails)
+
+    def _record_reply_outcomes(self, outcomes: Dict[str, Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Anota en cada resultado si se envió la respuesta y se marcó como leído, y
+        devuelve las respuestas no entregadas para guardarlas (reply_pending).
+        """
+        undelivered = []
+        for result in results:
+            outcome = outcomes.get(result["id"])
+            if not outcome:
+                continue
+            result["reply_sent"] = outcome["sent"]
+            result["marked_read"] = outcome["marked_read"]
+            error = self._reply_error(result["id"], outcome["sent"], outcome["marked_read"])
+            if error:
+                result["reply_pending"] = True
+                undelivered.append({
+                    **outcome["reply"],
+                    "message_id": result["id"],
+                    "sent": outcome["sent"],
+                    "marked_read": outcome["marked_read"],
+                    "error": error
+                })
+        return undelivered
+
+    async def _save_undelivered_replies(self, undelivered: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+        if not undelivered:
+            return
+        try:
+            async with self.session_factory() as db:
+                await EmailReplyService(db).save_pending(undelivered)
+            logger.warning(f"{len(undelivered)} respuestas no entregadas guardadas para reintentar su envío")
+        except Exception as e:
+            # Sin la respuesta guardada el correo cuenta como error y el deltaLink no avanza
+            logger.error(f"Error al guardar las respuestas no entregadas: {str(e)}")
+            message_ids = {reply["message_id"] for reply in undelivered}
+            for result in results:
+                if result["id"] in message_ids:
+                    result["error"] = f"No se pudo guardar la respuesta pendiente del correo {result['id']}"
+
+    async def _redeliver_saved_replies(
+        self,
+        saved_replies: Dict[str, Dict[str, Any]],
+        semaphore: asyncio.Semaphore
+    ) -> List[Dict[str, Any]]:
+        """Resultados de los correos que ya tenían respuesta guardada, reintentando las pendientes."""
+        if not saved_replies:
+            return []
+        pending_ids = [
+            message_id for message_id, reply in saved_replies.items()
+            if reply["delivery_status"] in (REPLY_PENDING, REPLY_SENDING)
+        ]
+        async with self.session_factory() as db:
+            claimed = await EmailReplyService(db).claim(message_ids=pending_ids)
+
+        async def deliver(reply: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._deliver_saved_reply(reply)
+
+        delivered = {reply["message_id"]: reply for reply in await asyncio.gather(*(deliver(reply) for reply in claimed))}
+        results = []
+        for message_id, reply in saved_replies.items():
+            reply = delivered.get(message_id, reply)
+            logger.info(f"Correo {message_id} ya procesado; entrega de la respuesta: {reply['delivery_status']}")
+            results.append({
+                "id": message_id,
+                "processed": True,
+                "status": reply["status"],
+                "message": reply["message"],
+                "analysis_path": None,
+                "reply_sent": reply["sent"],
+                "marked_read": reply["marked_read"],
+                # Reclamada por otro proceso o con la espera sin vencer: sigue pendiente
+                "reply_pending": reply["delivery_status"] in (REPLY_PENDING, REPLY_SENDING)
+            })
+        return results
+
+    async def _deliver_saved_reply(self, reply: Dict[str, Any]) -> Dict[str, Any]:
+        """Reintenta el envío (si no se hizo) y el marcado como leído de una respuesta reclamada."""
+        try:
+            sent = reply["sent"] or await self.graph_api.send_email(
+                to=reply["to"],
+                subject=reply["subject"],
+                body=reply["body"]
+            )
+            marked_read = sent and (reply["marked_read"] or await self.graph_api.mark_email_as_read(reply["message_id"]))
+            error = self._reply_error(reply["message_id"], sent, marked_read)
+            async with self.session_factory() as db:
+                delivery_status = await EmailReplyService(db).finish(reply, sent, marked_read, error)
+        except Exception as e:
+            # Queda en "sending" y se vuelve a reclamar al vencer sending_timeout_seconds
+            logger.error(f"Error al reintentar la respuesta al correo {reply['message_id']}: {str(e)}")
+            return {**reply, "delivery_status": REPLY_SENDING}
+        return {**reply, "sent": sent, "marked_read": marked_read, "delivery_status": delivery_status}
+
+    async def retry_pending_replies(self, limit: int = 50, concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Reintenta la entrega de las respuestas guardadas cuyo próximo intento ya toca."""
+        async with self.session_factory() as db:
+            claimed = await EmailReplyService(db).claim(limit=limit)
+        if not claimed:
+            return {"status": "success", "retried_count": 0, "delivered_count": 0}
+
+        semaphore = asyncio.Semaphore(concurrency or settings.EMAIL_PROCESSING_CONCURRENCY)
+
+        async def deliver(reply: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._deliver_saved_reply(reply)
+
+        delivered = await asyncio.gather(*(deliver(reply) for reply in claimed))
+        delivered_count = sum(1 for reply in delivered if reply["delivery_status"] == REPLY_DELIVERED)
+        logger.info(f"Reintentadas {len(claimed)} respuestas pendientes, entregadas {delivered_count}")
+        return {"status": "success", "retried_count": len(claimed), "delivered_count": delivered_count}
+
+    def _reply_error(self, email_id: str, sent: bool, marked_read: bool) -> Optional[str]:
+        if not sent:
+            return f"No se pudo enviar la respuesta al correo {email_id}"
+        if not marked_read:
+            return f"No se pudo marcar como leído el correo {email_id}"
+        return None
+
+    async def _fetch_unread_emails(self) -> Tuple[List[dict], Optional[str]]:
+
+        if settings.EMAIL_SYNC_MODE != "delta":
+            return await self.graph_api.get_unread_emails(), None
+
+        async with self.session_factory() as db:
+            delta_link = await SyncStateService(db).get_value(DELTA_LINK_KEY)
+        return await self.graph_api.get_new_emails(delta_link)
+
+    async def _save_delta_link(self, delta_link: str) -> None:
+
+        async with self.session_factory() as db:
+            await SyncStateService(db).set_value(DELTA_LINK_KEY, delta_link)
+
+    def _group_by_sender(self, emails: List[dict]) -> List[List[dict]]:
+
+        groups: "OrderedDict[str, List[dict]]" = OrderedDict()
+        for email in sorted(emails, key=lambda e: e.get("receivedDateTime") or ""):
+            sender = (email.get("from") or {}).get("emailAddress", {}).get("address", "").lower()
+            groups.setdefault(sender, []).append(email)
+        return list(groups.values())
+
+    async def _run_analyses(
+        self,
+        emails: List[dict],
+        analyses: Dict[str, "asyncio.Future"],
+        semaphore: asyncio.Semaphore
+    ) -> None:
+        """
+        Resuelve el futuro de análisis de cada correo. Los que no resuelven el
+        clasificador local ni la caché se envían al LLM en lotes de LLM_BATCH_SIZE.
+        """
+        try:
+            async def analyze_without_llm(email: dict):
+                async with semaphore:
+                    return await self._analyze_without_llm(email["body"]["content"], email["body"].get("contentType"))
 
-    async def _execute_action(self, action_data: Dict[str, Any], user_email: str) -> str:
+            prepared = await asyncio.gather(
+                *(analyze_without_llm(email) for email in emails),
+                return_exceptions=True
+            )
 
+            pending: Dict[str, str] = {}
+            for email, outcome in zip(emails, prepared):
+                future = analyses[email["id"]]
+                if isinstance(outcome, BaseException):
+                    future.set_exception(outcome)
+                elif outcome[1] is not None:
+                    future.set_result(outcome[1])
+                else:
+                    pending[email["id"]] = outcome[0]
+
+            pending_ids = list(pending)
+            batch_size = max(1, settings.LLM_BATCH_SIZE)
+            await asyncio.gather(*(
+                self._resolve_llm_chunk({email_id: pending[email_id] for email_id in pending_ids[i:i + batch_size]}, analyses, semaphore)
+                for i in range(0, len(pending_ids), batch_size)
+            ))
+        except Exception as e:
+            for future in analyses.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _resolve_llm_chunk(
+        self,
+        contents: Dict[str, str],
+        analyses: Dict[str, "asyncio.Future"],
+        semaphore: asyncio.Semaphore
+    ) -> None:
+
+        results: Dict[str, Dict[str, Any]] = {}
+        if len(contents) > 1:
+            try:
+                async with semaphore:
+                    results = await self._analyze_email_batch(contents)
+            except AnalysisDeferred as e:
+                # OpenAI no disponible: se aplaza todo el lote sin reintentar cada correo
+                for email_id in contents:
+                    analyses[email_id].set_exception(e)
+                return
+            for email_id, action_data in results.items():
+                await self.intent_cache.set(contents[email_id], action_data)
+                analyses[email_id].set_result((action_data, "llm_batch"))
+
+        # Correos sueltos o que el lote no resolvió: análisis individual
+        async def analyze_single(email_id: str):
+            try:
+                async with semaphore:
+                    action_data = await self._analyze_email_content(contents[email_id])
+                await self.intent_cache.set(contents[email_id], action_data)
+                analyses[email_id].set_result((action_data, "llm"))
+            except Exception as e:
+                analyses[email_id].set_exception(e)
+
+        await asyncio.gather(*(analyze_single(email_id) for email_id in contents if email_id not in results))
+
+    async def _process_sender_emails(
+        self,
+        emails: List[dict],
+        analyses: Dict[str, "asyncio.Future"],
+        semaphore: asyncio.Semaphore,
+        pending_replies: ReplyBatch
+    ) -> List[Dict[str, Any]]:
+
+        results = []
+        async with self.session_factory() as db:
+            for email in emails:
+                results.append(await self._process_queued_email(
+                    email, analyses[email["id"]], db, semaphore, pending_replies
+                ))
+        return results
+
+    async def _process_queued_email(
+        self,
+        email: dict,
+        analysis: "asyncio.Future",
+        db: AsyncSession,
+        semaphore: asyncio.Semaphore,
+        pending_replies: ReplyBatch
+    ) -> Dict[str, Any]:
+
+        try:
+            user_email = email["from"]["emailAddress"]["address"]
+            logger.info(f"Procesando correo {email['id']} de {mask_email(user_email)}")
+
+            try:
+                action_data, analysis_path = await analysis
+                analysis_error = None
+            except Exception as e:
+                action_data, analysis_path, analysis_error = None, None, e
+
+            if isinstance(analysis_error, AnalysisDeferred):
+                # Sin respuesta de error ni marcado como leído: se reintenta en otro ciclo
+                logger.warning(f"Correo {email['id']} aplazado: {str(analysis_error)}")
+                EMAILS_PROCESSED.inc(action="unknown", status="deferred")
+                return {
+                    "id": email["id"],
+                    "processed": False,
+                    "status": "deferred",
+                    "message": str(analysis_error),
+                    "analysis_path": None
+                }
+
+            async with semaphore:
+                if analysis_error is not None:
+                    reply = self._build_error_reply(user_email, analysis_error)
+                else:
+                    try:
+                        reply = await self._build_reply(action_data, user_email, db)
+                    except Exception as e:
+                        reply = self._build_error_reply(user_email, e)
+
+                await pending_replies.add({**reply, "email_id": email["id"]})
+
+            logger.info(f"Correo procesado exitosamente")
+            EMAILS_PROCESSED.inc(action=(action_data or {}).get("action") or "unknown", status=reply["status"])
+            return {
+                "id": email["id"],
+                "processed": True,
+                "status": reply["status"],
+                "message": reply["message"],
+                "analysis_path": analysis_path
+            }
+        except Exception as e:
+            error_msg = f"Error procesando correo {email['id']}: {str(e)}"
+            logger.error(error_msg)
+            EMAILS_PROCESSED.inc(action="unknown", status="failed")
+            return {"id": email["id"], "processed": False, "status": "error", "message": error_msg, "error": error_msg}
+
+    def _get_services(self, db: Optional[AsyncSession]) -> Tuple[BookService, ReservationService]:
+
+        if db is None or db is self.db:
+            return self.book_service, self.reservation_service
+        return BookService(db), ReservationService(db)
+
+    async def _execute_action(self, action_data: Dict[str, Any], user_email: str, db: Optional[AsyncSession] = None) -> str:
+
+        book_service, reservation_service = self._get_services(db)
         action = action_data.get("action")
         
         if action == "RESERVAR":
-            book = await self.book_service.get_book_by_title(action_data["book_title"])
+            book = await book_service.resolve_book_by_title(action_data["book_title"])
             if not book:
                 return f"Lo siento, no se encontró el libro '{action_data['book_title']}'."
+            book_id, book_title = book.id, book.title
             if not book.available:
-                return f"Lo siento, el libro '{book.title}' no está disponible en este momento."
+                return f"Lo siento, el libro '{book_title}' no está disponible en este momento."
             
             end_date = datetime.utcnow() + timedelta(days=15)
             
-            reservation = await self.reservation_service.create_reservation(
-                book_id=book.id,
+            reservation = await reservation_service.create_reservation(
+                book_id=book_id,
                 user_email=user_email,
                 end_date=end_date
             )
-            return f"Has reservado exitosamente el libro '{book.title}' hasta el {end_date.strftime('%d/%m/%Y')}."
+            if not reservation:
+                # Otro correo del mismo ciclo lo reservó entre la consulta y la reserva
+                return f"Lo siento, el libro '{book_title}' no está disponible en este momento."
+            return f"Has reservado exitosamente el libro '{book_title}' hasta el {end_date.strftime('%d/%m/%Y')}."
 
         elif action == "RENOVAR":
-            book = await self.book_service.get_book_by_title(action_data["book_title"])
+            book = await book_service.resolve_book_by_title(action_data["book_title"])
             if not book:
                 return f"Lo siento, no se encontró el libro '{action_data['book_title']}'."
             
-            reservation = await self.reservation_service.get_active_reservation_by_email_and_book(
+            reservation = await reservation_service.get_active_reservation_by_email_and_book(
                 user_email=user_email,
                 book_title=book.title
             )
@@ -227,39 +840,46 @@ class EmailProcessor:
                 return f"No tienes una reserva activa para el libro '{book.title}'."
             
             new_end_date = datetime.utcnow() + timedelta(days=15)
-            updated_reservation = await self.reservation_service.renew_reservation(
+            updated_reservation = await reservation_service.renew_reservation(
                 reservation_id=reservation.id,
                 new_end_date=new_end_date
             )
             return f"Has renovado exitosamente tu reserva del libro '{book.title}' hasta el {new_end_date.strftime('%d/%m/%Y')}."
 
         elif action == "ELIMINAR":
-            success = await self.reservation_service.delete_reservation(
+            book = await book_service.resolve_book_by_title(action_data["book_title"])
+            book_title = book.title if book else action_data["book_title"]
+            success = await reservation_service.delete_reservation(
                 user_email=user_email,
-                book_title=action_data["book_title"]
+                book_title=book_title
             )
             if success:
-                return f"Has eliminado exitosamente tu reserva del libro '{action_data['book_title']}'."
+                return f"Has eliminado exitosamente tu reserva del libro '{book_title}'."
             else:
-                return f"No tienes una reserva activa para el libro '{action_data['book_title']}'."
+                return f"No tienes una reserva activa para el libro '{book_title}'."
 
         elif action == "ELIMINAR_LIBRO":
-            success = await self.book_service.delete_book_by_title(action_data["book_title"])
+            # Acción destructiva: solo con un único libro de título exacto tras normalizarlo;
+            # si varios comparten clave decide el título literal y, si no, el usuario
+            requested = action_data["book_title"]
+            books = await book_service.find_books_by_exact_title(requested)
+            if len(books) > 1:
+                literal = [book for book in books if book.title.strip().lower() == requested.strip().lower()]
+                if len(literal) != 1:
+                    candidates = "\n".join(f"- {book.title} ({book.author}, {book.publication_year})" for book in books)
+                    return (
+                        f"Hay varios libros que coinciden con '{requested}' y no se ha eliminado ninguno:\n\n"
+                        f"{candidates}\n\nIndica el título exactamente como aparece en el catálogo."
+                    )
+                books = literal
+            success = await book_service.delete_book(books[0].id) if books else False
             if success:
-                return f"El libro '{action_data['book_title']}' ha sido eliminado exitosamente de la biblioteca."
+                return f"El libro '{books[0].title}' ha sido eliminado exitosamente de la biblioteca."
             else:
-                return f"Lo siento, no se encontró el libro '{action_data['book_title']}'."
+                return f"Lo siento, no se encontró el libro '{requested}'."
 
         elif action == "LISTAR":
-            books = await self.book_service.get_all_books()
-            if not books:
-                return "No hay libros disponibles en la biblioteca."
-            
-            response = "Libros disponibles:\n\n"
-            for book in books:
-                status = "Disponible" if book.available else "Reservado"
-                response += f"- {book.title} ({book.author}) - {status}\n"
-            return response
+            return await book_service.get_catalog_digest()
 
         elif action == "CREAR":
             try:
@@ -270,7 +890,7 @@ class EmailProcessor:
                     publication_year=action_data["book_year"],
                     available=True
                 )
-                book = await self.book_service.create_book(book_data)
+                book = await book_service.create_book(book_data)
                 return f"El libro '{book.title}' ha sido creado exitosamente en la biblioteca."
             except Exception as e:
                 logger.error(f"Error al crear libro: {str(e)}")
@@ -279,7 +899,7 @@ class EmailProcessor:
         else:
             return "Lo siento, no pude entender la acción solicitada. Por favor, intenta reformular tu solicitud."
 
-    def __del__(self):
+    async def close(self):
 
-        if hasattr(self, 'db'):
-            self.db.close() 
\ No newline at end of file
+        if self._owns_db:
+            await self.db.close() 
\ No newline at end of file
@@ -0,0 +1,214 @@
+from sqlalchemy import and_, exists, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from app.models.email_job import EmailJob, JOB_DEAD, JOB_DONE, JOB_PENDING, JOB_PROCESSING
+from app.core.config import settings
+from app.core.metrics import EMAIL_JOBS
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _sender(email: dict) -> str:
+    return ((email.get("from") or {}).get("emailAddress") or {}).get("address", "").lower()
+
+def _received_at(email: dict) -> Optional[datetime]:
+    value = email.get("receivedDateTime")
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+class EmailQueueService:
+    """
+    Cola de correos persistida en email_jobs. Los workers reclaman trabajos con
+    SELECT ... FOR UPDATE SKIP LOCKED, de modo que varios procesos o contenedores
+    reparten la carga sin coordinarse. Solo se reclama el trabajo más antiguo
+    pendiente de cada remitente para conservar el orden de sus acciones.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        visibility_seconds: float = settings.EMAIL_QUEUE_VISIBILITY_SECONDS,
+        max_attempts: int = settings.EMAIL_QUEUE_MAX_ATTEMPTS,
+        retry_base_seconds: float = settings.EMAIL_QUEUE_RETRY_BASE_SECONDS
+    ):
+        self.db = db
+        self.visibility_seconds = visibility_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+
+    async def enqueue(self, emails: List[dict]) -> int:
+        """Encola los mensajes de Graph; los que ya están en la cola se ignoran. Devuelve los nuevos."""
+        if not emails:
+            return 0
+        now = datetime.utcnow()
+        rows = [
+            {
+                "message_id": email["id"],
+                "sender": _sender(email),
+                "received_at": _received_at(email),
+                "payload": json.dumps(email, ensure_ascii=False),
+                "status": JOB_PENDING,
+                "attempts": 0,
+                "visible_at": now,
+                "created_at": now,
+                "updated_at": now
+            }
+            for email in emails
+        ]
+        dialect = self.db.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(EmailJob).on_conflict_do_nothing(index_elements=[EmailJob.message_id]).returning(EmailJob.id)
+        result = await self.db.execute(stmt, rows)
+        inserted = len(result.all())
+        await self.db.commit()
+        EMAIL_JOBS.inc(inserted, event="enqueued")
+        return inserted
+
+    async def claim(self, worker_id: str, limit: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Reclama hasta limit trabajos visibles (pendientes o cuya visibilidad venció)
+        y los oculta durante visibility_seconds. Cada remitente aporta como mucho su
+        trabajo más antiguo sin terminar.
+        """
+        now = now or datetime.utcnow()
+        await self._dead_letter_exhausted(now)
+
+        candidate = aliased(EmailJob, name="candidate")
+        older = aliased(EmailJob, name="older")
+        older_unfinished = exists().where(
+            older.sender == candidate.sender,
+            older.status.in_((JOB_PENDING, JOB_PROCESSING)),
+            or_(
+                older.received_at < candidate.received_at,
+                and_(older.received_at == candidate.received_at, older.id < candidate.id)
+            )
+        )
+        claimable_ids = (
+            select(candidate.id)
+            .where(
+                candidate.status.in_((JOB_PENDING, JOB_PROCESSING)),
+                candidate.visible_at <= now,
+                candidate.attempts < self.max_attempts,
+                ~older_unfinished
+            )
+            .order_by(candidate.received_at, candidate.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.db.execute(
+            update(EmailJob)
+            .where(EmailJob.id.in_(claimable_ids))
+            .values(
+                status=JOB_PROCESSING,
+                attempts=EmailJob.attempts + 1,
+                visible_at=now + timedelta(seconds=self.visibility_seconds),
+                locked_by=worker_id,
+                updated_at=now
+            )
+            .returning(EmailJob.id, EmailJob.message_id, EmailJob.attempts, EmailJob.payload)
+            .execution_options(synchronize_session=False)
+        )
+        jobs = [
+            {"id": row.id, "message_id": row.message_id, "attempts": row.attempts, "email": json.loads(row.payload)}
+            for row in result
+        ]
+        await self.db.commit()
+        EMAIL_JOBS.inc(len(jobs), event="claimed")
+        return jobs
+
+    async def _dead_letter_exhausted(self, now: datetime) -> None:
+        # Trabajos cuyo worker murió en el último intento permitido
+        result = await self.db.execute(
+            update(EmailJob)
+            .where(
+                EmailJob.status == JOB_PROCESSING,
+                EmailJob.visible_at <= now,
+                EmailJob.attempts >= self.max_attempts
+            )
+            .values(
+                status=JOB_DEAD,
+                locked_by=None,
+                last_error="Visibilidad vencida en el último intento",
+                updated_at=now
+            )
+            .returning(EmailJob.message_id)
+            .execution_options(synchronize_session=False)
+        )
+        dead = result.scalars().all()
+        if dead:
+            await self.db.commit()
+            EMAIL_JOBS.inc(len(dead), event="dead")
+            logger.error(f"{len(dead)} trabajos de correo movidos a la cola de fallidos: {', '.join(dead)}")
+
+    async def complete(self, job_ids: List[int]) -> None:
+        if not job_ids:
+            return
+        await self.db.execute(
+            update(EmailJob)
+            .where(EmailJob.id.in_(job_ids))
+            .values(status=JOB_DONE, locked_by=None, last_error=None, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        EMAIL_JOBS.inc(len(job_ids), event="done")
+
+    async def retry(self, job: Dict[str, Any], error: str, count_attempt: bool = True) -> str:
+        """
+        Devuelve el trabajo a la cola con espera exponencial, o lo mueve a fallidos si
+        agotó los intentos. Con count_attempt=False (p. ej. el LLM no está disponible)
+        el intento no cuenta para el límite.
+        """
+        now = datetime.utcnow()
+        attempts = job["attempts"] if count_attempt else job["attempts"] - 1
+        if attempts >= self.max_attempts:
+            values = {"status": JOB_DEAD}
+            event = "dead"
+            logger.error(f"Trabajo de correo {job['message_id']} movido a fallidos tras {attempts} intentos: {error}")
+        else:
+            delay = self.retry_base_seconds * 2 ** max(0, attempts - 1)
+            values = {"status": JOB_PENDING, "visible_at": now + timedelta(seconds=delay)}
+            event = "retried"
+        await self.db.execute(
+            update(EmailJob)
+            .where(EmailJob.id == job["id"])
+            .values(**values, attempts=attempts, locked_by=None, last_error=error, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        EMAIL_JOBS.inc(event=event)
+        return values["status"]
+
+    async def requeue_dead(self, job_id: int) -> bool:
+        result = await self.db.execute(
+            update(EmailJob)
+            .where(EmailJob.id == job_id, EmailJob.status == JOB_DEAD)
+            .values(status=JOB_PENDING, attempts=0, visible_at=datetime.utcnow(), updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        return result.rowcount > 0
+
+    async def stats(self) -> Dict[str, Any]:
+        result = await self.db.execute(
+            select(EmailJob.status, func.count(EmailJob.id)).group_by(EmailJob.status)
+        )
+        counts = {status: 0 for status in (JOB_PENDING, JOB_PROCESSING, JOB_DONE, JOB_DEAD)}
+        counts.update({status: count for status, count in result.all()})
+        oldest = await self.db.execute(
+            select(func.min(EmailJob.received_at)).where(EmailJob.status == JOB_PENDING)
+        )
+        oldest_pending = oldest.scalar()
+        return {
+            "counts": counts,
+            "oldest_pending_received_at": oldest_pending.isoformat() if oldest_pending else None
+        }
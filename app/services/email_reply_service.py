@@ -0,0 +1,166 @@
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.email_reply import EmailReply, REPLY_DELIVERED, REPLY_FAILED, REPLY_PENDING, REPLY_SENDING
+from app.core.config import settings
+from app.core.metrics import EMAIL_REPLIES
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _as_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "message_id": row.message_id,
+        "to": row.recipient,
+        "subject": row.subject,
+        "body": row.body,
+        "status": row.action_status,
+        "message": row.action_message,
+        "sent": row.sent,
+        "marked_read": row.marked_read,
+        "delivery_status": row.status,
+        "attempts": row.attempts
+    }
+
+class EmailReplyService:
+    """
+    Bandeja de salida de las respuestas cuya entrega falló (tabla email_replies).
+    Guarda la respuesta ya construida y el resultado de la acción para que un
+    reintento repita solo el envío o el marcado como leído, nunca la acción.
+    Cada entrega se reclama antes de intentarla, así que dos procesos no envían
+    la misma respuesta a la vez.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        max_attempts: int = settings.EMAIL_REPLY_MAX_ATTEMPTS,
+        retry_base_seconds: float = settings.EMAIL_REPLY_RETRY_BASE_SECONDS,
+        sending_timeout_seconds: float = 300.0
+    ):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.sending_timeout_seconds = sending_timeout_seconds
+
+    async def save_pending(self, replies: List[Dict[str, Any]]) -> None:
+        """
+        Guarda las respuestas no entregadas. Cada elemento lleva "message_id", "to",
+        "subject", "body", "status", "message", "sent", "marked_read" y "error".
+        """
+        if not replies:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {
+                "message_id": reply["message_id"],
+                "recipient": reply["to"],
+                "subject": reply["subject"],
+                "body": reply["body"],
+                "action_status": reply["status"],
+                "action_message": reply.get("message"),
+                "sent": reply["sent"],
+                "marked_read": reply["marked_read"],
+                "status": REPLY_PENDING,
+                "attempts": 1,
+                "next_attempt_at": now + timedelta(seconds=self.retry_base_seconds),
+                "last_error": reply.get("error"),
+                "created_at": now,
+                "updated_at": now
+            }
+            for reply in replies
+        ]
+        dialect = self.db.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        # Si ya existe, la respuesta guardada es la que vale: no se reconstruye
+        stmt = insert(EmailReply).on_conflict_do_nothing(index_elements=[EmailReply.message_id])
+        await self.db.execute(stmt, rows)
+        await self.db.commit()
+        EMAIL_REPLIES.inc(len(rows), event="pending")
+
+    async def get_by_message_ids(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not message_ids:
+            return {}
+        result = await self.db.execute(select(EmailReply).where(EmailReply.message_id.in_(message_ids)))
+        return {row.message_id: _as_dict(row) for row in result.scalars()}
+
+    async def claim(
+        self,
+        message_ids: Optional[List[str]] = None,
+        limit: int = 50,
+        now: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Reclama respuestas pendientes para entregarlas: las de message_ids sin esperar
+        a su próximo intento, o si no se indican, las que ya tocan. Una entrega que
+        quedó a medias (proceso caído) se puede reclamar pasado sending_timeout_seconds.
+        """
+        now = now or datetime.utcnow()
+        stale = and_(
+            EmailReply.status == REPLY_SENDING,
+            EmailReply.updated_at <= now - timedelta(seconds=self.sending_timeout_seconds)
+        )
+        if message_ids is not None:
+            if not message_ids:
+                return []
+            condition = and_(
+                EmailReply.message_id.in_(message_ids),
+                or_(EmailReply.status == REPLY_PENDING, stale)
+            )
+        else:
+            condition = or_(
+                and_(EmailReply.status == REPLY_PENDING, EmailReply.next_attempt_at <= now),
+                stale
+            )
+        claimable_ids = (
+            select(EmailReply.id)
+            .where(condition)
+            .order_by(EmailReply.next_attempt_at, EmailReply.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.db.execute(
+            update(EmailReply)
+            .where(EmailReply.id.in_(claimable_ids), or_(EmailReply.status == REPLY_PENDING, stale))
+            .values(status=REPLY_SENDING, updated_at=now)
+            .returning(EmailReply)
+            .execution_options(synchronize_session=False)
+        )
+        replies = [_as_dict(row) for row in result.scalars()]
+        await self.db.commit()
+        return replies
+
+    async def finish(self, reply: Dict[str, Any], sent: bool, marked_read: bool, error: Optional[str] = None) -> str:
+        """
+        Registra el resultado de una entrega reclamada: entregada, de vuelta a
+        pendiente con espera exponencial, o fallida si agotó los intentos.
+        """
+        now = datetime.utcnow()
+        values: Dict[str, Any] = {"sent": sent, "marked_read": marked_read, "updated_at": now}
+        if sent and marked_read:
+            values.update(status=REPLY_DELIVERED, last_error=None)
+            event = "delivered"
+        else:
+            attempts = reply["attempts"] + 1
+            values.update(attempts=attempts, last_error=error)
+            if attempts >= self.max_attempts:
+                values["status"] = REPLY_FAILED
+                event = "failed"
+                logger.error(f"Respuesta al correo {reply['message_id']} descartada tras {attempts} intentos: {error}")
+            else:
+                delay = self.retry_base_seconds * 2 ** (attempts - 1)
+                values.update(status=REPLY_PENDING, next_attempt_at=now + timedelta(seconds=delay))
+                event = "retried"
+        await self.db.execute(
+            update(EmailReply)
+            .where(EmailReply.id == reply["id"])
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        EMAIL_REPLIES.inc(event=event)
+        return values["status"]
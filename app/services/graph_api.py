@@ -1,16 +1,30 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from msgraph.core import GraphClient
-from azure.identity import ClientSecretCredential
 from app.core.config import settings
 from app.core.graph_config import GraphSettings
+from app.core.logging_config import Payload, mask_email
+from app.core.metrics import GRAPH_RESPONSES
+from app.services.token_cache import CachedTokenCredential, get_token_cache
 import logging
 import asyncio
-import json
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+GRAPH_PAGE_SIZE = 50
+GRAPH_BATCH_LIMIT = 20
+
+class GraphRequestError(Exception):
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Graph API respondió {status_code}: {detail}")
+        self.status_code = status_code
+
+class GraphSyncStateExpired(GraphRequestError):
+
+    def __init__(self, detail: str):
+        super().__init__(410, detail)
+
 class GraphAPIService:
 
     def __init__(self):
@@ -18,26 +32,24 @@ class GraphAPIService:
         logger.info("Inicializando GraphAPIService con las siguientes credenciales:")
         logger.info(f"Tenant ID: {self.settings.AZURE_TENANT_ID}")
         logger.info(f"Client ID: {self.settings.AZURE_CLIENT_ID}")
-        logger.info(f"Email: {self.settings.EMAIL_ADDRESS}")
+        logger.info(f"Email: {mask_email(self.settings.EMAIL_ADDRESS)}")
         
         self.scopes = [
             "https://graph.microsoft.com/.default"
         ]
         
         try:
-            self.credential = ClientSecretCredential(
+            self.token_cache = get_token_cache(
                 tenant_id=self.settings.AZURE_TENANT_ID,
                 client_id=self.settings.AZURE_CLIENT_ID,
-                client_secret=self.settings.AZURE_CLIENT_SECRET
+                client_secret=self.settings.AZURE_CLIENT_SECRET,
+                scope=self.scopes[0]
             )
-            
-            token = self.credential.get_token(self.scopes[0])
-            logger.info("Token obtenido exitosamente")
-            logger.info(f"Token expira en: {token.expires_on}")
+            self.credential = CachedTokenCredential(self.token_cache)
             
             self.client = GraphClient(credential=self.credential)
             self.email_address = self.settings.EMAIL_ADDRESS
-            logger.info(f"GraphAPIService inicializado para {self.email_address}")
+            logger.info(f"GraphAPIService inicializado para {mask_email(self.email_address)}")
             
         except Exception as e:
             logger.error(f"Error al inicializar GraphAPIService: {str(e)}")
@@ -46,10 +58,7 @@ class GraphAPIService:
     async def _get_valid_token(self):
 
         try:
-            token = self.credential.get_token(self.scopes[0])
-            logger.info("Token obtenido exitosamente")
-            logger.info(f"Token expira en: {token.expires_on}")
-            return token
+            return await self.token_cache.get_token()
         except Exception as e:
             logger.error(f"Error al obtener token: {str(e)}")
             raise
@@ -72,56 +81,175 @@ class GraphAPIService:
                 "$filter": f"receivedDateTime ge {filter_date} and isRead eq false",
                 "$select": "id,subject,body,from,receivedDateTime",
                 "$orderby": "receivedDateTime desc",
-                "$top": 10
+                "$top": 50
             }
             
-            logger.info(f"Endpoint: {endpoint}")
-            logger.info(f"Parámetros de búsqueda: {params}")
+            logger.debug("Endpoint: %s", Payload(endpoint))
+            logger.debug("Parámetros de búsqueda: %s", Payload(params))
 
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.get(endpoint, params=params)
-            )
-            
-            if response.status_code == 200:
-                emails = response.json().get('value', [])
-                logger.info(f"Se encontraron {len(emails)} correos no leídos")
-                for email in emails:
-                    logger.info(f"Correo encontrado - Asunto: {email.get('subject')}, De: {email.get('from', {}).get('emailAddress', {}).get('address')}")
-                return emails
-            else:
-                logger.error(f"Error al obtener correos. Código de estado: {response.status_code}")
-                logger.error(f"Respuesta: {response.text}")
-                return []
+            emails, _ = await self._get_all_pages(endpoint, params)
+            logger.info(f"Se encontraron {len(emails)} correos no leídos")
+            for email in emails:
+                logger.debug(
+                    "Correo encontrado - Asunto: %s, De: %s",
+                    Payload(email.get("subject")), Payload(email.get("from", {}).get("emailAddress", {}).get("address"))
+                )
+            return emails
                 
         except Exception as e:
             logger.error(f"Error al obtener correos no leídos: {str(e)}")
             return []
 
+    async def get_new_emails(self, delta_link: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Sincronización incremental de la bandeja de entrada mediante messages/delta.
+        Devuelve los correos no leídos nuevos o modificados y el deltaLink para la
+        siguiente consulta (None si la sincronización falló).
+        """
+        try:
+            await self._get_valid_token()
+
+            if delta_link:
+                endpoint, params = delta_link, None
+            else:
+                filter_date = (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%SZ")
+                logger.info(f"Iniciando sincronización delta desde {filter_date}")
+                endpoint = f"/users/{self.email_address}/mailFolders/inbox/messages/delta"
+                params = {
+                    "$filter": f"receivedDateTime ge {filter_date}",
+                    "$select": "id,subject,body,from,receivedDateTime,isRead"
+                }
+
+            try:
+                messages, new_delta_link = await self._get_all_pages(endpoint, params)
+            except GraphSyncStateExpired:
+                logger.warning("El deltaLink expiró, reiniciando la sincronización")
+                return await self.get_new_emails(None) if delta_link else ([], None)
+
+            emails = [
+                message for message in messages
+                if "@removed" not in message and message.get("isRead") is False
+            ]
+            logger.info(f"Sincronización delta: {len(messages)} cambios, {len(emails)} correos no leídos")
+            return emails, new_delta_link
+
+        except Exception as e:
+            logger.error(f"Error en la sincronización delta: {str(e)}")
+            return [], None
+
+    async def get_messages(self, message_ids: List[str]) -> List[dict]:
+        """
+        Obtiene por id, con peticiones $batch, los mensajes indicados en las
+        notificaciones de cambios. Solo devuelve los que siguen sin leer.
+        """
+        requests = [
+            {
+                "id": str(index),
+                "method": "GET",
+                "url": f"/users/{self.email_address}/messages/{message_id}?$select=id,subject,body,from,receivedDateTime,isRead"
+            }
+            for index, message_id in enumerate(dict.fromkeys(message_ids))
+        ]
+        responses = await self.execute_batch(requests)
+        emails = []
+        for request, message_id in zip(requests, dict.fromkeys(message_ids)):
+            response = responses[request["id"]]
+            if response["status"] != 200:
+                logger.error(f"Error al obtener el mensaje notificado {message_id}: {response['status']}")
+                continue
+            message = response.get("body") or {}
+            if message.get("isRead") is False:
+                emails.append(message)
+        logger.info(f"Obtenidos {len(emails)} de {len(requests)} mensajes notificados sin leer")
+        return emails
+
+    async def create_subscription(self, notification_url: str, client_state: str, expiration: datetime) -> dict:
+        """Suscripción a los mensajes nuevos de la bandeja de entrada (notificaciones de cambios de Graph)."""
+        await self._get_valid_token()
+        subscription = {
+            "changeType": "created",
+            "notificationUrl": notification_url,
+            "resource": f"/users/{self.email_address}/mailFolders('inbox')/messages",
+            "expirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z"),
+            "clientState": client_state
+        }
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(None, lambda: self.client.post("/subscriptions", json=subscription))
+        GRAPH_RESPONSES.inc(operation="create_subscription", status=str(response.status_code))
+        if response.status_code != 201:
+            logger.error("Error al crear la suscripción: %s", Payload(response.text))
+            raise GraphRequestError(response.status_code, response.text)
+        return response.json()
+
+    async def renew_subscription(self, subscription_id: str, expiration: datetime) -> dict:
+        await self._get_valid_token()
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(
+            None,
+            lambda: self.client.patch(
+                f"/subscriptions/{subscription_id}",
+                json={"expirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")}
+            )
+        )
+        GRAPH_RESPONSES.inc(operation="renew_subscription", status=str(response.status_code))
+        if response.status_code != 200:
+            logger.error("Error al renovar la suscripción: %s", Payload(response.text))
+            raise GraphRequestError(response.status_code, response.text)
+        return response.json()
+
+    async def _get_all_pages(self, endpoint: str, params: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        """Sigue @odata.nextLink hasta agotar los resultados y devuelve el @odata.deltaLink si existe."""
+        items = []
+        delta_link = None
+        loop = asyncio.get_event_loop()
+        url, query = endpoint, params
+
+        while url:
+            response = await loop.run_in_executor(
+                None,
+                lambda: self.client.get(url, params=query, headers={"Prefer": f"odata.maxpagesize={GRAPH_PAGE_SIZE}"})
+            )
+            GRAPH_RESPONSES.inc(operation="list_messages", status=str(response.status_code))
+            if response.status_code == 410:
+                raise GraphSyncStateExpired(response.text)
+            if response.status_code != 200:
+                logger.error(f"Error al obtener correos. Código de estado: {response.status_code}")
+                logger.error("Respuesta: %s", Payload(response.text))
+                raise GraphRequestError(response.status_code, response.text)
+
+            data = response.json()
+            items.extend(data.get("value", []))
+            url, query = data.get("@odata.nextLink"), None
+            delta_link = data.get("@odata.deltaLink")
+
+        return items, delta_link
+
+    def _build_message(self, to: str, subject: str, body: str) -> dict:
+        return {
+            "message": {
+                "subject": subject,
+                "body": {
+                    "contentType": "HTML",
+                    "content": body
+                },
+                "toRecipients": [
+                    {
+                        "emailAddress": {
+                            "address": to
+                        }
+                    }
+                ]
+            }
+        }
+
     async def send_email(self, to: str, subject: str, body: str) -> bool:
 
         try:
-            logger.info(f"Enviando correo a {to}")
+            logger.info(f"Enviando correo a {mask_email(to)}")
             
             await self._get_valid_token()
 
-            message = {
-                "message": {
-                    "subject": subject,
-                    "body": {
-                        "contentType": "HTML",
-                        "content": body
-                    },
-                    "toRecipients": [
-                        {
-                            "emailAddress": {
-                                "address": to
-                            }
-                        }
-                    ]
-                }
-            }
+            message = self._build_message(to, subject, body)
             
             loop = asyncio.get_event_loop()
             response = await loop.run_in_executor(
@@ -132,17 +260,18 @@ class GraphAPIService:
                 )
             )
             
+            GRAPH_RESPONSES.inc(operation="send_mail", status=str(response.status_code))
             success = response.status_code == 202
             if success:
-                logger.info(f"Correo enviado exitosamente a {to}")
+                logger.info(f"Correo enviado exitosamente a {mask_email(to)}")
             else:
-                logger.error(f"Error al enviar correo a {to}: {response.status_code}")
+                logger.error(f"Error al enviar correo a {mask_email(to)}: {response.status_code}")
                 try:
                     error_details = response.json()
-                    logger.error(f"Detalles del error: {json.dumps(error_details, indent=2)}")
+                    logger.error("Detalles del error: %s", Payload(error_details))
                 except:
-                    logger.error(f"Respuesta: {response.text}")
-                    logger.error(f"URL: {response.url}")
+                    logger.error("Respuesta: %s", Payload(response.text))
+                    logger.error("URL: %s", Payload(str(response.url)))
             return success
         except Exception as e:
             logger.error(f"Error al enviar correo: {str(e)}")
@@ -164,6 +293,7 @@ class GraphAPIService:
                 )
             )
             
+            GRAPH_RESPONSES.inc(operation="mark_read", status=str(response.status_code))
             success = response.status_code == 200
             if success:
                 logger.info(f"Correo {email_id} marcado como leído")
@@ -171,11 +301,99 @@ class GraphAPIService:
                 logger.error(f"Error al marcar correo como leído: {response.status_code}")
                 try:
                     error_details = response.json()
-                    logger.error(f"Detalles del error: {json.dumps(error_details, indent=2)}")
+                    logger.error("Detalles del error: %s", Payload(error_details))
                 except:
-                    logger.error(f"Respuesta: {response.text}")
-                    logger.error(f"URL: {response.url}")
+                    logger.error("Respuesta: %s", Payload(response.text))
+                    logger.error("URL: %s", Payload(str(response.url)))
             return success
         except Exception as e:
             logger.error(f"Error al marcar correo como leído: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    async def execute_batch(self, requests: List[dict]) -> Dict[str, dict]:
+        """
+        Envía las sub-peticiones en bloques JSON $batch de hasta 20 elementos.
+        Devuelve las respuestas indexadas por el id de cada sub-petición; las que
+        no obtuvieron respuesta quedan con status 0.
+        """
+        responses = {request["id"]: {"id": request["id"], "status": 0} for request in requests}
+        if not requests:
+            return responses
+
+        await self._get_valid_token()
+        loop = asyncio.get_event_loop()
+
+        for chunk in self._batch_chunks(requests):
+            try:
+                response = await loop.run_in_executor(
+                    None,
+                    lambda: self.client.post("/$batch", json={"requests": chunk})
+                )
+                GRAPH_RESPONSES.inc(operation="batch", status=str(response.status_code))
+                if response.status_code != 200:
+                    logger.error(f"Error en la petición $batch: {response.status_code}")
+                    logger.error("Respuesta: %s", Payload(response.text))
+                    continue
+                for item in response.json().get("responses", []):
+                    GRAPH_RESPONSES.inc(operation="batch_item", status=str(item.get("status")))
+                    responses[item["id"]] = item
+            except Exception as e:
+                logger.error(f"Error al ejecutar la petición $batch: {str(e)}")
+
+        return responses
+
+    def _batch_chunks(self, requests: List[dict]) -> List[List[dict]]:
+        """
+        Bloques de hasta GRAPH_BATCH_LIMIT sub-peticiones. Graph solo resuelve dependsOn
+        dentro del mismo $batch, así que una sub-petición no se separa de la anterior
+        si depende de ella.
+        """
+        chunks: List[List[dict]] = [[]]
+        for request in requests:
+            if len(chunks[-1]) >= GRAPH_BATCH_LIMIT:
+                carried = []
+                if chunks[-1][-1]["id"] in request.get("dependsOn", ()):
+                    carried.append(chunks[-1].pop())
+                chunks.append(carried)
+            chunks[-1].append(request)
+        return [chunk for chunk in chunks if chunk]
+
+    async def send_replies_and_mark_read(self, items: List[dict]) -> List[dict]:
+        """
+        Agrupa el envío de respuestas y el marcado como leído en peticiones $batch.
+        Cada elemento lleva "to", "subject", "body" y opcionalmente "email_id";
+        el resultado indica por elemento si se envió la respuesta y si se marcó como leído.
+        El marcado depende del envío: si la respuesta falla, el correo sigue sin leer.
+        """
+        requests = []
+        for index, item in enumerate(items):
+            requests.append({
+                "id": f"send-{index}",
+                "method": "POST",
+                "url": f"/users/{self.email_address}/sendMail",
+                "headers": {"Content-Type": "application/json"},
+                "body": self._build_message(item["to"], item["subject"], item["body"])
+            })
+            if item.get("email_id"):
+                requests.append({
+                    "id": f"read-{index}",
+                    "dependsOn": [f"send-{index}"],
+                    "method": "PATCH",
+                    "url": f"/users/{self.email_address}/messages/{item['email_id']}",
+                    "headers": {"Content-Type": "application/json"},
+                    "body": {"isRead": True}
+                })
+
+        logger.info(f"Enviando {len(items)} respuestas en {len(requests)} sub-peticiones $batch")
+        responses = await self.execute_batch(requests)
+
+        results = []
+        for index, item in enumerate(items):
+            sent = responses[f"send-{index}"]["status"] == 202
+            marked_read = responses[f"read-{index}"]["status"] == 200 if item.get("email_id") else False
+            if not sent:
+                logger.error(f"Error al enviar correo a {mask_email(item['to'])}: {responses[f'send-{index}']['status']}")
+            if item.get("email_id") and not marked_read:
+                logger.error(f"Error al marcar correo {item['email_id']} como leído: {responses[f'read-{index}']['status']}")
+            results.append({"email_id": item.get("email_id"), "sent": sent, "marked_read": marked_read})
+        return results
@@ -0,0 +1,218 @@
+"""
+Extracción de texto de los cuerpos de correo. El HTML se recorre en streaming con
+html.parser, sin construir el árbol, y el análisis se detiene al alcanzar el
+presupuesto de caracteres.
+"""
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+from app.core.config import settings
+import asyncio
+import re
+
+TEXT_CONTENT_TYPE = "text"
+
+# Elementos cuyo contenido nunca es texto visible del correo
+SKIPPED_TAGS = frozenset({"script", "style", "head", "title", "noscript", "template", "svg", "object", "iframe"})
+
+# Elementos sin etiqueta de cierre: nunca abren una zona oculta
+VOID_TAGS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"
+})
+
+# Elementos que separan líneas en el texto resultante
+BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "footer", "h1", "h2", "h3",
+    "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul"
+})
+
+# Elementos con cierre implícito: sin su etiqueta de cierre los termina la apertura de
+# otro elemento o el cierre de su contenedor. Sin tenerlo en cuenta, un <p> oculto sin
+# </p> ocultaría el resto del documento
+P_CLOSING_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "details", "dialog", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hgroup", "hr",
+    "li", "main", "menu", "nav", "ol", "p", "pre", "section", "table", "ul"
+})
+IMPLIED_END_BY_START = {
+    "p": P_CLOSING_TAGS,
+    "li": frozenset({"li"}),
+    "dt": frozenset({"dt", "dd"}),
+    "dd": frozenset({"dt", "dd"}),
+    "td": frozenset({"td", "th", "tr", "tbody", "thead", "tfoot"}),
+    "th": frozenset({"td", "th", "tr", "tbody", "thead", "tfoot"}),
+    "tr": frozenset({"tr", "tbody", "thead", "tfoot"}),
+}
+IMPLIED_END_BY_END = {
+    "p": frozenset({
+        "article", "aside", "blockquote", "body", "dd", "details", "div", "dt", "fieldset", "figure", "footer",
+        "form", "header", "html", "li", "main", "nav", "section", "td", "th"
+    }),
+    "li": frozenset({"ul", "ol", "menu", "body", "html"}),
+    "dt": frozenset({"dl", "body", "html"}),
+    "dd": frozenset({"dl", "body", "html"}),
+    "td": frozenset({"tr", "tbody", "thead", "tfoot", "table", "body", "html"}),
+    "th": frozenset({"tr", "tbody", "thead", "tfoot", "table", "body", "html"}),
+    "tr": frozenset({"tbody", "thead", "tfoot", "table", "body", "html"}),
+}
+# Contenedores que, abiertos dentro del elemento oculto, tienen sus propios elementos
+# con cierre implícito (una lista dentro de un <li>, una tabla dentro de un <td>)
+NESTED_SCOPE_TAGS = {
+    "li": frozenset({"ul", "ol", "menu"}),
+    "dt": frozenset({"dl"}),
+    "dd": frozenset({"dl"}),
+    "td": frozenset({"table"}),
+    "th": frozenset({"table"}),
+    "tr": frozenset({"table"}),
+}
+
+HIDDEN_STYLE_PATTERN = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all", re.I)
+INLINE_SPACE_PATTERN = re.compile(r"[^\S\n]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Tamaño de los trozos entregados al parser; tras agotar el presupuesto se analiza como mucho uno más
+FEED_CHUNK_CHARS = 16 * 1024
+
+def _is_hidden(attrs: List[Tuple[str, Optional[str]]]) -> bool:
+    for name, value in attrs:
+        if name == "hidden":
+            return True
+        if name == "style" and value and HIDDEN_STYLE_PATTERN.search(value):
+            return True
+    return False
+
+def _pop_to(stack: List[str], tag: str) -> None:
+    """Cierra el último tag abierto con ese nombre y los que quedaron abiertos dentro."""
+    del stack[len(stack) - 1 - stack[::-1].index(tag):]
+
+class HtmlTextExtractor(HTMLParser):
+    """
+    Convierte HTML en texto con un salto de línea por bloque. Omite scripts, estilos
+    y elementos ocultos (los preencabezados de los correos de marketing) y deja de
+    acumular texto al llegar a max_chars.
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.truncated = False
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._scope_depth = 0
+        # Elementos visibles abiertos y los abiertos dentro del elemento oculto: el
+        # cierre de un ancestro termina también un elemento oculto sin cerrar (<span>)
+        self._open: List[str] = []
+        self._skip_open: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self._skip_tag is not None:
+            if not self._scope_depth and tag in IMPLIED_END_BY_START.get(self._skip_tag, ()):
+                # La nueva etiqueta cierra el elemento oculto y se trata con normalidad
+                self._end_skip()
+            else:
+                if tag in NESTED_SCOPE_TAGS.get(self._skip_tag, ()):
+                    self._scope_depth += 1
+                elif tag == self._skip_tag and tag not in IMPLIED_END_BY_START:
+                    self._skip_depth += 1
+                elif tag not in VOID_TAGS:
+                    self._skip_open.append(tag)
+                return
+        if tag not in VOID_TAGS and (tag in SKIPPED_TAGS or _is_hidden(attrs)):
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+        if tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        # <div/> o <br/>: no abre contenido, solo cuenta como separador
+        if self._skip_tag is None and tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._skip_tag is not None:
+            if self._scope_depth:
+                if tag in NESTED_SCOPE_TAGS.get(self._skip_tag, ()):
+                    self._scope_depth -= 1
+                return
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._end_skip()
+                return
+            if tag in self._skip_open:
+                _pop_to(self._skip_open, tag)
+                return
+            if tag not in IMPLIED_END_BY_END.get(self._skip_tag, ()) and tag not in self._open:
+                return
+            # El cierre del contenedor cierra también el elemento oculto
+            self._end_skip()
+        if tag in self._open:
+            _pop_to(self._open, tag)
+        if tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def _end_skip(self) -> None:
+        self._skip_tag = None
+        self._skip_depth = 0
+        self._scope_depth = 0
+        self._skip_open = []
+        # Evita pegar las palabras de ambos lados del elemento omitido
+        self._append(" ")
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_tag is None and not self.truncated:
+            self._append(WHITESPACE_PATTERN.sub(" ", data))
+
+    def _append(self, text: str) -> None:
+        if self.truncated or not text:
+            return
+        remaining = self.max_chars - self.length
+        if len(text) >= remaining:
+            text = text[:remaining]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def text(self) -> str:
+        return normalize_lines("".join(self.parts))
+
+def normalize_lines(text: str) -> str:
+    """Colapsa los espacios de cada línea y elimina las líneas vacías."""
+    lines = (INLINE_SPACE_PATTERN.sub(" ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+def html_to_text(html: str, max_chars: int = settings.EMAIL_TEXT_MAX_CHARS) -> str:
+    extractor = HtmlTextExtractor(max_chars)
+    for start in range(0, len(html), FEED_CHUNK_CHARS):
+        extractor.feed(html[start:start + FEED_CHUNK_CHARS])
+        if extractor.truncated:
+            return extractor.text()
+    extractor.close()
+    return extractor.text()
+
+def plain_text(text: str, max_chars: int = settings.EMAIL_TEXT_MAX_CHARS) -> str:
+    return normalize_lines(text[:max_chars])
+
+def extract_text(content: str, content_type: Optional[str] = "html", max_chars: int = settings.EMAIL_TEXT_MAX_CHARS) -> str:
+    """
+    Texto de un cuerpo de correo de Graph. Si contentType es "text", o el contenido
+    no tiene etiquetas, se evita el parser.
+    """
+    if (content_type or "").lower() == TEXT_CONTENT_TYPE or "<" not in content:
+        return plain_text(content, max_chars)
+    return html_to_text(content, max_chars)
+
+async def extract_text_async(
+    content: str,
+    content_type: Optional[str] = "html",
+    max_chars: int = settings.EMAIL_TEXT_MAX_CHARS,
+    offload_chars: int = settings.EMAIL_HTML_OFFLOAD_CHARS
+) -> str:
+    """Como extract_text, pero el HTML grande se analiza en un hilo para no bloquear el bucle de eventos."""
+    if len(content) > offload_chars and (content_type or "").lower() != TEXT_CONTENT_TYPE:
+        return await asyncio.to_thread(extract_text, content, content_type, max_chars)
+    return extract_text(content, content_type, max_chars)
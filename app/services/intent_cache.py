@@ -0,0 +1,126 @@
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.intent_cache_entry import IntentCacheEntry
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+def normalize_content(content: str) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados."""
+    text = unicodedata.normalize("NFKD", content.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", text).strip()
+
+def content_key(content: str) -> str:
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+class IntentCache:
+    """
+    Caché de clasificaciones de intención indexada por el hash del contenido normalizado.
+    Nivel en memoria con desalojo LRU y TTL; opcionalmente un nivel en base de datos
+    que sobrevive a reinicios y se comparte entre workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.INTENT_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = settings.INTENT_CACHE_TTL_SECONDS,
+        db_enabled: bool = settings.INTENT_CACHE_DB_ENABLED,
+        session_factory: async_sessionmaker = AsyncSessionLocal
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_enabled = db_enabled
+        self.session_factory = session_factory
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, content: str) -> Optional[Dict[str, Any]]:
+        key = content_key(content)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            action_data, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(action_data)
+            del self._entries[key]
+
+        if self.db_enabled:
+            action_data = await self._get_from_db(key)
+            if action_data is not None:
+                self._store(key, action_data)
+                self.hits += 1
+                self.db_hits += 1
+                return dict(action_data)
+
+        self.misses += 1
+        return None
+
+    async def set(self, content: str, action_data: Dict[str, Any]) -> None:
+        key = content_key(content)
+        self._store(key, action_data)
+        if self.db_enabled:
+            await self._set_in_db(key, action_data)
+
+    def _store(self, key: str, action_data: Dict[str, Any]) -> None:
+        self._entries[key] = (dict(action_data), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _get_from_db(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            async with self.session_factory() as db:
+                entry = await db.get(IntentCacheEntry, key)
+                if entry is None or entry.expires_at <= datetime.utcnow():
+                    return None
+                return json.loads(entry.action)
+        except Exception as e:
+            logger.error(f"Error al leer la caché de intenciones: {str(e)}")
+            return None
+
+    async def _set_in_db(self, key: str, action_data: Dict[str, Any]) -> None:
+        try:
+            async with self.session_factory() as db:
+                await db.merge(IntentCacheEntry(
+                    key=key,
+                    action=json.dumps(action_data, ensure_ascii=False),
+                    created_at=datetime.utcnow(),
+                    expires_at=datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error al guardar en la caché de intenciones: {str(e)}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "db_enabled": self.db_enabled
+        }
+
+intent_cache = IntentCache()
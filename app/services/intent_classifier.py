@@ -0,0 +1,158 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+from app.core.logging_config import Payload
+from app.services.intent_cache import normalize_content
+from app.services.title_index import normalize_title
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+TitleResolver = Callable[[str], Awaitable[Optional[str]]]
+
+QUOTED_TITLE_PATTERN = re.compile(r'"([^"]{2,200})"|“([^”]{2,200})”|«([^»]{2,200})»|\'([^\']{2,200})\'')
+
+# Confianza de una regla según si el título se encontró en el catálogo
+CONFIDENCE_WITH_CATALOG_MATCH = 0.97
+CONFIDENCE_WITHOUT_CATALOG_MATCH = 0.75
+
+def extract_quoted_title(content: str) -> Optional[str]:
+    match = QUOTED_TITLE_PATTERN.search(content)
+    if not match:
+        return None
+    title = next(group for group in match.groups() if group)
+    return title.strip()
+
+class IntentRule:
+    """
+    Regla local: un patrón sobre el contenido normalizado que identifica una acción.
+    Con exact_title (acciones destructivas) el título del correo nunca se sustituye
+    por uno aproximado del catálogo y solo una coincidencia exacta da confianza alta.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        action: str,
+        pattern: str,
+        requires_title: bool = True,
+        confidence: float = 0.95,
+        exact_title: bool = False
+    ):
+        self.name = name
+        self.action = action
+        self.pattern = re.compile(pattern)
+        self.requires_title = requires_title
+        self.confidence = confidence
+        self.exact_title = exact_title
+
+    def matches(self, normalized_content: str) -> bool:
+        return bool(self.pattern.search(normalized_content))
+
+DEFAULT_RULES = [
+    IntentRule(
+        "eliminar_libro", "ELIMINAR_LIBRO",
+        r"\b(eliminar|borrar|quitar|dar de baja) (el|este) libro\b|\b(eliminar|borrar|quitar)\b.*\bde la biblioteca\b",
+        exact_title=True
+    ),
+    IntentRule(
+        "eliminar_reserva", "ELIMINAR",
+        r"\b(eliminar|cancelar|anular|borrar)\b.*\breserva\b"
+    ),
+    IntentRule(
+        "renovar", "RENOVAR",
+        r"\brenov(ar|acion|arme|ame|ar la reserva)\b"
+    ),
+    IntentRule(
+        "reservar", "RESERVAR",
+        r"\b(reservar|reservarme|reservame|quiero reservar|apartar|prestamo de)\b"
+    ),
+    IntentRule(
+        "listar", "LISTAR",
+        r"\b(lista|listar|listado|catalogo)\b.*\blibros?\b|\bque libros (hay|tienen|estan)\b|\bver (todos )?los libros\b",
+        requires_title=False
+    ),
+]
+
+class LocalIntentClassifier:
+    """
+    Clasificador determinista previo al LLM. Aplica reglas de palabras clave y extrae
+    el título entrecomillado validándolo contra el catálogo. Devuelve None cuando la
+    confianza no supera el umbral, para que el correo pase al LLM.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[List[IntentRule]] = None,
+        threshold: float = settings.LOCAL_CLASSIFIER_THRESHOLD,
+        enabled: bool = settings.LOCAL_CLASSIFIER_ENABLED
+    ):
+        self.rules = rules if rules is not None else list(DEFAULT_RULES)
+        self.threshold = threshold
+        self.enabled = enabled
+        self.hits = 0
+        self.fallthroughs = 0
+        self.hits_by_rule: Dict[str, int] = {}
+
+    async def classify(self, content: str, resolve_title: TitleResolver) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        result = await self._classify(content, resolve_title)
+        if result is None or result["confidence"] < self.threshold:
+            self.fallthroughs += 1
+            return None
+
+        self.hits += 1
+        self.hits_by_rule[result["rule"]] = self.hits_by_rule.get(result["rule"], 0) + 1
+        logger.info("Clasificación local (%s, confianza %s): %s", result["rule"], result["confidence"], Payload(result["action_data"]))
+        return result
+
+    async def _classify(self, content: str, resolve_title: TitleResolver) -> Optional[Dict[str, Any]]:
+        normalized = normalize_content(content)
+        matched = [rule for rule in self.rules if rule.matches(normalized)]
+        if not matched:
+            return None
+
+        # Si el correo coincide con reglas de acciones distintas es ambiguo y lo decide el LLM
+        rule = matched[0]
+        if any(other.action != rule.action for other in matched[1:]):
+            return None
+
+        if not rule.requires_title:
+            if extract_quoted_title(content):
+                return None
+            return {"action_data": {"action": rule.action}, "confidence": rule.confidence, "rule": rule.name}
+
+        title = extract_quoted_title(content)
+        if not title:
+            return None
+
+        catalog_title = await resolve_title(title)
+        if catalog_title and rule.exact_title and normalize_title(catalog_title) != normalize_title(title):
+            catalog_title = None
+        if catalog_title:
+            confidence = min(rule.confidence, CONFIDENCE_WITH_CATALOG_MATCH)
+            if not rule.exact_title:
+                title = catalog_title
+        else:
+            confidence = CONFIDENCE_WITHOUT_CATALOG_MATCH
+
+        return {
+            "action_data": {"action": rule.action, "book_title": title},
+            "confidence": confidence,
+            "rule": rule.name
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.fallthroughs
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "local_hits": self.hits,
+            "llm_fallthroughs": self.fallthroughs,
+            "local_ratio": self.hits / total if total else 0.0,
+            "hits_by_rule": dict(self.hits_by_rule)
+        }
+
+local_classifier = LocalIntentClassifier()
@@ -0,0 +1,158 @@
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+import asyncio
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+class LocalLeaderLock:
+    """Sin base de datos compartida (SQLite, un solo proceso): el proceso siempre es el líder."""
+
+    async def acquire(self) -> bool:
+        return True
+
+    async def heartbeat(self) -> None:
+        pass
+
+    async def release(self) -> None:
+        pass
+
+class PostgresAdvisoryLock:
+    """
+    Bloqueo consultivo de sesión de Postgres en una conexión dedicada. Si el proceso
+    muere o pierde la conexión, Postgres libera el bloqueo y otro proceso lo obtiene.
+    """
+
+    def __init__(self, database_url: str, key: int = settings.LEADER_LOCK_KEY, timeout: float = 5.0):
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.key = key
+        self.timeout = timeout
+        self._conn = None
+
+    async def acquire(self) -> bool:
+        import asyncpg
+
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await asyncpg.connect(self.dsn, timeout=self.timeout)
+        acquired = await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", self.key, timeout=self.timeout)
+        if not acquired:
+            # Los seguidores no mantienen una conexión abierta entre intentos
+            await self.release()
+        return bool(acquired)
+
+    async def heartbeat(self) -> None:
+        """Falla si la sesión que sostiene el bloqueo ya no está viva."""
+        if self._conn is None or self._conn.is_closed():
+            raise ConnectionError("Conexión del bloqueo de líder cerrada")
+        await self._conn.fetchval("SELECT 1", timeout=self.timeout)
+
+    async def release(self) -> None:
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            # Cerrar la sesión libera el bloqueo sin necesidad de pg_advisory_unlock
+            await asyncio.wait_for(conn.close(), self.timeout)
+        except Exception:
+            conn.terminate()
+
+def create_leader_lock(database_url: str = settings.DATABASE_URL, backend: str = settings.LEADER_ELECTION):
+    if backend == "auto":
+        backend = "postgres" if make_url(database_url).get_backend_name() == "postgresql" else "local"
+    if backend == "postgres":
+        return PostgresAdvisoryLock(database_url)
+    return LocalLeaderLock()
+
+TaskFactory = Callable[[], List["asyncio.Task"]]
+
+class LeaderElector:
+    """
+    Elige un único proceso para las tareas de fondo (sondeo del buzón, barridos)
+    entre workers de uvicorn y réplicas. El líder comprueba su sesión cada
+    heartbeat_seconds y, si la pierde, cancela sus tareas; los seguidores reintentan
+    cada retry_seconds, de modo que la conmutación tarda como mucho ese intervalo.
+    """
+
+    def __init__(
+        self,
+        lock=None,
+        heartbeat_seconds: float = settings.LEADER_HEARTBEAT_SECONDS,
+        retry_seconds: float = settings.LEADER_RETRY_SECONDS
+    ):
+        self.lock = lock
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_seconds = retry_seconds
+        self.instance = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.elected_at: Optional[float] = None
+        self.elections = 0
+        self.last_error: Optional[str] = None
+
+    async def run(self, start_tasks: TaskFactory) -> None:
+        """Mientras el proceso sea líder mantiene en marcha las tareas que crea start_tasks."""
+        self.lock = self.lock or create_leader_lock()
+        tasks: List["asyncio.Task"] = []
+        try:
+            while True:
+                if not self.is_leader:
+                    try:
+                        if await self.lock.acquire():
+                            self._elected()
+                            tasks = start_tasks()
+                    except Exception as e:
+                        self.last_error = str(e)
+                        logger.error(f"Error al intentar obtener el liderazgo: {str(e)}")
+                    if not self.is_leader:
+                        await asyncio.sleep(self.retry_seconds)
+                        continue
+
+                await asyncio.sleep(self.heartbeat_seconds)
+                try:
+                    await self.lock.heartbeat()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"Liderazgo perdido en {self.instance}: {str(e)}")
+                    await self._demote(tasks)
+                    tasks = []
+                    # Da ventaja a los procesos sanos antes de volver a competir
+                    await asyncio.sleep(self.retry_seconds)
+        finally:
+            await self._demote(tasks)
+
+    def _elected(self) -> None:
+        self.is_leader = True
+        self.elected_at = time.time()
+        self.elections += 1
+        logger.info(f"{self.instance} es el líder de las tareas de fondo")
+
+    async def _demote(self, tasks: List["asyncio.Task"]) -> None:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.is_leader = False
+        self.elected_at = None
+        if self.lock is not None:
+            try:
+                await self.lock.release()
+            except Exception as e:
+                logger.error(f"Error al liberar el bloqueo de líder: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instance": self.instance,
+            "is_leader": self.is_leader,
+            "backend": type(self.lock).__name__ if self.lock is not None else None,
+            "leader_since": self.elected_at,
+            "elections": self.elections,
+            "last_error": self.last_error
+        }
+
+leader_elector = LeaderElector()
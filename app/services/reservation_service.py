@@ -1,16 +1,34 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.models.reservation import Reservation
 from app.models.book import Book
 from app.schemas.reservation import ReservationCreate, ReservationUpdate
-from typing import List, Optional
+from app.services.catalog_cache import CatalogCache, catalog_cache
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 class ReservationService:
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, cache: Optional[CatalogCache] = None):
         self.db = db
+        self.catalog_cache = cache or catalog_cache
+
+    async def create_reservation(self, book_id: int, user_email: str, end_date: datetime) -> Optional[Reservation]:
+        """
+        Ocupa el libro con un UPDATE condicionado a available y crea la reserva en la
+        misma transacción: entre peticiones simultáneas por el mismo libro solo una
+        lo obtiene. Devuelve None si el libro no existe o ya no está disponible.
+        """
+        result = await self.db.execute(
+            update(Book)
+            .where(Book.id == book_id, Book.available == True)
+            .values(available=False, updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            await self.db.rollback()
+            return None
 
-    async def create_reservation(self, book_id: int, user_email: str, end_date: datetime) -> Reservation:
         db_reservation = Reservation(
             book_id=book_id,
             user_email=user_email,
@@ -18,30 +36,69 @@ class ReservationService:
             is_active=True
         )
         self.db.add(db_reservation)
-        
-        book = self.db.query(Book).filter(Book.id == book_id).first()
-        if book:
-            book.available = False
-        
-        self.db.commit()
-        self.db.refresh(db_reservation)
+        await self.db.commit()
+        await self.db.refresh(db_reservation)
+        await self.catalog_cache.invalidate()
         return db_reservation
 
     async def get_reservation(self, reservation_id: int) -> Optional[Reservation]:
-        return self.db.query(Reservation).filter(Reservation.id == reservation_id).first()
+        result = await self.db.execute(
+            select(Reservation)
+            .options(selectinload(Reservation.book))
+            .filter(Reservation.id == reservation_id)
+        )
+        return result.scalars().first()
 
     async def get_active_reservation_by_email_and_book(self, user_email: str, book_title: str) -> Optional[Reservation]:
-        return self.db.query(Reservation).join(Book).filter(
-            Reservation.user_email == user_email,
-            Book.title == book_title,
-            Reservation.is_active == True
-        ).first()
+        result = await self.db.execute(
+            select(Reservation).join(Book).filter(
+                Reservation.user_email == user_email,
+                Book.title == book_title,
+                Reservation.is_active == True
+            )
+        )
+        return result.scalars().first()
 
     async def get_user_reservations(self, user_email: str) -> List[Reservation]:
-        return self.db.query(Reservation).filter(
+        result = await self.db.execute(
+            select(Reservation).filter(
+                Reservation.user_email == user_email,
+                Reservation.is_active == True
+            )
+        )
+        return list(result.scalars().all())
+
+    async def get_user_reservations_page(
+        self,
+        user_email: str,
+        limit: int,
+        after_id: Optional[int] = None
+    ) -> Tuple[List[Reservation], Optional[int]]:
+
+        query = select(Reservation).filter(
             Reservation.user_email == user_email,
             Reservation.is_active == True
-        ).all()
+        ).order_by(Reservation.id).limit(limit + 1)
+        if after_id is not None:
+            query = query.filter(Reservation.id > after_id)
+
+        result = await self.db.execute(query)
+        reservations = list(result.scalars().all())
+        if len(reservations) > limit:
+            reservations = reservations[:limit]
+            return reservations, reservations[-1].id
+        return reservations, None
+
+    async def get_user_reservations_version(self, user_email: str) -> Tuple[int, Optional[datetime]]:
+        """
+        Número de reservas del usuario y su última modificación. Incluye las inactivas
+        para que desactivar una reserva también cambie la versión.
+        """
+        result = await self.db.execute(
+            select(func.count(Reservation.id), func.max(Reservation.updated_at))
+            .filter(Reservation.user_email == user_email)
+        )
+        return tuple(result.one())
 
     async def renew_reservation(self, reservation_id: int, new_end_date: datetime) -> Optional[Reservation]:
 
@@ -51,9 +108,9 @@ class ReservationService:
 
         db_reservation.end_date = new_end_date
         db_reservation.updated_at = datetime.utcnow()
-        
-        self.db.commit()
-        self.db.refresh(db_reservation)
+
+        await self.db.commit()
+        await self.db.refresh(db_reservation)
         return db_reservation
 
     async def delete_reservation(self, user_email: str, book_title: str) -> bool:
@@ -64,27 +121,54 @@ class ReservationService:
 
         db_reservation.is_active = False
         db_reservation.updated_at = datetime.utcnow()
-        
-        book = self.db.query(Book).filter(Book.id == db_reservation.book_id).first()
+
+        book = await self.db.get(Book, db_reservation.book_id)
         if book:
             book.available = True
-        
-        self.db.commit()
-        return True
-
-    async def check_expired_reservations(self):
 
-        current_time = datetime.utcnow()
-        expired_reservations = self.db.query(Reservation).filter(
-            Reservation.end_date < current_time,
-            Reservation.is_active == True
-        ).all()
-
-        for reservation in expired_reservations:
-            reservation.is_active = False
-            book = self.db.query(Book).filter(Book.id == reservation.book_id).first()
-            if book:
-                book.available = True
+        await self.db.commit()
+        await self.catalog_cache.invalidate()
+        return True
 
-        self.db.commit()
-        return expired_reservations 
\ No newline at end of file
+    async def expire_reservations_batch(self, now: datetime, batch_size: int) -> List[Dict]:
+        """
+        Desactiva hasta batch_size reservas expiradas con un único UPDATE ... RETURNING
+        y libera sus libros en otro UPDATE por lotes, en una transacción corta.
+        Devuelve los datos necesarios para notificar a cada usuario.
+        """
+        expired_ids = (
+            select(Reservation.id)
+            .filter(Reservation.is_active == True, Reservation.end_date < now)
+            .order_by(Reservation.end_date)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.db.execute(
+            update(Reservation)
+            .where(Reservation.id.in_(expired_ids))
+            .values(is_active=False, updated_at=now)
+            .returning(Reservation.id, Reservation.user_email, Reservation.book_id)
+            .execution_options(synchronize_session=False)
+        )
+        expired = [
+            {"id": row.id, "user_email": row.user_email, "book_id": row.book_id}
+            for row in result
+        ]
+
+        book_ids = {item["book_id"] for item in expired if item["book_id"] is not None}
+        titles = {}
+        if book_ids:
+            result = await self.db.execute(
+                update(Book)
+                .where(Book.id.in_(book_ids))
+                .values(available=True, updated_at=now)
+                .returning(Book.id, Book.title)
+                .execution_options(synchronize_session=False)
+            )
+            titles = {row.id: row.title for row in result}
+
+        for item in expired:
+            item["book_title"] = titles.get(item["book_id"])
+        await self.db.commit()
+        return expired
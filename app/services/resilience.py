@@ -0,0 +1,104 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple, Type
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Cortacircuitos simple: tras failure_threshold fallos consecutivos se abre y
+    rechaza las llamadas durante reset_timeout segundos; después deja pasar una
+    llamada de prueba (semiabierto) y se cierra si tiene éxito.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuito {self.name} cerrado")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuito {self.name} abierto tras {self.consecutive_failures} fallos")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Libera la llamada de prueba que terminó sin resultado (p. ej. cancelada)."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected
+        }
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[Any]],
+    *,
+    attempts: int,
+    attempt_timeout: float,
+    deadline: float,
+    retry_on: Tuple[Type[BaseException], ...],
+    base_delay: float = 0.5,
+    max_delay: float = 8.0
+) -> Any:
+    """
+    Ejecuta func con un tiempo límite por intento y reintenta los errores
+    transitorios con backoff exponencial y jitter completo, sin superar el
+    número de intentos ni el plazo total (deadline, en segundos).
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - (time.monotonic() - started)
+        try:
+            return await asyncio.wait_for(func(), timeout=max(0.001, min(attempt_timeout, remaining)))
+        except retry_on as e:
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            elapsed = time.monotonic() - started
+            if attempt >= attempts or elapsed + delay >= deadline:
+                raise
+            logger.warning(f"Intento {attempt} fallido ({type(e).__name__}), reintentando en {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,24 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.mail_sync_state import MailSyncState
+from typing import Optional
+from datetime import datetime
+
+DELTA_LINK_KEY = "inbox_delta_link"
+
+class SyncStateService:
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_value(self, key: str) -> Optional[str]:
+        state = await self.db.get(MailSyncState, key)
+        return state.value if state else None
+
+    async def set_value(self, key: str, value: Optional[str]) -> None:
+        state = await self.db.get(MailSyncState, key)
+        if state:
+            state.value = value
+            state.updated_at = datetime.utcnow()
+        else:
+            self.db.add(MailSyncState(key=key, value=value))
+        await self.db.commit()
@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.book import Book
+from app.services.intent_cache import normalize_content
+import asyncio
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+LEADING_ARTICLES = {"el", "la", "los", "las", "lo", "un", "una", "unos", "unas", "the", "a", "an"}
+
+def normalize_title(title: str) -> str:
+    """Minúsculas, sin acentos ni puntuación y sin el artículo inicial."""
+    text = re.sub(r"[^\w\s]", " ", normalize_content(title))
+    words = text.split()
+    if len(words) > 1 and words[0] in LEADING_ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+def title_trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TitleIndex:
+    """
+    Índice en memoria para resolver títulos aproximados sin recorrer la tabla.
+    Claves normalizadas para coincidencias exactas y un índice invertido de
+    trigramas para candidatos ordenados por coeficiente de Dice.
+    """
+
+    def __init__(self):
+        self._titles: Dict[int, str] = {}
+        self._trigrams: Dict[int, Set[str]] = {}
+        self._by_key: Dict[str, Set[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            result = await db.execute(select(Book.id, Book.title))
+            for book_id, title in result:
+                self.add(book_id, title)
+            self.loaded = True
+            logger.info(f"Índice de títulos construido con {len(self._titles)} libros")
+
+    def reset(self) -> None:
+        """Descarta el índice; se reconstruye en la siguiente búsqueda."""
+        self._titles.clear()
+        self._trigrams.clear()
+        self._by_key.clear()
+        self._postings.clear()
+        self.loaded = False
+
+    def add(self, book_id: int, title: Optional[str]) -> None:
+        self.remove(book_id)
+        if not title:
+            return
+        key = normalize_title(title)
+        grams = title_trigrams(key)
+        self._titles[book_id] = title
+        self._trigrams[book_id] = grams
+        self._by_key.setdefault(key, set()).add(book_id)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(book_id)
+
+    def remove(self, book_id: int) -> None:
+        title = self._titles.pop(book_id, None)
+        if title is None:
+            return
+        key = normalize_title(title)
+        ids = self._by_key.get(key)
+        if ids is not None:
+            ids.discard(book_id)
+            if not ids:
+                del self._by_key[key]
+        for gram in self._trigrams.pop(book_id, set()):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(book_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def resolve(self, title: str, limit: int = 5, min_score: float = 0.5) -> List[Tuple[int, str, float]]:
+        """Devuelve hasta limit candidatos (id, título, puntuación) ordenados por puntuación."""
+        key = normalize_title(title)
+        if not key:
+            return []
+
+        exact = [(book_id, self._titles[book_id], 1.0) for book_id in sorted(self._by_key.get(key, ()))]
+        if exact or min_score >= 1.0:
+            return exact[:limit]
+
+        query = title_trigrams(key)
+        # Filtro de prefijo: un título con Dice >= min_score comparte al menos
+        # min_shared trigramas, así que basta con los candidatos de los
+        # (len(query) - min_shared + 1) trigramas menos frecuentes.
+        min_shared = max(1, math.ceil(min_score * len(query) / (2 - min_score)))
+        rarest = sorted(query, key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set().union(*(self._postings.get(gram, ()) for gram in rarest[:len(query) - min_shared + 1]))
+
+        # Filtro de longitud: Dice >= min_score acota el número de trigramas del candidato
+        min_size = min_score * len(query) / (2 - min_score)
+        max_size = (2 - min_score) * len(query) / min_score if min_score > 0 else math.inf
+
+        scored = []
+        for book_id in candidates:
+            grams = self._trigrams[book_id]
+            if not min_size <= len(grams) <= max_size:
+                continue
+            score = 2 * len(query & grams) / (len(query) + len(grams))
+            if score >= min_score:
+                scored.append((book_id, self._titles[book_id], round(score, 4)))
+
+        scored.sort(key=lambda candidate: (-candidate[2], candidate[0]))
+        return scored[:limit]
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+title_index = TitleIndex()
@@ -0,0 +1,105 @@
+from typing import Dict, Optional, Tuple
+from azure.core.credentials import AccessToken
+from azure.identity import ClientSecretCredential
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Se renueva el token en segundo plano cuando le quedan menos de 5 minutos;
+# por debajo de 30 segundos se considera caducado y se espera la renovación.
+REFRESH_MARGIN_SECONDS = 300
+EXPIRY_MARGIN_SECONDS = 30
+
+class AccessTokenCache:
+    """
+    Caché de un token de acceso compartida entre todas las instancias de GraphAPIService.
+    Entrega el token en caché hasta poco antes de expires_on, lo renueva una sola vez
+    en segundo plano (single-flight) y nunca bloquea el bucle de eventos.
+    """
+
+    def __init__(self, credential: ClientSecretCredential, scope: str):
+        self.credential = credential
+        self.scope = scope
+        self._token: Optional[AccessToken] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def _remaining(self, token: Optional[AccessToken]) -> float:
+        return token.expires_on - time.time() if token else 0
+
+    async def get_token(self) -> AccessToken:
+        token = self._token
+        remaining = self._remaining(token)
+        if remaining > REFRESH_MARGIN_SECONDS:
+            return token
+        if remaining > EXPIRY_MARGIN_SECONDS:
+            self._start_refresh()
+            return token
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._consume_error)
+        return self._refresh_task
+
+    @staticmethod
+    def _consume_error(task: asyncio.Task) -> None:
+        # Una renovación en segundo plano puede fallar sin que nadie la espere;
+        # el error ya queda registrado en _refresh y se reintenta en la próxima llamada.
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self) -> AccessToken:
+        try:
+            token = await asyncio.to_thread(self.credential.get_token, self.scope)
+        except Exception as e:
+            logger.error(f"Error al obtener token: {str(e)}")
+            raise
+        self._store(token)
+        logger.info(f"Token renovado, expira en: {token.expires_on}")
+        return token
+
+    def _store(self, token: AccessToken) -> None:
+        with self._lock:
+            if self._remaining(token) > self._remaining(self._token):
+                self._token = token
+
+    def get_token_blocking(self) -> AccessToken:
+        """Variante síncrona para código que ya se ejecuta fuera del bucle de eventos."""
+        token = self._token
+        if self._remaining(token) > EXPIRY_MARGIN_SECONDS:
+            return token
+        token = self.credential.get_token(self.scope)
+        self._store(token)
+        return token
+
+
+class CachedTokenCredential:
+    """Credencial para GraphClient que entrega los tokens de la caché compartida."""
+
+    def __init__(self, cache: AccessTokenCache):
+        self.cache = cache
+
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return self.cache.get_token_blocking()
+
+
+_caches: Dict[Tuple[str, str, str], AccessTokenCache] = {}
+_caches_lock = threading.Lock()
+
+def get_token_cache(tenant_id: str, client_id: str, client_secret: str, scope: str) -> AccessTokenCache:
+
+    key = (tenant_id, client_id, scope)
+    with _caches_lock:
+        if key not in _caches:
+            credential = ClientSecretCredential(
+                tenant_id=tenant_id,
+                client_id=client_id,
+                client_secret=client_secret
+            )
+            _caches[key] = AccessTokenCache(credential, scope)
+        return _caches[key]
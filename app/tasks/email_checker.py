@@ -1,23 +1,47 @@
 import logging
+from typing import Any, Dict, Optional
+from openai import AsyncOpenAI
 from app.services.email_processor import EmailProcessor
-from app.db.session import SessionLocal
+from app.services.graph_api import GraphAPIService
+from app.db.session import AsyncSessionLocal
+from app.core.config import settings
+from app.tasks.email_worker import drain_email_queue
+from app.tasks.graph_notifications import webhooks_enabled
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def check_emails():
-    """Verifica y procesa los correos no leídos."""
-    db = SessionLocal()
+MAILBOX_POLL_JOB = "mailbox_poll"
+
+async def check_emails(graph_api: Optional[GraphAPIService] = None, openai_client: Optional[AsyncOpenAI] = None) -> Dict[str, Any]:
+    """
+    Verifica y procesa los correos no leídos; con la cola activa solo los encola.
+    Con notificaciones de Graph el sondeo compite con ellas por los mismos mensajes:
+    también pasa por la cola y este proceso la vacía si no hay workers.
+    Si el buzón se pudo consultar, el resultado lleva en fetched_count los correos encontrados.
+    """
     try:
-        processor = EmailProcessor(db)
-        result = await processor.process_unread_emails()
+        if settings.EMAIL_QUEUE_ENABLED or webhooks_enabled():
+            processor = EmailProcessor(graph_api=graph_api, openai_client=openai_client)
+            try:
+                result = await processor.enqueue_unread_emails()
+            finally:
+                await processor.close()
+            if result.get("status") == "success" and not settings.EMAIL_QUEUE_ENABLED:
+                result["processed_count"] = await drain_email_queue(graph_api, openai_client)
+            return result
+
+        async with AsyncSessionLocal() as db:
+            processor = EmailProcessor(db, graph_api=graph_api, openai_client=openai_client)
+            result = await processor.process_unread_emails()
         logger.info(f"Procesados {result.get('processed_count', 0)} correos")
         if result.get('errors'):
             logger.error("Errores encontrados:")
             for error in result['errors']:
                 logger.error(f"- {error}")
+        if result.get("status") == "success":
+            result["fetched_count"] = len(result["results"])
+        return result
     except Exception as e:
-        logger.error(f"Error al verificar correos: {str(e)}")
-    finally:
-        db.close() 
\ No newline at end of file
+        error_msg = f"Error al verificar correos: {str(e)}"
+        logger.error(error_msg)
+        return {"status": "error", "message": error_msg}
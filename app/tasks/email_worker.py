@@ -0,0 +1,141 @@
+"""
+Workers de la cola de correos (tabla email_jobs). Se arrancan dentro de la API con
+EMAIL_QUEUE_WORKERS o como proceso independiente, en tantos contenedores como haga falta:
+
+    python -m app.tasks.email_worker --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+from openai import AsyncOpenAI
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.email_processor import EmailProcessor
+from app.services.email_queue_service import EmailQueueService
+from app.services.graph_api import GraphAPIService
+
+logger = logging.getLogger(__name__)
+
+class EmailWorker:
+    """Reclama lotes de trabajos, los procesa con EmailProcessor y registra el resultado de cada uno."""
+
+    def __init__(
+        self,
+        worker_id: str,
+        graph_api: GraphAPIService,
+        openai_client: AsyncOpenAI,
+        claim_batch: int = settings.EMAIL_QUEUE_CLAIM_BATCH,
+        idle_seconds: float = settings.EMAIL_QUEUE_IDLE_SECONDS
+    ):
+        self.worker_id = worker_id
+        self.graph_api = graph_api
+        self.openai_client = openai_client
+        self.claim_batch = claim_batch
+        self.idle_seconds = idle_seconds
+
+    async def run_once(self) -> int:
+        """Procesa un lote; devuelve cuántos trabajos reclamó."""
+        async with AsyncSessionLocal() as db:
+            jobs = await EmailQueueService(db).claim(self.worker_id, self.claim_batch)
+        if not jobs:
+            return 0
+
+        processor = EmailProcessor(graph_api=self.graph_api, openai_client=self.openai_client)
+        try:
+            outcome = await processor.process_emails([job["email"] for job in jobs])
+        finally:
+            await processor.close()
+
+        await self._record_results(jobs, outcome)
+        return len(jobs)
+
+    async def _record_results(self, jobs: List[Dict[str, Any]], outcome: Dict[str, Any]) -> None:
+        """
+        Completa los trabajos procesados y entregados. Los que fallaron, y aquellos
+        cuya respuesta quedó pendiente de envío o de marcado como leído, vuelven a la
+        cola con espera exponencial; en el siguiente intento solo se repite la entrega.
+        """
+        results = {result["id"]: result for result in outcome.get("results", [])}
+        async with AsyncSessionLocal() as db:
+            queue = EmailQueueService(db)
+            completed = []
+            for job in jobs:
+                result = results.get(job["message_id"])
+                if result is None:
+                    await queue.retry(job, outcome.get("message") or "Sin resultado del procesamiento")
+                elif result["status"] == "deferred":
+                    await queue.retry(job, result["message"], count_attempt=False)
+                elif not result["processed"] or result.get("error"):
+                    await queue.retry(job, result.get("error") or result["message"])
+                elif result.get("reply_pending"):
+                    await queue.retry(job, f"Respuesta al correo {job['message_id']} pendiente de entrega")
+                else:
+                    completed.append(job["id"])
+            await queue.complete(completed)
+
+    async def run(self) -> None:
+        logger.info(f"Worker de correos {self.worker_id} iniciado")
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Error en el worker de correos {self.worker_id}: {str(e)}")
+                claimed = 0
+            if claimed < self.claim_batch:
+                await asyncio.sleep(self.idle_seconds)
+
+def worker_id(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+async def drain_email_queue(graph_api: GraphAPIService, openai_client: AsyncOpenAI) -> int:
+    """
+    Procesa trabajos visibles hasta que no quede ninguno que reclamar. Lo usan los
+    procesos sin workers en marcha para que la reclamación en email_jobs evite
+    procesar dos veces un mismo mensaje. Devuelve cuántos trabajos procesó.
+    """
+    worker = EmailWorker(f"{socket.gethostname()}:{os.getpid()}:drain", graph_api, openai_client)
+    total = 0
+    while True:
+        claimed = await worker.run_once()
+        if not claimed:
+            return total
+        total += claimed
+
+def start_email_workers(count: int, graph_api: GraphAPIService, openai_client: AsyncOpenAI) -> List["asyncio.Task"]:
+    return [
+        asyncio.create_task(EmailWorker(worker_id(index), graph_api, openai_client).run())
+        for index in range(count)
+    ]
+
+async def run_standalone(count: int) -> None:
+    from app.services.email_processor import create_openai_client
+
+    graph_api = GraphAPIService()
+    openai_client = create_openai_client()
+    tasks = start_email_workers(count, graph_api, openai_client)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await openai_client.close()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.core.logging_config import setup_logging
+
+    parser = argparse.ArgumentParser(description="Workers de la cola de correos")
+    parser.add_argument("--workers", type=int, default=max(1, settings.EMAIL_QUEUE_WORKERS), help="Workers concurrentes en este proceso")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    try:
+        asyncio.run(run_standalone(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Ingesta por notificaciones de cambios de Microsoft Graph: Graph avisa en
+/api/v1/email/notifications de cada correo nuevo y se procesan solo esos mensajes.
+La suscripción caduca en unos días y se renueva desde el proceso líder.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.email_queue_service import EmailQueueService
+from app.services.graph_api import GraphAPIService, GraphRequestError
+from app.services.sync_state_service import SyncStateService
+from app.tasks.email_worker import drain_email_queue
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_KEY = "graph_subscription"
+SUBSCRIPTION_JOB = "graph_subscription"
+
+# Caducidad de la suscripción vigente en este proceso (el líder, que es quien la mantiene)
+_subscription_expires_at: Optional[datetime] = None
+
+def webhooks_enabled() -> bool:
+    return bool(settings.GRAPH_WEBHOOK_URL)
+
+def subscription_active() -> bool:
+    """Con una suscripción vigente el sondeo es solo una red de seguridad."""
+    return _subscription_expires_at is not None and _subscription_expires_at > datetime.utcnow()
+
+def webhook_client_state() -> str:
+    """Secreto que Graph devuelve en cada notificación; igual en todas las réplicas."""
+    if settings.GRAPH_WEBHOOK_CLIENT_STATE:
+        return settings.GRAPH_WEBHOOK_CLIENT_STATE
+    return hmac.new(settings.SECRET_KEY.encode(), b"graph-webhook-client-state", hashlib.sha256).hexdigest()
+
+def extract_message_ids(payload: Dict[str, Any], client_state: str) -> Tuple[List[str], int]:
+    """Ids de los mensajes notificados con un clientState válido y el número de notificaciones rechazadas."""
+    message_ids: List[str] = []
+    rejected = 0
+    for notification in payload.get("value") or []:
+        if not isinstance(notification, dict):
+            rejected += 1
+            continue
+        if not hmac.compare_digest(str(notification.get("clientState") or ""), client_state):
+            rejected += 1
+            continue
+        message_id = (notification.get("resourceData") or {}).get("id")
+        if message_id and notification.get("changeType", "created") == "created":
+            message_ids.append(message_id)
+    return message_ids, rejected
+
+async def process_notified_emails(
+    message_ids: List[str],
+    graph_api: GraphAPIService,
+    openai_client: Optional[AsyncOpenAI] = None
+) -> Dict[str, Any]:
+    """
+    Obtiene los mensajes notificados y los encola en email_jobs. La notificación llega
+    a cualquier worker y Graph puede repetirla, así que el mensaje se procesa solo a
+    través de la cola (único por message_id y reclamado con SKIP LOCKED); sin workers
+    de cola en marcha, este mismo proceso la vacía.
+    """
+    try:
+        emails = await graph_api.get_messages(message_ids)
+    except Exception as e:
+        # El sondeo de seguridad recogerá los mensajes que no se pudieron obtener
+        logger.error(f"Error al obtener los mensajes notificados: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+    async with AsyncSessionLocal() as db:
+        enqueued_count = await EmailQueueService(db).enqueue(emails)
+    if settings.EMAIL_QUEUE_ENABLED:
+        return {"status": "success", "enqueued_count": enqueued_count}
+
+    processed_count = await drain_email_queue(graph_api, openai_client)
+    logger.info(f"Notificación procesada: {enqueued_count} de {len(message_ids)} correos encolados, {processed_count} procesados")
+    return {"status": "success", "enqueued_count": enqueued_count, "processed_count": processed_count}
+
+async def _load_subscription() -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as db:
+        value = await SyncStateService(db).get_value(SUBSCRIPTION_KEY)
+    return json.loads(value) if value else None
+
+async def _save_subscription(subscription: Dict[str, Any]) -> None:
+    global _subscription_expires_at
+    _subscription_expires_at = _expires_at(subscription)
+    async with AsyncSessionLocal() as db:
+        await SyncStateService(db).set_value(SUBSCRIPTION_KEY, json.dumps({
+            "id": subscription["id"],
+            "expirationDateTime": subscription["expirationDateTime"],
+            "notificationUrl": subscription.get("notificationUrl", settings.GRAPH_WEBHOOK_URL)
+        }))
+
+def _expires_at(subscription: Dict[str, Any]) -> datetime:
+    value = subscription["expirationDateTime"].rstrip("Z")
+    return datetime.fromisoformat(value[:26])
+
+async def ensure_subscription(graph_api: GraphAPIService, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Crea la suscripción si no existe o apunta a otra URL y la renueva cuando le quedan
+    menos de GRAPH_SUBSCRIPTION_RENEW_MARGIN_MINUTES. Si Graph ya no la reconoce, crea otra.
+    """
+    global _subscription_expires_at
+    if not webhooks_enabled():
+        return None
+    now = now or datetime.utcnow()
+    expiration = now + timedelta(minutes=settings.GRAPH_SUBSCRIPTION_MINUTES)
+    subscription = await _load_subscription()
+
+    if subscription and subscription.get("notificationUrl") == settings.GRAPH_WEBHOOK_URL:
+        if _expires_at(subscription) - now > timedelta(minutes=settings.GRAPH_SUBSCRIPTION_RENEW_MARGIN_MINUTES):
+            _subscription_expires_at = _expires_at(subscription)
+            return subscription
+        try:
+            renewed = await graph_api.renew_subscription(subscription["id"], expiration)
+            subscription = {**subscription, **renewed}
+            await _save_subscription(subscription)
+            logger.info(f"Suscripción de Graph {subscription['id']} renovada hasta {subscription['expirationDateTime']}")
+            return subscription
+        except GraphRequestError as e:
+            if e.status_code != 404:
+                raise
+            logger.warning(f"La suscripción de Graph {subscription['id']} ya no existe; se crea una nueva")
+
+    subscription = await graph_api.create_subscription(settings.GRAPH_WEBHOOK_URL, webhook_client_state(), expiration)
+    await _save_subscription(subscription)
+    logger.info(f"Suscripción de Graph {subscription['id']} creada hasta {subscription['expirationDateTime']}")
+    return subscription
@@ -0,0 +1,25 @@
+import logging
+from typing import Any, Dict, Optional
+from openai import AsyncOpenAI
+from app.services.email_processor import EmailProcessor
+from app.services.graph_api import GraphAPIService
+
+logger = logging.getLogger(__name__)
+
+REPLY_RETRY_JOB = "reply_retry"
+
+async def retry_pending_replies(graph_api: Optional[GraphAPIService] = None, openai_client: Optional[AsyncOpenAI] = None) -> Dict[str, Any]:
+    """
+    Reintenta la entrega de las respuestas guardadas en email_replies. Sin cola, un
+    correo cuya respuesta falló ya no se vuelve a obtener del buzón (el deltaLink
+    avanzó), así que este trabajo es quien completa su entrega.
+    """
+    processor = EmailProcessor(graph_api=graph_api, openai_client=openai_client)
+    try:
+        return await processor.retry_pending_replies()
+    except Exception as e:
+        error_msg = f"Error al reintentar respuestas pendientes: {str(e)}"
+        logger.error(error_msg)
+        return {"status": "error", "message": error_msg}
+    finally:
+        await processor.close()
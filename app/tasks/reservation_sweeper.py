@@ -0,0 +1,57 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.catalog_cache import catalog_cache
+from app.services.graph_api import GraphAPIService
+from app.services.reservation_service import ReservationService
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_SWEEP_JOB = "reservation_sweep"
+
+def _build_expiration_notice(item: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "to": item["user_email"],
+        "subject": "Tu reserva ha expirado",
+        "body": f"Tu reserva del libro '{item['book_title']}' ha expirado. Por favor, devuelve el libro lo antes posible."
+    }
+
+async def sweep_expired_reservations(
+    graph_api: Optional[GraphAPIService] = None,
+    batch_size: int = settings.RESERVATION_SWEEP_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Expira las reservas vencidas por lotes, cada uno en su propia transacción,
+    y notifica a los usuarios de cada lote con peticiones $batch de Graph.
+    """
+    now = datetime.utcnow()
+    expired_count = 0
+    notified_count = 0
+    batches = 0
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            expired = await ReservationService(db).expire_reservations_batch(now, batch_size)
+        if not expired:
+            break
+
+        batches += 1
+        expired_count += len(expired)
+        await catalog_cache.invalidate()
+
+        if graph_api is not None:
+            notices: List[Dict[str, str]] = [_build_expiration_notice(item) for item in expired if item["user_email"]]
+            try:
+                results = await graph_api.send_replies_and_mark_read(notices)
+                notified_count += sum(1 for result in results if result["sent"])
+            except Exception as e:
+                logger.error(f"Error al notificar reservas expiradas: {str(e)}")
+
+        if len(expired) < batch_size:
+            break
+
+    if expired_count:
+        logger.info(f"Expiradas {expired_count} reservas en {batches} lotes, {notified_count} notificadas")
+    return {"expired_count": expired_count, "notified_count": notified_count, "batches": batches}
@@ -0,0 +1,220 @@
+"""
+Sustitutos en proceso de Microsoft Graph y OpenAI para medir el servicio sin
+credenciales ni red. Imitan solo la parte de la interfaz que usa la aplicación.
+"""
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import json
+import random
+import re
+
+class FakeGraphAPIService:
+    """Buzón en memoria con la interfaz de GraphAPIService."""
+
+    def __init__(self, email_address: str = "biblioteca@example.com", latency: float = 0.0):
+        self.email_address = email_address
+        self.latency = latency
+        self.messages: Dict[str, dict] = {}
+        self.sent: List[dict] = []
+        self.subscriptions: Dict[str, dict] = {}
+        self.requests = 0
+
+    def seed(self, emails: List[dict]) -> None:
+        for email in emails:
+            self.messages[email["id"]] = {**email, "isRead": False}
+
+    async def _call(self) -> None:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def unread(self) -> List[dict]:
+        return [message for message in self.messages.values() if not message["isRead"]]
+
+    async def _get_valid_token(self) -> str:
+        return "fake-token"
+
+    async def get_unread_emails(self) -> List[dict]:
+        await self._call()
+        return self.unread()
+
+    async def get_new_emails(self, delta_link: Optional[str] = None):
+        await self._call()
+        return self.unread(), f"fake-delta-{len(self.sent)}"
+
+    async def get_messages(self, message_ids: List[str]) -> List[dict]:
+        await self._call()
+        return [
+            self.messages[message_id] for message_id in dict.fromkeys(message_ids)
+            if message_id in self.messages and not self.messages[message_id]["isRead"]
+        ]
+
+    async def create_subscription(self, notification_url: str, client_state: str, expiration: datetime) -> dict:
+        await self._call()
+        subscription = {
+            "id": f"fake-subscription-{len(self.subscriptions)}",
+            "notificationUrl": notification_url,
+            "clientState": client_state,
+            "expirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+        }
+        self.subscriptions[subscription["id"]] = subscription
+        return subscription
+
+    async def renew_subscription(self, subscription_id: str, expiration: datetime) -> dict:
+        await self._call()
+        subscription = self.subscriptions[subscription_id]
+        subscription["expirationDateTime"] = expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+        return subscription
+
+    async def send_email(self, to: str, subject: str, body: str) -> bool:
+        await self._call()
+        self.sent.append({"to": to, "subject": subject, "body": body})
+        return True
+
+    async def mark_email_as_read(self, email_id: str) -> bool:
+        await self._call()
+        if email_id in self.messages:
+            self.messages[email_id]["isRead"] = True
+        return True
+
+    async def send_replies_and_mark_read(self, items: List[dict]) -> List[dict]:
+        # Una petición $batch por cada 20 sub-peticiones, como en Graph
+        sub_requests = sum(2 if item.get("email_id") else 1 for item in items)
+        for _ in range(max(1, -(-sub_requests // 20))):
+            await self._call()
+        results = []
+        for item in items:
+            self.sent.append({"to": item["to"], "subject": item["subject"], "body": item["body"]})
+            email_id = item.get("email_id")
+            if email_id in self.messages:
+                self.messages[email_id]["isRead"] = True
+            results.append({"email_id": email_id, "sent": True, "marked_read": bool(email_id)})
+        return results
+
+def keyword_intent(content: str) -> Dict[str, Any]:
+    """Respuesta determinista del LLM falso a partir de palabras clave."""
+    text = content.lower()
+    title_match = re.search(r"libro ([a-z0-9áéíóúñ ]+?)(?:[.,!?\n]|$)", text)
+    title = title_match.group(1).strip().title() if title_match else None
+    if "cancel" in text or "anular" in text:
+        return {"action": "ELIMINAR", "book_title": title}
+    if "renov" in text or "ampliar" in text:
+        return {"action": "RENOVAR", "book_title": title}
+    if "llevarme" in text or "reserv" in text or "prest" in text:
+        return {"action": "RESERVAR", "book_title": title}
+    return {"action": "LISTAR"}
+
+BATCH_ITEM_PATTERN = re.compile(r'<correo id="([^"]+)">\n(.*?)\n</correo>', re.S)
+
+class FakeOpenAIClient:
+    """
+    Cliente con la forma de AsyncOpenAI (chat.completions.create, models.retrieve,
+    close) que responde tras una latencia configurable. Entiende los prompts por
+    lotes y devuelve el uso de tokens aproximado.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.0,
+        responder: Callable[[str], Dict[str, Any]] = keyword_intent,
+        failure_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.responder = responder
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.batch_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(retrieve=self._retrieve)
+
+    async def _retrieve(self, model: str):
+        return SimpleNamespace(id=model)
+
+    async def _create(self, model: str, messages: List[dict], **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            import httpx
+            from openai import APIConnectionError
+            raise APIConnectionError(request=httpx.Request("POST", "https://api.openai.invalid/v1/chat/completions"))
+
+        prompt = messages[-1]["content"]
+        items = BATCH_ITEM_PATTERN.findall(prompt)
+        if items:
+            self.batch_calls += 1
+            content = json.dumps([{"id": item_id, **self.responder(text)} for item_id, text in items], ensure_ascii=False)
+        else:
+            content = json.dumps(self.responder(prompt), ensure_ascii=False)
+
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "batch_calls": self.batch_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+LOCAL_TEMPLATES = [
+    'Hola, quiero reservar el libro "{title}". Gracias.',
+    'Por favor, renovar la reserva de "{title}".',
+    'Quiero cancelar la reserva de "{title}".',
+    "Me gustaría ver la lista de libros disponibles.",
+]
+
+LLM_TEMPLATES = [
+    "Buenas tardes, ¿podría llevarme el libro {title}? Lo necesito para clase.",
+    "Necesito ampliar el plazo del libro {title}, todavía no lo he terminado.",
+    "Ya no voy a necesitar el libro {title}, pueden anular lo que tengo pedido.",
+    "¿Qué tienen ahora mismo en la biblioteca?",
+]
+
+def build_mailbox(
+    count: int,
+    titles: List[str],
+    senders: int = 50,
+    llm_ratio: float = 0.5,
+    seed: int = 0
+) -> List[dict]:
+    """
+    Genera count correos repartidos entre senders remitentes. Una fracción llm_ratio
+    no lleva el título entrecomillado y la resuelve el LLM; el resto la resuelve el
+    clasificador local.
+    """
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(minutes=count)
+    emails = []
+    for index in range(count):
+        templates = LLM_TEMPLATES if rng.random() < llm_ratio else LOCAL_TEMPLATES
+        body = rng.choice(templates).format(title=rng.choice(titles))
+        emails.append({
+            "id": f"bench-{index}",
+            "subject": "Solicitud",
+            "receivedDateTime": (start + timedelta(seconds=index)).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "from": {"emailAddress": {"address": f"lector{index % senders}@example.com"}},
+            "body": {"contentType": "html", "content": f"<html><body><p>{body}</p></body></html>"}
+        })
+    return emails
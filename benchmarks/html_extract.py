@@ -0,0 +1,122 @@
+"""
+Micro-benchmark de la extracción de texto de los cuerpos de correo: el extractor en
+streaming de app.services.html_text frente a la implementación anterior con
+BeautifulSoup (si está instalado).
+
+    python -m benchmarks.html_extract --repeat 50
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extracción de texto de correos HTML: streaming frente a BeautifulSoup")
+    parser.add_argument("--repeat", type=int, default=30, help="Repeticiones por muestra")
+    parser.add_argument("--max-chars", type=int, default=20000, help="Presupuesto de caracteres del extractor")
+    parser.add_argument("--output", help="Fichero JSON de resultados")
+    return parser.parse_args(argv)
+
+def configure_environment() -> None:
+    for name, value in {
+        "DATABASE_URL": "sqlite:///:memory:",
+        "AZURE_CLIENT_ID": "benchmark",
+        "AZURE_CLIENT_SECRET": "benchmark",
+        "AZURE_TENANT_ID": "benchmark",
+        "EMAIL_ADDRESS": "biblioteca@example.com",
+        "OPENAI_API_KEY": "benchmark",
+        "SECRET_KEY": "benchmark",
+    }.items():
+        os.environ.setdefault(name, value)
+
+def plain_request() -> str:
+    return '<html><body><p>Hola, quiero reservar el libro "Cien años de soledad".</p><p>Gracias.</p></body></html>'
+
+def forwarded_thread(replies: int = 40) -> str:
+    """Hilo reenviado con las respuestas anteriores citadas en blockquote."""
+    body = plain_request()
+    for index in range(replies):
+        body = (
+            f"<div><p>Respuesta {index}: ¿alguna novedad con mi solicitud?</p>"
+            f"<div>El {index} de marzo, biblioteca@example.com escribió:</div>"
+            f"<blockquote style=\"margin:0 0 0 .8ex;border-left:1px #ccc solid\">{body}</blockquote></div>"
+        )
+    return f"<html><body>{body}</body></html>"
+
+def marketing_newsletter(sections: int = 400) -> str:
+    """Boletín con CSS en línea, preencabezado oculto, scripts de seguimiento y tablas anidadas."""
+    style = "<style>" + "".join(f".c{index}{{color:#{index:06x};padding:{index % 9}px}}" for index in range(500)) + "</style>"
+    preheader = '<div style="display:none;max-height:0">' + "Oferta exclusiva " * 50 + "</div>"
+    rows = "".join(
+        f'<tr><td class="c{index}" style="font-family:Arial;font-size:14px">'
+        f'<a href="https://example.com/track?id={index}">Novedad {index}</a>: '
+        f"Descubre los títulos recomendados de esta semana y reserva el tuyo &amp; más.</td></tr>"
+        for index in range(sections)
+    )
+    script = "<script>" + "var t=[];" * 200 + "</script>"
+    return f"<html><head>{style}</head><body>{preheader}<table><tbody>{rows}</tbody></table>{script}</body></html>"
+
+def samples() -> Dict[str, str]:
+    return {
+        "solicitud": plain_request(),
+        "hilo_reenviado": forwarded_thread(),
+        "boletin": marketing_newsletter(),
+    }
+
+def beautifulsoup_extractor() -> Callable[[str], str]:
+    """La limpieza de EmailProcessor antes del extractor en streaming."""
+    from bs4 import BeautifulSoup
+
+    def extract(html_content: str) -> str:
+        soup = BeautifulSoup(html_content, "html.parser")
+        text = soup.get_text(separator=" ", strip=True)
+        return re.sub(r"\s+", " ", text).strip()
+
+    return extract
+
+def measure(function: Callable[[str], str], content: str, repeat: int) -> Dict[str, float]:
+    timings: List[float] = []
+    output = ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = function(content)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+        "output_chars": len(output),
+    }
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    configure_environment()
+    from app.services.html_text import extract_text
+
+    extractors: Dict[str, Callable[[str], str]] = {
+        "streaming": lambda content: extract_text(content, "html", args.max_chars),
+    }
+    try:
+        extractors["beautifulsoup"] = beautifulsoup_extractor()
+    except ImportError:
+        print("BeautifulSoup no está instalado: se mide solo el extractor en streaming (pip install beautifulsoup4)")
+
+    results: Dict[str, Dict[str, object]] = {}
+    for name, content in samples().items():
+        entry: Dict[str, object] = {"input_chars": len(content)}
+        for extractor_name, function in extractors.items():
+            entry[extractor_name] = measure(function, content, args.repeat)
+        results[name] = entry
+        summary = ", ".join(f"{extractor_name} p50 {entry[extractor_name]['p50_ms']} ms" for extractor_name in extractors)
+        print(f"{name} ({len(content)} caracteres): {summary}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Simulador de notificaciones de cambios de Microsoft Graph.
+
+En proceso (por defecto) levanta la aplicación con el buzón y OpenAI simulados, hace
+el saludo de validación, crea la suscripción, entrega cada correo nuevo con su
+notificación y mide el tiempo hasta la respuesta; también envía notificaciones con
+un clientState falso para comprobar que se rechazan:
+
+    python -m benchmarks.webhook_sim --emails 50
+
+Contra una instancia en marcha solo envía el saludo y una notificación del mensaje
+indicado, que debe existir en el buzón real:
+
+    python -m benchmarks.webhook_sim --url http://localhost:8000 --message-id AAMk... --client-state <secreto>
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+from benchmarks.run import configure_environment, latency_summary, seed_catalog
+
+NOTIFICATIONS_PATH = "/api/v1/email/notifications"
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulador de notificaciones de cambios de Graph")
+    parser.add_argument("--url", help="URL base de una instancia en marcha; sin ella se simula todo en proceso")
+    parser.add_argument("--message-id", help="Id del mensaje a notificar (con --url)")
+    parser.add_argument("--client-state", help="clientState esperado por la instancia (con --url)")
+    parser.add_argument("--database-url", help="URL de la base de datos (por defecto un SQLite temporal)")
+    parser.add_argument("--books", type=int, default=200, help="Libros en el catálogo")
+    parser.add_argument("--emails", type=int, default=50, help="Correos notificados")
+    parser.add_argument("--senders", type=int, default=20, help="Remitentes distintos")
+    parser.add_argument("--llm-ratio", type=float, default=0.5, help="Fracción de correos que requieren el LLM")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Latencia simulada de OpenAI en segundos")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="Latencia simulada de Graph en segundos")
+    parser.add_argument("--concurrency", type=int, default=5, help="Notificaciones simultáneas")
+    parser.add_argument("--forged", type=int, default=5, help="Notificaciones con clientState falso")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Fichero JSON de resultados")
+    parser.add_argument("--log-level", default="WARNING", help="Nivel de log de la aplicación")
+    return parser.parse_args(argv)
+
+def notification(message_id: str, client_state: str, subscription_id: str = "simulada") -> Dict[str, Any]:
+    """Cuerpo de una notificación de Graph para un mensaje creado en la bandeja de entrada."""
+    return {
+        "value": [{
+            "subscriptionId": subscription_id,
+            "subscriptionExpirationDateTime": "2099-01-01T00:00:00.0000000Z",
+            "changeType": "created",
+            "resource": f"Users/simulado/Messages/{message_id}",
+            "resourceData": {
+                "@odata.type": "#Microsoft.Graph.Message",
+                "@odata.id": f"Users/simulado/Messages/{message_id}",
+                "id": message_id
+            },
+            "clientState": client_state,
+            "tenantId": "simulado"
+        }]
+    }
+
+async def check_handshake(client) -> bool:
+    token = f"validacion-{uuid.uuid4().hex}"
+    response = await client.post(NOTIFICATIONS_PATH, params={"validationToken": token})
+    return response.status_code == 200 and response.text == token and response.headers["content-type"].startswith("text/plain")
+
+async def simulate(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    from app.db.init_db import init_db
+    from app.main import app
+    from app.services.email_processor import llm_breaker
+    from app.tasks.graph_notifications import ensure_subscription
+    from benchmarks.fakes import FakeGraphAPIService, FakeOpenAIClient, build_mailbox
+
+    init_db()
+    titles = await seed_catalog(args.books)
+    graph_api = FakeGraphAPIService(latency=args.graph_latency)
+    app.state.graph_api = graph_api
+    app.state.openai_client = FakeOpenAIClient(latency=args.llm_latency, seed=args.seed)
+    llm_breaker.record_success()
+
+    subscription = await ensure_subscription(graph_api)
+    client_state = graph_api.subscriptions[subscription["id"]]["clientState"]
+    mailbox = build_mailbox(args.emails, titles, senders=args.senders, llm_ratio=args.llm_ratio, seed=args.seed)
+
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://simulador") as client:
+        handshake_ok = await check_handshake(client)
+
+        async def deliver(email: dict):
+            async with semaphore:
+                # El correo llega al buzón y Graph notifica; ASGITransport espera a las
+                # tareas en segundo plano, así que la latencia incluye la respuesta
+                graph_api.seed([email])
+                started = time.perf_counter()
+                response = await client.post(NOTIFICATIONS_PATH, json=notification(email["id"], client_state, subscription["id"]))
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 202:
+                    raise RuntimeError(f"La notificación de {email['id']} devolvió {response.status_code}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(email) for email in mailbox))
+        elapsed = time.perf_counter() - started
+
+        replies_before_forged = len(graph_api.sent)
+        forged = build_mailbox(args.forged, titles, senders=1, seed=args.seed + 1)
+        for email in forged:
+            email["id"] = f"forjado-{email['id']}"
+            graph_api.seed([email])
+            await client.post(NOTIFICATIONS_PATH, json=notification(email["id"], "clientState-falso"))
+
+    from app.core.config import settings
+    return {
+        "handshake_ok": handshake_ok,
+        "subscription": subscription["id"],
+        "notifications": args.emails,
+        "seconds": round(elapsed, 4),
+        "notification_to_reply": latency_summary(latencies),
+        "replies_sent": replies_before_forged,
+        "unread_left": len([email for email in graph_api.unread() if not email["id"].startswith("forjado-")]),
+        "forged_notifications": args.forged,
+        "forged_replies": len(graph_api.sent) - replies_before_forged,
+        "polling_mean_wait_seconds": settings.EMAIL_POLL_INTERVAL_SECONDS / 2,
+        "graph_requests": graph_api.requests,
+    }
+
+async def send_to_instance(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        result: Dict[str, Any] = {"handshake_ok": await check_handshake(client)}
+        if args.message_id:
+            response = await client.post(NOTIFICATIONS_PATH, json=notification(args.message_id, args.client_state or ""))
+            result["notification_status"] = response.status_code
+    return result
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    if args.url:
+        results = asyncio.run(send_to_instance(args))
+    else:
+        configure_environment(args)
+        os.environ.setdefault("GRAPH_WEBHOOK_URL", f"http://simulador{NOTIFICATIONS_PATH}")
+        from app.core.logging_config import setup_logging
+        setup_logging()
+        results = asyncio.run(simulate(args))
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    sys.exit(main())
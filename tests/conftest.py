@@ -0,0 +1,40 @@
+import asyncio
+import os
+import tempfile
+import pytest
+
+# Settings exige estas variables; las pruebas no llegan a usar ningún servicio externo
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'biblioteca-tests.db')}")
+os.environ.setdefault("AZURE_CLIENT_ID", "test")
+os.environ.setdefault("AZURE_CLIENT_SECRET", "test")
+os.environ.setdefault("AZURE_TENANT_ID", "test")
+os.environ.setdefault("EMAIL_ADDRESS", "biblioteca@example.com")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SECRET_KEY", "test")
+
+@pytest.fixture
+def run():
+    """Ejecuta una corrutina en un bucle nuevo y cierra después las conexiones del pool."""
+    from app.db.session import async_engine
+
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return runner
+
+@pytest.fixture
+def database():
+    """Tablas recién creadas en la base de datos de pruebas."""
+    from app.db.base_class import Base
+    from app.db.session import engine
+    # Registra las tablas en los metadatos
+    from app.models import book, email_job, email_reply, reservation  # noqa: F401
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,58 @@
+import asyncio
+from app.services.catalog_cache import CatalogCache, LocalInvalidationBus
+
+def test_local_invalidation_drops_cached_entries():
+    async def scenario():
+        cache = CatalogCache(max_entries=10, ttl_seconds=60)
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            return len(loads)
+
+        first = await cache.get_or_load("listar", loader)
+        cached = await cache.get_or_load("listar", loader)
+        await cache.invalidate()
+        reloaded = await cache.get_or_load("listar", loader)
+        return first, cached, reloaded, cache.stats()
+
+    first, cached, reloaded, stats = asyncio.run(scenario())
+    assert (first, cached, reloaded) == (1, 1, 2)
+    assert (stats["hits"], stats["misses"], stats["local_invalidations"]) == (1, 2, 1)
+
+def test_invalidation_reaches_other_instances_but_not_the_origin():
+    async def scenario():
+        bus = LocalInvalidationBus()
+        origin, other = CatalogCache(), CatalogCache()
+        await origin.start(bus)
+        await other.start(bus)
+        seen = []
+        other.add_invalidation_handler(lambda message: seen.append(message["titles_changed"]))
+        await origin.invalidate(titles_changed=True)
+        return origin, other, seen
+
+    origin, other, seen = asyncio.run(scenario())
+    assert (origin.version, origin.remote_invalidations) == (1, 0)
+    assert (other.version, other.remote_invalidations) == (1, 1)
+    assert seen == [True]
+
+def test_load_interrupted_by_invalidation_is_not_cached():
+    async def scenario():
+        cache = CatalogCache()
+
+        async def loader():
+            await cache.invalidate()
+            return "obsoleto"
+
+        await cache.get_or_load("listar", loader)
+        return cache.stats()["size"]
+
+    assert asyncio.run(scenario()) == 0
+
+def test_ttl_expires_entries():
+    async def scenario():
+        cache = CatalogCache(ttl_seconds=0)
+        await cache.get_or_load("listar", lambda: asyncio.sleep(0, "a"))
+        return await cache.get_or_load("listar", lambda: asyncio.sleep(0, "b"))
+
+    assert asyncio.run(scenario()) == "b"
@@ -0,0 +1,24 @@
+from app.services.email_condenser import EmailCondenser
+
+def condense(text: str) -> str:
+    return EmailCondenser(max_tokens=1000, enabled=True).condense(text)["text"]
+
+def test_request_sentence_is_not_a_disclaimer():
+    text = 'Hola,\nEste correo es para reservar el libro "Dune".\nGracias'
+    assert condense(text) == text
+
+def test_legal_disclaimer_is_removed():
+    text = (
+        'Quiero reservar "Dune".\nGracias\n'
+        "Este mensaje es confidencial y va dirigido exclusivamente a su destinatario.\n"
+        "Si lo ha recibido por error, elimínelo."
+    )
+    assert condense(text) == 'Quiero reservar "Dune".\nGracias'
+
+def test_quoted_reply_and_signature_are_removed():
+    text = (
+        'Renovar "Dune", por favor.\n--\nAna\n\n'
+        "El lun, 3 mar 2025 a las 10:00, Biblioteca <biblioteca@example.com> escribió:\n"
+        "> Has reservado el libro"
+    )
+    assert condense(text) == 'Renovar "Dune", por favor.'
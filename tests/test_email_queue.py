@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.db.session import AsyncSessionLocal
+from app.models.email_job import EmailJob, JOB_DONE, JOB_PENDING
+from app.services.email_queue_service import EmailQueueService
+from app.tasks.email_worker import EmailWorker
+
+def mail(message_id, sender, second):
+    return {
+        "id": message_id,
+        "receivedDateTime": f"2024-01-01T00:00:{second:02d}Z",
+        "from": {"emailAddress": {"address": sender}},
+        "body": {"contentType": "text", "content": "Hola"}
+    }
+
+async def enqueue(*emails):
+    async with AsyncSessionLocal() as db:
+        return await EmailQueueService(db).enqueue(list(emails))
+
+async def claim(limit=10, now=None):
+    async with AsyncSessionLocal() as db:
+        return [job["message_id"] for job in await EmailQueueService(db).claim("w", limit, now)]
+
+async def jobs_by_message():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(EmailJob))
+        return {job.message_id: job for job in result.scalars()}
+
+def test_claim_takes_only_the_oldest_unfinished_job_per_sender(database, run):
+    async def scenario():
+        await enqueue(mail("a2", "a@x.com", 2), mail("a1", "A@x.com", 1), mail("b1", "b@x.com", 3))
+        first = await claim()
+        # a2 no es reclamable mientras a1 no termine
+        second = await claim(now=datetime.utcnow() + timedelta(hours=1))
+        async with AsyncSessionLocal() as db:
+            jobs = await jobs_by_message()
+            await EmailQueueService(db).complete([jobs["a1"].id, jobs["b1"].id])
+        third = await claim()
+        return first, second, third
+
+    first, second, third = run(scenario())
+    assert first == ["a1", "b1"]
+    assert "a2" not in second
+    assert third == ["a2"]
+
+def test_enqueue_ignores_messages_already_queued(database, run):
+    async def scenario():
+        return await enqueue(mail("m1", "a@x.com", 1)), await enqueue(mail("m1", "a@x.com", 1), mail("m2", "a@x.com", 2))
+
+    assert run(scenario()) == (1, 1)
+
+def test_retry_keeps_later_jobs_of_the_sender_waiting(database, run):
+    async def scenario():
+        await enqueue(mail("a1", "a@x.com", 1), mail("a2", "a@x.com", 2))
+        async with AsyncSessionLocal() as db:
+            queue = EmailQueueService(db, retry_base_seconds=60)
+            [job] = await queue.claim("w", 10)
+            await queue.retry(job, "fallo")
+        return await claim()
+
+    assert run(scenario()) == []
+
+def record(jobs, results):
+    worker = EmailWorker("w", graph_api=None, openai_client=None)
+    return worker._record_results(jobs, {"status": "success", "results": results})
+
+def processed(message_id, **extra):
+    return {"id": message_id, "processed": True, "status": "success", "message": "ok", **extra}
+
+def test_record_results_completes_only_delivered_jobs(database, run):
+    async def scenario():
+        await enqueue(*(mail(f"m{i}", f"s{i}@x.com", i) for i in range(6)))
+        async with AsyncSessionLocal() as db:
+            jobs = await EmailQueueService(db).claim("w", 10)
+        await record(jobs, [
+            processed("m0", reply_sent=True, marked_read=True),
+            processed("m1", reply_sent=False, marked_read=False, reply_pending=True),
+            processed("m2", error="No se pudo guardar la respuesta pendiente del correo m2"),
+            {"id": "m3", "processed": False, "status": "error", "message": "falló", "error": "falló"},
+            {"id": "m4", "processed": False, "status": "deferred", "message": "OpenAI no disponible"}
+        ])
+        return await jobs_by_message()
+
+    jobs = run(scenario())
+    assert jobs["m0"].status == JOB_DONE
+    for message_id in ("m1", "m2", "m3", "m4", "m5"):
+        assert jobs[message_id].status == JOB_PENDING, message_id
+        assert jobs[message_id].visible_at > datetime.utcnow()
+    assert "pendiente de entrega" in jobs["m1"].last_error
+    # El aplazamiento por el LLM no cuenta como intento
+    assert jobs["m4"].attempts == 0
+    assert jobs["m1"].attempts == 1
+
+def test_record_results_dead_letters_after_max_attempts(database, run):
+    async def scenario():
+        await enqueue(mail("m1", "a@x.com", 1))
+        async with AsyncSessionLocal() as db:
+            queue = EmailQueueService(db, max_attempts=1)
+            [job] = await queue.claim("w", 10)
+            return await queue.retry(job, "fallo")
+
+    assert run(scenario()) == "dead"
@@ -0,0 +1,82 @@
+from sqlalchemy import func, select
+from benchmarks.fakes import FakeGraphAPIService, FakeOpenAIClient
+from app.db.session import AsyncSessionLocal
+from app.models.reservation import Reservation
+from app.schemas.book import BookCreate
+from app.services.book_service import BookService
+from app.services.catalog_cache import catalog_cache
+from app.services.email_processor import EmailProcessor
+from app.services.title_index import title_index
+
+class FlakyGraph(FakeGraphAPIService):
+    """Buzón falso en el que fallan los envíos a fail_send y el marcado de fail_read."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail_send = set()
+        self.fail_read = set()
+
+    async def send_email(self, to, subject, body):
+        if to in self.fail_send:
+            return False
+        return await super().send_email(to, subject, body)
+
+    async def mark_email_as_read(self, email_id):
+        if email_id in self.fail_read:
+            return False
+        return await super().mark_email_as_read(email_id)
+
+    async def send_replies_and_mark_read(self, items):
+        results = []
+        for item in items:
+            sent = await self.send_email(item["to"], item["subject"], item["body"])
+            marked_read = sent and await self.mark_email_as_read(item["email_id"])
+            results.append({"email_id": item["email_id"], "sent": sent, "marked_read": marked_read})
+        return results
+
+def mail(index, title):
+    return {
+        "id": f"m{index}",
+        "receivedDateTime": f"2024-01-01T00:00:0{index}Z",
+        "from": {"emailAddress": {"address": f"lector{index}@x.com"}},
+        "body": {"contentType": "text", "content": f'Quiero reservar el libro "{title}"'}
+    }
+
+async def process(graph):
+    processor = EmailProcessor(graph_api=graph, openai_client=FakeOpenAIClient(latency=0))
+    try:
+        return await processor.process_emails(graph.unread())
+    finally:
+        await processor.close()
+
+async def reservations():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(Reservation.id)))).scalar()
+
+def test_failed_delivery_is_retried_without_repeating_the_action(database, run):
+    async def scenario():
+        title_index.reset()
+        await catalog_cache.invalidate(titles_changed=True)
+        async with AsyncSessionLocal() as db:
+            for title in ("Dune", "Rayuela", "Ficciones"):
+                await BookService(db).create_book(BookCreate(title=title, author="A", isbn=title, publication_year=1960, available=True))
+
+        graph = FlakyGraph()
+        graph.seed([mail(0, "Dune"), mail(1, "Rayuela"), mail(2, "Ficciones")])
+        graph.fail_send = {"lector0@x.com"}
+        graph.fail_read = {"m1"}
+        first = await process(graph)
+        after_first = (await reservations(), len(graph.sent))
+
+        graph.fail_send, graph.fail_read = set(), set()
+        second = await process(graph)
+        return first, after_first, second, await reservations(), graph
+
+    first, after_first, second, reservation_count, graph = run(scenario())
+    assert first["errors"] == [] and first["reply_pending_count"] == 2
+    assert after_first == (3, 2)
+    # Segundo ciclo: m0 recibe su respuesta, m1 solo se marca como leído
+    assert second["reply_pending_count"] == 0
+    assert reservation_count == 3
+    assert sorted(sent["to"] for sent in graph.sent) == ["lector0@x.com", "lector1@x.com", "lector2@x.com"]
+    assert graph.unread() == []
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+from app.db.session import AsyncSessionLocal
+from app.models.email_reply import REPLY_DELIVERED, REPLY_FAILED, REPLY_PENDING
+from app.services.email_reply_service import EmailReplyService
+
+def undelivered(message_id, sent=False):
+    return {
+        "message_id": message_id, "to": "lector@x.com", "subject": "Respuesta", "body": "Reservado",
+        "status": "success", "message": "Reservado", "sent": sent, "marked_read": False, "error": "fallo"
+    }
+
+def test_saved_reply_is_claimed_once_and_delivered(database, run):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            service = EmailReplyService(db)
+            await service.save_pending([undelivered("m1", sent=True)])
+            # Un segundo guardado no sustituye la respuesta ya guardada
+            await service.save_pending([{**undelivered("m1"), "body": "otra"}])
+            not_due = await service.claim()
+            [reply] = await service.claim(message_ids=["m1"])
+            claimed_again = await service.claim(message_ids=["m1"])
+            status = await service.finish(reply, sent=True, marked_read=True)
+            return not_due, reply, claimed_again, status, await service.get_by_message_ids(["m1"])
+
+    not_due, reply, claimed_again, status, saved = run(scenario())
+    assert not_due == []
+    assert (reply["body"], reply["sent"]) == ("Reservado", True)
+    assert claimed_again == []
+    assert status == REPLY_DELIVERED
+    assert saved["m1"]["delivery_status"] == REPLY_DELIVERED
+
+def test_failed_delivery_backs_off_until_max_attempts(database, run):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            service = EmailReplyService(db, max_attempts=3, retry_base_seconds=10)
+            await service.save_pending([undelivered("m1")])
+            statuses = []
+            for _ in range(2):
+                [reply] = await service.claim(now=datetime.utcnow() + timedelta(hours=1))
+                statuses.append(await service.finish(reply, sent=False, marked_read=False, error="fallo"))
+            return statuses
+
+    assert run(scenario()) == [REPLY_PENDING, REPLY_FAILED]
+
+def test_stale_sending_reply_can_be_reclaimed(database, run):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            service = EmailReplyService(db, sending_timeout_seconds=60)
+            await service.save_pending([undelivered("m1")])
+            await service.claim(message_ids=["m1"])
+            return await service.claim(message_ids=["m1"], now=datetime.utcnow() + timedelta(minutes=2))
+
+    assert [reply["message_id"] for reply in run(scenario())] == ["m1"]
@@ -0,0 +1,34 @@
+from app.services.graph_api import GRAPH_BATCH_LIMIT, GraphAPIService
+
+def reply_requests(pairs, leading=0):
+    requests = [{"id": f"solo-{i}"} for i in range(leading)]
+    for i in range(pairs):
+        requests += [{"id": f"send-{i}"}, {"id": f"read-{i}", "dependsOn": [f"send-{i}"]}]
+    return requests
+
+def chunk(requests):
+    return GraphAPIService.__new__(GraphAPIService)._batch_chunks(requests)
+
+def assert_dependencies_in_chunk(chunks):
+    for requests in chunks:
+        ids = {request["id"] for request in requests}
+        for request in requests:
+            assert set(request.get("dependsOn", ())) <= ids, request["id"]
+
+def test_chunks_respect_the_graph_limit_and_keep_order():
+    requests = reply_requests(25)
+    chunks = chunk(requests)
+    assert all(len(requests) <= GRAPH_BATCH_LIMIT for requests in chunks)
+    assert [request for requests in chunks for request in requests] == requests
+    assert_dependencies_in_chunk(chunks)
+
+def test_pair_split_by_the_limit_moves_to_the_next_chunk():
+    # Con una petición suelta delante, send-9 ocupa la posición 20 y read-9 la 21
+    chunks = chunk(reply_requests(15, leading=1))
+    assert [len(requests) for requests in chunks] == [19, 12]
+    assert chunks[1][0]["id"] == "send-9"
+    assert_dependencies_in_chunk(chunks)
+
+def test_independent_requests_fill_whole_chunks():
+    chunks = chunk([{"id": str(i)} for i in range(45)])
+    assert [len(requests) for requests in chunks] == [20, 20, 5]
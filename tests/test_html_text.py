@@ -0,0 +1,29 @@
+from app.services.html_text import extract_text
+
+def test_hidden_paragraph_closed_implicitly_keeps_following_text():
+    html = '<p style="display:none">preheader<p>Quiero reservar Dune</p>'
+    assert extract_text(html, "html", 1000) == "Quiero reservar Dune"
+
+def test_hidden_list_item_closed_implicitly():
+    html = '<ul><li hidden>oculto<li>Renovar Dune</ul>'
+    assert extract_text(html, "html", 1000) == "Renovar Dune"
+
+def test_hidden_cell_ends_with_its_row():
+    html = '<table><tr><td style="display:none">oculto<td>Dune</tr></table><p>Gracias</p>'
+    assert extract_text(html, "html", 1000) == "Dune\nGracias"
+
+def test_hidden_element_hides_nested_content():
+    html = '<div style="display:none"><div>uno</div><p>dos</div><p>Visible</p>'
+    assert extract_text(html, "html", 1000) == "Visible"
+
+def test_hidden_list_item_with_nested_list():
+    html = '<ul><li hidden>oculto<ul><li>a<li>b</ul><li>Visible</ul>'
+    assert extract_text(html, "html", 1000) == "Visible"
+
+def test_unclosed_hidden_span_ends_with_its_parent():
+    html = '<div>Hola<span style="display:none">preheader</div><div>Reservar <b>Dune</b></div>'
+    assert extract_text(html, "html", 1000) == "Hola\nReservar Dune"
+
+def test_hidden_span_keeps_nested_elements_hidden():
+    html = '<div><span hidden><div>oculto</div>sigue oculto</span>Visible</div>'
+    assert extract_text(html, "html", 1000) == "Visible"
@@ -0,0 +1,58 @@
+import asyncio
+from app.services.leader_election import LeaderElector, LocalLeaderLock
+
+class FlakyLock(LocalLeaderLock):
+    """Obtiene el bloqueo y pierde la sesión en el primer latido."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.released = 0
+
+    async def acquire(self) -> bool:
+        self.acquired += 1
+        return True
+
+    async def heartbeat(self) -> None:
+        raise ConnectionError("sesión perdida")
+
+    async def release(self) -> None:
+        self.released += 1
+
+def test_leader_starts_tasks_and_stops_them_on_shutdown():
+    async def scenario():
+        elector = LeaderElector(lock=LocalLeaderLock(), heartbeat_seconds=0.01, retry_seconds=0.01)
+        background = []
+
+        def start_tasks():
+            background.append(asyncio.create_task(asyncio.sleep(3600)))
+            return background
+
+        runner = asyncio.create_task(elector.run(start_tasks))
+        await asyncio.sleep(0.05)
+        was_leader = elector.is_leader
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return was_leader, elector.is_leader, background[0].cancelled()
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+def test_lost_session_demotes_and_cancels_tasks():
+    async def scenario():
+        lock = FlakyLock()
+        elector = LeaderElector(lock=lock, heartbeat_seconds=0.01, retry_seconds=1)
+        started = []
+
+        def start_tasks():
+            started.append(asyncio.create_task(asyncio.sleep(3600)))
+            return started[-1:]
+
+        runner = asyncio.create_task(elector.run(start_tasks))
+        await asyncio.sleep(0.1)
+        state = (elector.is_leader, started[0].cancelled(), lock.released, elector.last_error)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return state
+
+    is_leader, cancelled, released, last_error = asyncio.run(scenario())
+    assert (is_leader, cancelled, released) == (False, True, 1)
+    assert last_error == "sesión perdida"
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from app.core.scheduler import AdaptiveInterval, JobAlreadyRunning, JobNotRegistered, Scheduler
+
+def test_trigger_never_overlaps_a_running_job():
+    async def scenario():
+        scheduler = Scheduler()
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+            return "hecho"
+
+        scheduler.add_job("lento", job, 60)
+        first = asyncio.create_task(scheduler.trigger("lento"))
+        await asyncio.sleep(0)
+        with pytest.raises(JobAlreadyRunning):
+            await scheduler.trigger("lento")
+        release.set()
+        return await first, scheduler.jobs["lento"].status()
+
+    result, status = asyncio.run(scenario())
+    assert result == "hecho"
+    assert (status["runs"], status["skipped_overlaps"], status["running"]) == (1, 1, False)
+
+def test_trigger_unknown_job_raises_job_not_registered():
+    with pytest.raises(JobNotRegistered):
+        asyncio.run(Scheduler().trigger("inexistente"))
+
+def test_failed_run_is_recorded_and_reraised():
+    async def failing():
+        raise RuntimeError("sin conexión")
+
+    scheduler = Scheduler()
+    scheduler.add_job("fallido", failing, 60)
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.trigger("fallido"))
+    assert scheduler.jobs["fallido"].failures == 1
+    assert scheduler.jobs["fallido"].last_error == "sin conexión"
+    assert asyncio.run(scheduler.run_job("fallido")) is True
+
+def test_adaptive_interval_shrinks_with_volume_and_grows_when_idle():
+    interval = AdaptiveInterval(10, 120, initial=30, factor=2, burst_size=10)
+    interval.observe(3)
+    assert interval() == 15
+    interval.observe(0)
+    interval.observe(0)
+    assert interval() == 60
+    interval.observe(None)
+    assert interval() == 60
+    interval.observe(50)
+    assert interval() == 10
+    for _ in range(10):
+        interval.observe(0)
+    assert interval() == 120
@@ -0,0 +1,35 @@
+from app.services.title_index import TitleIndex, normalize_title
+
+def build(*titles):
+    index = TitleIndex()
+    for book_id, title in enumerate(titles, start=1):
+        index.add(book_id, title)
+    return index
+
+def test_normalize_title_drops_accents_punctuation_and_leading_article():
+    assert normalize_title("El Túnel.") == "tunel"
+    assert normalize_title("El") == "el"
+
+def test_exact_key_scores_one():
+    index = build("Cien años de soledad", "Dune")
+    assert index.resolve("cien anos de soledad!") == [(1, "Cien años de soledad", 1.0)]
+
+def test_typo_resolves_above_threshold_and_not_below():
+    index = build("Dune", "Rayuela")
+    [(book_id, title, score)] = index.resolve("Dunes", min_score=0.5)
+    assert (book_id, title) == (1, "Dune") and 0.5 <= score < 1.0
+    assert index.resolve("Dunes", min_score=score + 0.01) == []
+
+def test_min_score_one_never_returns_approximate_titles():
+    index = build("Dune")
+    assert index.resolve("Dunes", min_score=1.0) == []
+
+def test_titles_sharing_a_key_are_all_returned():
+    index = build("Principito", "El Principito", "Dune")
+    assert [book_id for book_id, _, _ in index.resolve("el principito", min_score=1.0)] == [1, 2]
+
+def test_removed_books_are_not_resolved():
+    index = build("Dune", "Rayuela")
+    index.remove(1)
+    assert index.resolve("Dune", min_score=0.3) == []
+    assert len(index) == 1